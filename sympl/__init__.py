@@ -3,11 +3,18 @@ from ._core.base_components import (
     Prognostic, Diagnostic, Implicit, Monitor, PrognosticComposite,
     DiagnosticComposite, MonitorComposite, ImplicitPrognostic
 )
-from ._core.timestepping import TimeStepper, Leapfrog, AdamsBashforth
+from ._core.process_pool import ProcessPrognosticComposite
+from ._core.timestepping import (
+    TimeStepper, Leapfrog, AdamsBashforth, SSPRungeKutta, RK4,
+    AdaptiveRungeKutta, MultiRateTimeStepper, IMEXTimeStepper)
 from ._core.exceptions import (
     InvalidStateError, SharedKeyError, DependencyError,
-    InvalidPropertyDictError)
+    InvalidPropertyDictError, ArrayCopyError)
 from ._core.array import DataArray
+from ._core.state import State, PackedState
+from ._core.model import Model
+from ._core.profiling import (
+    enable_profiling, disable_profiling, profile_registry)
 from ._core.constants import (
     get_constant, set_constant, set_condensible_name, reset_constants)
 from ._core.util import (
@@ -17,13 +24,15 @@ from ._core.util import (
     restore_dimensions, get_numpy_arrays_with_properties,
     restore_data_arrays_with_properties,
     set_direction_names, add_direction_names,
-    get_component_aliases)
+    get_component_aliases, stack_ensemble, unstack_ensemble,
+    get_fingerprint)
 from ._core.wrappers import (
     UpdateFrequencyWrapper, TendencyInDiagnosticsWrapper,
-    TimeDifferencingWrapper, ScalingWrapper)
+    TimeDifferencingWrapper, ScalingWrapper, AsyncMonitorWrapper,
+    ColumnChunkWrapper, MemoizationWrapper)
 from ._core.testing import ComponentTestBase
 from ._components import (
-    PlotFunctionMonitor, NetCDFMonitor, RestartMonitor,
+    PlotFunctionMonitor, NetCDFMonitor, RestartMonitor, CheckpointMonitor,
     ConstantPrognostic, ConstantDiagnostic, RelaxationPrognostic)
 from ._core.time import datetime, timedelta
 
@@ -31,10 +40,13 @@ __version__ = '0.3.1'
 __all__ = (
     Prognostic, Diagnostic, Implicit, Monitor, PrognosticComposite,
     DiagnosticComposite, MonitorComposite, ImplicitPrognostic,
-    TimeStepper, Leapfrog, AdamsBashforth,
+    ProcessPrognosticComposite,
+    TimeStepper, Leapfrog, AdamsBashforth, SSPRungeKutta, RK4,
+    AdaptiveRungeKutta, MultiRateTimeStepper, IMEXTimeStepper, Model,
+    enable_profiling, disable_profiling, profile_registry,
     InvalidStateError, SharedKeyError, DependencyError,
-    InvalidPropertyDictError,
-    DataArray,
+    InvalidPropertyDictError, ArrayCopyError,
+    DataArray, State, PackedState,
     get_constant, set_constant, set_condensible_name, reset_constants,
     UpdateFrequencyWrapper, TimeDifferencingWrapper, combine_dimensions,
     ensure_no_shared_keys,
@@ -42,9 +54,11 @@ __all__ = (
     restore_dimensions, get_numpy_arrays_with_properties,
     restore_data_arrays_with_properties,
     set_direction_names, add_direction_names, get_component_aliases,
-    ScalingWrapper,
+    stack_ensemble, unstack_ensemble, get_fingerprint,
+    ScalingWrapper, AsyncMonitorWrapper, ColumnChunkWrapper,
+    MemoizationWrapper,
     ComponentTestBase,
-    PlotFunctionMonitor, NetCDFMonitor, RestartMonitor,
+    PlotFunctionMonitor, NetCDFMonitor, RestartMonitor, CheckpointMonitor,
     ConstantPrognostic, ConstantDiagnostic, RelaxationPrognostic,
     datetime, timedelta
 )
@@ -1,8 +1,9 @@
 from .netcdf import NetCDFMonitor, RestartMonitor
+from .checkpoint import CheckpointMonitor
 from .plot import PlotFunctionMonitor
 from .basic import ConstantPrognostic, ConstantDiagnostic, RelaxationPrognostic
 
 __all__ = (
     PlotFunctionMonitor,
-    NetCDFMonitor, RestartMonitor,
+    NetCDFMonitor, RestartMonitor, CheckpointMonitor,
     ConstantPrognostic, ConstantDiagnostic, RelaxationPrognostic)
@@ -0,0 +1,105 @@
+from .._core.base_components import Monitor
+from .._core.util import get_component_checkpoint, set_component_checkpoint
+from .util import write_file_atomically
+import pickle
+
+
+class CheckpointMonitor(Monitor):
+    """
+    A :py:class:`~sympl.Monitor` which stores the model state together with
+    the checkpoint state of a list of components, such as TimeSteppers and
+    wrappers, in a single file, and can load that file back to restart the
+    model exactly where it left off.
+
+    Unlike :py:class:`~sympl.RestartMonitor`, which stores only the model
+    state, this keeps the internal history of the components (for example
+    the tendencies from previous timesteps used by
+    :py:class:`~sympl.AdamsBashforth`), so that a restarted run continues
+    with results identical to those of an uninterrupted run instead of
+    spinning up again.
+
+    Example
+    -------
+    This is how a run can be split into several jobs, where time_stepper
+    and prognostic must be constructed the same way in every job.
+
+    >>> checkpoint_monitor = CheckpointMonitor(
+    >>>     'restart.pkl', [time_stepper, prognostic])
+    >>> if os.path.isfile('restart.pkl'):
+    >>>     state = checkpoint_monitor.load()
+    >>> for i in range(n_steps):
+    >>>     diagnostics, state = time_stepper(state, timestep)
+    >>> checkpoint_monitor.store(state)
+    """
+
+    def __init__(self, filename, components):
+        """
+        Args
+        ----
+        filename : str
+            The file to which the checkpoint will be written.
+        components : iterable
+            The objects whose checkpoint state is stored, which should have
+            get_checkpoint_state and set_checkpoint_state methods. Objects
+            without them are skipped.
+        """
+        self._filename = filename
+        self._components = tuple(components)
+
+    def store(self, state):
+        """
+        Write the state and the checkpoint state of the components to the
+        checkpoint file, replacing any existing checkpoint.
+
+        Args
+        ----
+        state : dict
+            A model state dictionary.
+        """
+        checkpoint = {
+            'state': state,
+            'components': [
+                (component.__class__.__name__,
+                 get_component_checkpoint(component))
+                for component in self._components],
+        }
+
+        def write(filename):
+            with open(filename, 'wb') as f:
+                pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        write_file_atomically(self._filename, write)
+
+    def load(self):
+        """
+        Restore the components from the checkpoint file, and load the state
+        from it.
+
+        Returns
+        -------
+        state : dict
+            The model state stored in the checkpoint file.
+
+        Raises
+        ------
+        ValueError
+            If the checkpoint file was written for a different number or
+            different classes of components.
+        """
+        with open(self._filename, 'rb') as f:
+            checkpoint = pickle.load(f)
+        if len(checkpoint['components']) != len(self._components):
+            raise ValueError(
+                'checkpoint file contains {} components, but {} were '
+                'given'.format(
+                    len(checkpoint['components']), len(self._components)))
+        for component, (class_name, _) in zip(
+                self._components, checkpoint['components']):
+            if component.__class__.__name__ != class_name:
+                raise ValueError(
+                    'checkpoint file contains a {} where a {} was '
+                    'given'.format(class_name, component.__class__.__name__))
+        for component, (_, component_checkpoint) in zip(
+                self._components, checkpoint['components']):
+            set_component_checkpoint(component, component_checkpoint)
+        return checkpoint['state']
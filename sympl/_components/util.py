@@ -0,0 +1,32 @@
+import os
+
+
+def write_file_atomically(filename, write_function):
+    """
+    Writes a file by calling write_function with the name of a new file, and
+    then replacing any existing file with that name by the new file, so that
+    a write which is interrupted does not leave a partial file behind.
+
+    Args
+    ----
+    filename : str
+        The file to write.
+    write_function : callable
+        A function taking a filename, which writes the contents of the file
+        to that filename.
+
+    Raises
+    ------
+    IOError
+        If the new file, named filename with '.new' appended, already exists.
+    """
+    new_filename = filename + '.new'
+    if os.path.isfile(new_filename):
+        raise IOError('Filename {} already exists'.format(new_filename))
+    write_function(new_filename)
+
+    if os.path.isfile(filename):
+        os.rename(filename, filename + '.old')
+    os.rename(new_filename, filename)
+    if os.path.isfile(filename + '.old'):
+        os.remove(filename + '.old')
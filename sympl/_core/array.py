@@ -1,6 +1,5 @@
 from .units import data_array_to_units as to_units_function
 import xarray as xr
-from pint.errors import DimensionalityError
 
 
 class DataArray(xr.DataArray):
@@ -19,7 +18,7 @@ class DataArray(xr.DataArray):
         result.attrs = self.attrs
         return result
 
-    def to_units(self, units):
+    def to_units(self, units, inplace=False, out=None):
         """
         Convert the units of this DataArray, if necessary. No conversion is
         performed if the units are the same as the units of this DataArray.
@@ -30,11 +29,25 @@ class DataArray(xr.DataArray):
         ----
         units : str
             The desired units.
+        inplace : bool, optional
+            If True, the data of this DataArray is rescaled in its existing
+            buffer and its "units" attribute is updated, instead of
+            allocating a new array. Default is False.
+        out : DataArray, optional
+            A DataArray with the same dimensions and shape as this one, into
+            which the converted data is written. Its attrs are replaced by the
+            attrs of this object with updated "units". Cannot be given if
+            inplace is True.
 
         Raises
         ------
         ValueError
-            If the units are invalid for this object.
+            If the units are invalid for this object, or if out does not have
+            the same dimensions and shape as this object.
+        TypeError
+            If the converted data cannot be stored in the dtype of the
+            output array, for example when converting an integer array
+            in-place to units that require scaling by a non-integer factor.
         KeyError
             If this object does not have units information in its attrs.
 
@@ -42,11 +55,9 @@ class DataArray(xr.DataArray):
         -------
         converted_data : DataArray
             A DataArray containing the data from this object in the
-            desired units, if possible.
+            desired units, if possible. This is this object if inplace is
+            True, or out if it is given.
         """
         if 'units' not in self.attrs:
             raise KeyError('"units" not present in attrs')
-        try:
-            return to_units_function(self, units)
-        except DimensionalityError as err:
-            raise ValueError(str(err))
+        return to_units_function(self, units, inplace=inplace, out=out)
@@ -1,5 +1,9 @@
 import abc
-from .util import ensure_no_shared_keys, update_dict_by_adding_another
+import threading
+from multiprocessing.pool import ThreadPool
+from .util import (
+    ensure_no_shared_keys, update_dict_by_adding_another,
+    get_component_checkpoint, set_component_checkpoint, get_fingerprint)
 from .exceptions import SharedKeyError
 
 
@@ -424,18 +428,38 @@ class ComponentComposite(object):
             self.__class__,
             ',\n'.join(repr(component) for component in self._components))
 
-    def __init__(self, *args):
+    def __init__(self, *args, **kwargs):
         """
         Args
         ----
         *args
             The components that should be wrapped by this object.
+        n_threads : int, optional
+            If greater than 1, the components are called in parallel on a
+            pool of this many threads, which is faster for components that
+            release the GIL (as most numpy and compiled code does). The
+            components must not modify the state or depend on each other's
+            outputs. Their outputs are combined in the same order as when
+            they are called one after another, so the results are identical.
+            Default is 1.
 
         Raises
         ------
         SharedKeyError
             If two components compute the same diagnostic quantity.
+        ValueError
+            If n_threads is less than 1.
         """
+        n_threads = kwargs.pop('n_threads', 1)
+        if len(kwargs) > 0:
+            raise TypeError(
+                'unexpected keyword arguments: {}'.format(
+                    ', '.join(kwargs.keys())))
+        if n_threads < 1:
+            raise ValueError('n_threads must be at least 1')
+        self._n_threads = n_threads
+        self._pool = None
+        self._pool_lock = threading.Lock()
         if self.component_class is not None:
             ensure_components_have_class(args, self.component_class)
         self._components = args
@@ -446,6 +470,81 @@ class ComponentComposite(object):
                     'Two components in a composite should not compute '
                     'the same diagnostic')
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __getstate__(self):
+        # the thread pool and its lock cannot be pickled or copied, and are
+        # created again when needed
+        state = self.__dict__.copy()
+        state['_pool'] = None
+        del state['_pool_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._pool_lock = threading.Lock()
+
+    def close(self):
+        """
+        Stops the threads used to call the components in parallel. They are
+        started again if the composite is called afterwards.
+        """
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    def get_checkpoint_state(self):
+        """
+        Returns a dictionary containing the checkpoint state of each wrapped
+        component which supports checkpointing.
+        """
+        return {
+            'components': [
+                get_component_checkpoint(component)
+                for component in self._components]}
+
+    def set_checkpoint_state(self, checkpoint):
+        """
+        Restores the wrapped components from a dictionary returned by
+        get_checkpoint_state.
+
+        Raises
+        ------
+        ValueError
+            If the checkpoint is for a different number of components.
+        """
+        if len(checkpoint['components']) != len(self._components):
+            raise ValueError(
+                'checkpoint is for {} components, but this composite has '
+                '{}'.format(
+                    len(checkpoint['components']), len(self._components)))
+        for component, component_checkpoint in zip(
+                self._components, checkpoint['components']):
+            set_component_checkpoint(component, component_checkpoint)
+
+    def _call_components_in_parallel(self, components, *args):
+        """
+        Calls each of the given components with the given arguments on the
+        thread pool, returning a list of their outputs in the order of the
+        components.
+        """
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPool(
+                    min(self._n_threads, len(self._components)))
+            pool = self._pool
+        return pool.map(lambda component: component(*args), components)
+
+    @property
+    def _parallel(self):
+        return self._n_threads > 1 and len(self._components) > 1
+
     def _combine_attribute(self, attr):
         return_attr = []
         for component in self._components:
@@ -453,6 +552,45 @@ class ComponentComposite(object):
         return tuple(set(return_attr))  # set to deduplicate
 
 
+def get_dependency_levels(dependencies, names):
+    """
+    Sorts components into levels, such that each component depends only on
+    components in earlier levels.
+
+    Args
+    ----
+    dependencies : list of set of int
+        The indices of the components on which each component depends.
+    names : list of str
+        The name of each component, used in error messages.
+
+    Returns
+    -------
+    levels : list of list of int
+        The indices of the components in each level, in increasing order.
+
+    Raises
+    ------
+    ValueError
+        If the dependencies contain a cycle.
+    """
+    levels = []
+    sorted_indices = set()
+    while len(sorted_indices) < len(dependencies):
+        level = [
+            i for i in range(len(dependencies))
+            if i not in sorted_indices and dependencies[i] <= sorted_indices]
+        if len(level) == 0:
+            raise ValueError(
+                'The inputs and diagnostics of {} depend on each other in a '
+                'cycle'.format(', '.join(
+                    names[i] for i in range(len(dependencies))
+                    if i not in sorted_indices)))
+        levels.append(level)
+        sorted_indices.update(level)
+    return levels
+
+
 def ensure_components_have_class(components, component_class):
     for component in components:
         for attr in ('input_properties', 'output_properties',
@@ -514,8 +652,12 @@ class PrognosticComposite(ComponentComposite):
         """
         return_tendencies = {}
         return_diagnostics = {}
-        for prognostic in self._components:
-            tendencies, diagnostics = prognostic(state)
+        if self._parallel:
+            outputs = self._call_components_in_parallel(
+                self._components, state)
+        else:
+            outputs = (prognostic(state) for prognostic in self._components)
+        for tendencies, diagnostics in outputs:
             update_dict_by_adding_another(return_tendencies, tendencies)
             return_diagnostics.update(diagnostics)
         return return_tendencies, return_diagnostics
@@ -535,6 +677,11 @@ class PrognosticComposite(ComponentComposite):
 
 class DiagnosticComposite(ComponentComposite):
     """
+    Calls Diagnostic components in order of their dependencies, so that a
+    component whose inputs include diagnostics computed by other components
+    of the composite is called after them, and is given their diagnostics
+    along with the state.
+
     Attributes
     ----------
     inputs : tuple of str
@@ -545,6 +692,55 @@ class DiagnosticComposite(ComponentComposite):
 
     component_class = Diagnostic
 
+    def __init__(self, *args, **kwargs):
+        """
+        Args
+        ----
+        *args
+            The components that should be wrapped by this object.
+        n_threads : int, optional
+            If greater than 1, components which do not depend on each other
+            are called in parallel on a pool of this many threads. See
+            :py:class:`~sympl.PrognosticComposite`. Default is 1.
+        skip_unchanged : bool, optional
+            If True, a component is only called again if one of the inputs
+            in its input_properties has changed since it was last called,
+            and otherwise its previous diagnostics are returned again.
+            Changes are found using the versions of a
+            :py:class:`~sympl.State`, or a checksum of the data for other
+            dictionaries. Components without input_properties are always
+            called. Default is False.
+
+        Raises
+        ------
+        SharedKeyError
+            If two components compute the same diagnostic quantity.
+        ValueError
+            If n_threads is less than 1, or the components depend on each
+            other in a cycle.
+        """
+        self._skip_unchanged = kwargs.pop('skip_unchanged', False)
+        super(DiagnosticComposite, self).__init__(*args, **kwargs)
+        producers = {}
+        for i, component in enumerate(self._components):
+            for name in component.diagnostics:
+                producers[name] = i
+        # for each input of each component, the index of the component in
+        # this composite which computes it, or None if it is from the state
+        self._input_producers = []
+        for i, component in enumerate(self._components):
+            self._input_producers.append([
+                (name, producers[name] if producers.get(name, i) != i
+                 else None) for name in component.inputs])
+        self._levels = get_dependency_levels(
+            [set(producer for _, producer in input_producers
+                 if producer is not None)
+             for input_producers in self._input_producers],
+            [component.__class__.__name__ for component in self._components])
+        self._call_counts = [0]*len(self._components)
+        self._last_signatures = [None]*len(self._components)
+        self._last_diagnostics = [None]*len(self._components)
+
     def __call__(self, state):
         """
         Gets diagnostics from the passed model state.
@@ -572,13 +768,62 @@ class DiagnosticComposite(ComponentComposite):
             If state is not a valid input for a Diagnostic instance.
         """
         return_diagnostics = {}
-        for diagnostic_component in self._components:
-            diagnostics = diagnostic_component(state)
-            # ensure two diagnostics don't compute the same quantity
-            ensure_no_shared_keys(return_diagnostics, diagnostics)
-            return_diagnostics.update(diagnostics)
+        input_state = state
+        for level in self._levels:
+            if len(return_diagnostics) > 0:
+                # components in later levels need the diagnostics computed
+                # by earlier levels
+                input_state = dict(state)
+                input_state.update(return_diagnostics)
+            signatures = [
+                self._get_input_signature(i, state) for i in level]
+            stale_indices = [
+                i for i, signature in zip(level, signatures)
+                if signature is None or
+                signature != self._last_signatures[i]]
+            stale_components = [self._components[i] for i in stale_indices]
+            if self._parallel and len(stale_components) > 1:
+                outputs = self._call_components_in_parallel(
+                    stale_components, input_state)
+            else:
+                outputs = [
+                    diagnostic_component(input_state)
+                    for diagnostic_component in stale_components]
+            for i, diagnostics in zip(stale_indices, outputs):
+                self._call_counts[i] += 1
+                if self._skip_unchanged:
+                    self._last_diagnostics[i] = diagnostics
+            for i, signature in zip(level, signatures):
+                if i in stale_indices:
+                    diagnostics = outputs[stale_indices.index(i)]
+                    self._last_signatures[i] = signature
+                else:
+                    diagnostics = self._last_diagnostics[i]
+                # ensure two diagnostics don't compute the same quantity
+                ensure_no_shared_keys(return_diagnostics, diagnostics)
+                return_diagnostics.update(diagnostics)
         return return_diagnostics
 
+    def _get_input_signature(self, index, state):
+        """
+        Returns a tuple which changes whenever an input of the component
+        with the given index changes, or None if the component must be
+        called.
+        """
+        if (not self._skip_unchanged or
+                len(self._input_producers[index]) == 0):
+            return None
+        signature = []
+        for name, producer in self._input_producers[index]:
+            if producer is None:
+                signature.append(get_fingerprint(state, name))
+            else:
+                # the diagnostics of a component change only when it is
+                # called
+                signature.append(
+                    ('call', producer, self._call_counts[producer]))
+        return tuple(signature)
+
     @property
     def inputs(self):
         return self._combine_attribute('inputs')
@@ -592,6 +837,23 @@ class MonitorComposite(ComponentComposite):
 
     component_class = Monitor
 
+    def __init__(self, *args, **kwargs):
+        """
+        Args
+        ----
+        *args
+            The components that should be wrapped by this object.
+
+        Raises
+        ------
+        TypeError
+            If n_threads is given, as Monitors are always called one after
+            another.
+        """
+        if 'n_threads' in kwargs:
+            raise TypeError('MonitorComposite does not accept n_threads')
+        super(MonitorComposite, self).__init__(*args, **kwargs)
+
     def store(self, state):
         """
         Stores the given state in the Monitor and performs class-specific
@@ -0,0 +1,134 @@
+from collections import OrderedDict
+import threading
+
+
+class PlanCache(object):
+    """
+    A bounded least-recently-used cache of precomputed plans, such as unit
+    conversion factors or array transformation recipes, which keeps count of
+    its hits and misses.
+
+    Attributes
+    ----------
+    hits : int
+        The number of lookups which found an existing plan.
+    misses : int
+        The number of lookups which had to create a new plan.
+    memory : int
+        The total size of the stored plans, as given by get_size, or 0 if
+        get_size was not given.
+    """
+
+    def __init__(self, maxsize=256, max_memory=None, get_size=None):
+        """
+        Args
+        ----
+        maxsize : int, optional
+            The maximum number of plans to store. The least recently used
+            plan is discarded when this is exceeded. If 0, no plans are stored.
+            Default is 256.
+        max_memory : int, optional
+            The maximum total size of the stored plans, as given by
+            get_size. Least recently used plans are discarded when this is
+            exceeded, and a plan larger than this is not stored. By default
+            there is no limit.
+        get_size : callable, optional
+            A function which returns the size of a plan, usually in bytes.
+            Required if max_memory is given.
+
+        Raises
+        ------
+        ValueError
+            If max_memory is given without get_size.
+        """
+        if max_memory is not None and get_size is None:
+            raise ValueError('get_size must be given to use max_memory')
+        self._plans = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self._get_size = get_size
+        self._max_memory = max_memory
+        self._maxsize = None
+        self.memory = 0
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def maxsize(self):
+        return self._maxsize
+
+    @maxsize.setter
+    def maxsize(self, value):
+        if value < 0:
+            raise ValueError('maxsize must be non-negative')
+        with self._lock:
+            self._maxsize = value
+            self._trim()
+
+    def __len__(self):
+        return len(self._plans)
+
+    def __contains__(self, key):
+        return key in self._plans
+
+    def get(self, key, create_plan, *args):
+        """
+        Returns the plan stored under key, calling create_plan(*args) to
+        create and store it if it is not already present. Exceptions raised
+        by create_plan are propagated and nothing is stored.
+        """
+        with self._lock:
+            if key in self._plans:
+                self.hits += 1
+                plan = self._plans.pop(key)
+                self._plans[key] = plan  # mark as most recently used
+                return plan
+            self.misses += 1
+        plan = create_plan(*args)
+        if self._get_size is None:
+            size = 0
+        else:
+            size = self._get_size(plan)
+        if self._max_memory is not None and size > self._max_memory:
+            # storing it would discard every other plan, and then itself
+            return plan
+        with self._lock:
+            if key in self._plans:  # stored by another thread meanwhile
+                self._remove(key)
+            self._plans[key] = plan
+            self._sizes[key] = size
+            self.memory += size
+            self._trim()
+        return plan
+
+    def clear(self):
+        """Removes all stored plans and resets the hit and miss counters."""
+        with self._lock:
+            self._plans.clear()
+            self._sizes.clear()
+            self.memory = 0
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        """
+        Returns a dictionary with the number of hits and misses, the
+        maximum size and the current size of the cache.
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'maxsize': self._maxsize,
+            'currsize': len(self._plans),
+        }
+
+    def _remove(self, key):
+        del self._plans[key]
+        self.memory -= self._sizes.pop(key)
+
+    def _trim(self):
+        while len(self._plans) > self._maxsize or (
+                self._max_memory is not None and
+                self.memory > self._max_memory):
+            self._remove(next(iter(self._plans)))
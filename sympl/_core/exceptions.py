@@ -12,3 +12,7 @@ class SharedKeyError(Exception):
 
 class DependencyError(Exception):
     pass
+
+
+class ArrayCopyError(InvalidStateError):
+    pass
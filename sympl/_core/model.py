@@ -0,0 +1,208 @@
+from datetime import timedelta
+from timeit import default_timer
+from .base_components import DiagnosticComposite
+
+
+class Model(object):
+    """
+    Runs the main loop of a model, which at each timestep computes
+    diagnostics, steps the state forward with a TimeStepper, stores the
+    complete state in any Monitors due to be called, and advances the time.
+
+    The state returned by the TimeStepper is used directly as the state of
+    the next timestep, and diagnostics are added to the current state
+    in-place, so the loop makes no copies of the state beyond those made by
+    the components themselves.
+
+    Attributes
+    ----------
+    step_count : int
+        The number of timesteps taken by this Model.
+    timings : dict
+        The total time in seconds spent in each stage of the loop, with keys
+        'diagnostics', 'time_stepper' and 'monitors'.
+    last_state : dict or None
+        The state at the end of the last completed run.
+
+    Example
+    -------
+    This is how a model might be run for a day, writing output every hour
+    and plotting every 10 timesteps.
+
+    >>> model = Model(
+    >>>     AdamsBashforth([Radiation(), Convection()]),
+    >>>     timedelta(minutes=10),
+    >>>     diagnostic_list=[CloudFraction()],
+    >>>     monitors=[(netcdf_monitor, timedelta(hours=1)),
+    >>>               (plot_monitor, 10)])
+    >>> state = model.run(state, end_time=state['time'] + timedelta(days=1))
+    """
+
+    def __init__(
+            self, time_stepper, timestep, diagnostic_list=(), monitors=()):
+        """
+        Args
+        ----
+        time_stepper : TimeStepper or Implicit
+            The object used to step the state forward, which is called with
+            the state and the timestep.
+        timestep : timedelta
+            The amount of time to step forward each timestep.
+        diagnostic_list : iterable of Diagnostic, optional
+            Objects whose diagnostics are added to the state at the start
+            of each timestep.
+        monitors : iterable, optional
+            The Monitors in which to store the state. Each item is either a
+            Monitor, which stores every timestep, or a (Monitor, cadence)
+            pair, where cadence is either a number of timesteps or a
+            timedelta giving how often the Monitor stores the state.
+
+        Raises
+        ------
+        ValueError
+            If a cadence is not a positive integer or timedelta.
+        """
+        self._time_stepper = time_stepper
+        self._timestep = timestep
+        self._diagnostic = DiagnosticComposite(*diagnostic_list)
+        self._monitors = []
+        for item in monitors:
+            if isinstance(item, tuple):
+                monitor, cadence = item
+            else:
+                monitor, cadence = item, 1
+            if isinstance(cadence, timedelta):
+                if cadence <= timedelta(0):
+                    raise ValueError('monitor cadence must be positive')
+            elif not isinstance(cadence, int) or cadence < 1:
+                raise ValueError(
+                    'monitor cadence must be a positive integer number of '
+                    'timesteps or a timedelta, got {}'.format(cadence))
+            self._monitors.append(MonitorSchedule(monitor, cadence))
+        self.step_count = 0
+        self.last_state = None
+        self.timings = {}
+        self.reset_timings()
+
+    def reset_timings(self):
+        """Sets the time spent in each stage of the loop to zero."""
+        self.timings = {
+            'diagnostics': 0., 'time_stepper': 0., 'monitors': 0.}
+
+    def iterate(self, state, n_steps=None, end_time=None):
+        """
+        Runs the model, yielding the state of each timestep once its
+        diagnostics have been computed and it has been stored in any
+        Monitors due to be called.
+
+        Exactly one of n_steps and end_time must be given.
+
+        Args
+        ----
+        state : dict
+            The initial model state, which must contain 'time'. Diagnostics
+            are added to it in-place.
+        n_steps : int, optional
+            The number of timesteps to take.
+        end_time : datetime or timedelta, optional
+            The time at which to stop. Timesteps are taken as long as the
+            time of the state is before end_time.
+
+        Yields
+        ------
+        state : dict
+            The complete model state at each timestep before it is stepped
+            forward. Once the generator is exhausted, the state at the end
+            of the run is stored in the last_state attribute.
+
+        Raises
+        ------
+        ValueError
+            If not exactly one of n_steps and end_time is given.
+        """
+        if (n_steps is None) == (end_time is None):
+            raise ValueError('exactly one of n_steps or end_time must be given')
+        # the loop is in a separate generator so that arguments are checked
+        # when iterate is called rather than when iteration starts
+        return self._iterate(state, n_steps, end_time)
+
+    def _iterate(self, state, n_steps, end_time):
+        i = 0
+        while ((n_steps is not None and i < n_steps) or
+               (end_time is not None and state['time'] < end_time)):
+            start = default_timer()
+            state.update(self._diagnostic(state))
+            after_diagnostics = default_timer()
+            diagnostics, next_state = self._time_stepper(
+                state, self._timestep)
+            state.update(diagnostics)
+            after_time_stepper = default_timer()
+            for schedule in self._monitors:
+                schedule.store_if_due(state, self.step_count)
+            end = default_timer()
+            self.timings['diagnostics'] += after_diagnostics - start
+            self.timings['time_stepper'] += (
+                after_time_stepper - after_diagnostics)
+            self.timings['monitors'] += end - after_time_stepper
+            yield state
+            next_state['time'] = state['time'] + self._timestep
+            state = next_state
+            self.step_count += 1
+            i += 1
+        self.last_state = state
+
+    def run(self, state, n_steps=None, end_time=None):
+        """
+        Runs the model, returning the state at the end of the run.
+
+        Exactly one of n_steps and end_time must be given.
+
+        Args
+        ----
+        state : dict
+            The initial model state, which must contain 'time'. Diagnostics
+            are added to it in-place.
+        n_steps : int, optional
+            The number of timesteps to take.
+        end_time : datetime or timedelta, optional
+            The time at which to stop. Timesteps are taken as long as the
+            time of the state is before end_time.
+
+        Returns
+        -------
+        state : dict
+            The model state at the end of the run, without diagnostics.
+
+        Raises
+        ------
+        ValueError
+            If not exactly one of n_steps and end_time is given.
+        """
+        for _ in self.iterate(state, n_steps=n_steps, end_time=end_time):
+            pass
+        return self.last_state
+
+
+class MonitorSchedule(object):
+    """
+    Stores the state in a Monitor every given number of timesteps, or
+    whenever a given amount of model time has passed since it last did.
+    """
+
+    def __init__(self, monitor, cadence):
+        self.monitor = monitor
+        self.cadence = cadence
+        self.next_store_time = None
+
+    def store_if_due(self, state, step_count):
+        if isinstance(self.cadence, timedelta):
+            if self.next_store_time is None:
+                self.monitor.store(state)
+                self.next_store_time = state['time'] + self.cadence
+            elif state['time'] >= self.next_store_time:
+                self.monitor.store(state)
+                # keep to multiples of the cadence from the first store
+                while self.next_store_time <= state['time']:
+                    self.next_store_time += self.cadence
+        elif step_count % self.cadence == 0:
+            self.monitor.store(state)
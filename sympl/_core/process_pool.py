@@ -0,0 +1,431 @@
+import multiprocessing
+import pickle
+import traceback
+from collections import namedtuple
+import numpy as np
+from .array import DataArray
+from .base_components import PrognosticComposite
+from .exceptions import DependencyError
+from .util import (
+    update_dict_by_adding_another, get_component_checkpoint,
+    set_component_checkpoint)
+
+# imported when a ProcessPrognosticComposite is created, as it was only
+# added in Python 3.8
+shared_memory = None
+
+# describes a DataArray whose data is held in a shared memory segment
+SharedDataArray = namedtuple(
+    'SharedDataArray', ['segment_name', 'shape', 'dtype', 'dims', 'coords',
+                        'attrs'])
+
+
+class ProcessPrognosticComposite(PrognosticComposite):
+    """
+    A :py:class:`~sympl.PrognosticComposite` which calls its components in
+    parallel in separate worker processes, for components which hold the
+    GIL (such as pure Python code) and so are not faster when called on
+    threads.
+
+    Each worker process hosts a fixed subset of the components for as long
+    as the composite is open, so components keep any internal state between
+    calls. On every call, the numerical arrays of the state which are in
+    the inputs of the components are copied into shared memory segments
+    which the workers read directly, and other arrays of the state are not
+    passed to the workers. The tendencies and diagnostics are returned
+    through shared memory segments created by the workers, so only small
+    descriptions of the arrays are pickled on each call. Tendencies are
+    summed in the order the components were given, so the results are
+    identical to those of a PrognosticComposite.
+
+    The components are pickled when the worker processes are started. In
+    the worker processes, input arrays are read-only and are overwritten on
+    the next call, so components should not keep references to them.
+
+    Example
+    -------
+    The composite should be closed when it is no longer needed, to stop the
+    worker processes and free the shared memory.
+
+    >>> with ProcessPrognosticComposite(
+    >>>         Radiation(), Convection(), n_processes=2) as prognostic:
+    >>>     time_stepper = AdamsBashforth(prognostic)
+    >>>     for i in range(n_steps):
+    >>>         diagnostics, state = time_stepper(state, timestep)
+    """
+
+    def __init__(self, *args, **kwargs):
+        """
+        Args
+        ----
+        *args
+            The components that should be wrapped by this object.
+        n_processes : int, optional
+            The number of worker processes. Default is one process for
+            each component.
+
+        Raises
+        ------
+        DependencyError
+            If multiprocessing.shared_memory is not available, which
+            requires Python 3.8 or later.
+        SharedKeyError
+            If two components compute the same diagnostic quantity.
+        ValueError
+            If n_processes is less than 1.
+        """
+        import_shared_memory()
+        n_processes = kwargs.pop('n_processes', None)
+        if len(kwargs) > 0:
+            raise TypeError(
+                'unexpected keyword arguments: {}'.format(
+                    ', '.join(kwargs.keys())))
+        super(ProcessPrognosticComposite, self).__init__(*args)
+        if n_processes is None:
+            n_processes = len(self._components)
+        elif n_processes < 1:
+            raise ValueError('n_processes must be at least 1')
+        self._n_processes = min(n_processes, len(self._components))
+        self._input_names = frozenset(self.inputs)
+        self._state_segments = SharedSegmentPool()
+        self._attached_segments = AttachedSegments()
+        self._connections = []
+        self._processes = []
+        for i in range(self._n_processes):
+            connection, worker_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=run_worker,
+                args=(worker_connection,
+                      self._components[i::self._n_processes]))
+            process.daemon = True
+            process.start()
+            worker_connection.close()
+            self._connections.append(connection)
+            self._processes.append(process)
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __call__(self, state):
+        """
+        Gets tendencies and diagnostics from the passed model state.
+
+        Args
+        ----
+        state : dict
+            A model state dictionary.
+
+        Returns
+        -------
+        tendencies : dict
+            A dictionary whose keys are strings indicating
+            state quantities and values are the time derivative of those
+            quantities in units/second at the time of the input state.
+        diagnostics : dict
+            A dictionary whose keys are strings indicating
+            state quantities and values are the value of those quantities
+            at the time of the input state.
+
+        Raises
+        ------
+        RuntimeError
+            If the composite has been closed.
+        """
+        self._ensure_open()
+        state_description = share_dict(
+            self._state_segments, (), state, names=self._input_names)
+        outputs = self._run_on_workers(
+            [('call', state_description)]*self._n_processes)
+        return_tendencies = {}
+        return_diagnostics = {}
+        for tendency_description, diagnostic_description in outputs:
+            tendencies = read_dict(
+                self._attached_segments, tendency_description, copy=False)
+            for key, value in tendencies.items():
+                # the first tendency of each quantity is summed into, so it
+                # must not be left in memory the worker will write to
+                if key not in return_tendencies:
+                    tendencies[key] = value.copy()
+            update_dict_by_adding_another(return_tendencies, tendencies)
+            return_diagnostics.update(read_dict(
+                self._attached_segments, diagnostic_description, copy=True))
+        self._attached_segments.close_unused()
+        return return_tendencies, return_diagnostics
+
+    def get_checkpoint_state(self):
+        """
+        Returns a dictionary containing the checkpoint state of each wrapped
+        component which supports checkpointing, retrieved from the worker
+        processes.
+        """
+        return {'components': self._run_on_workers(
+            [('get_checkpoint_state', None)]*self._n_processes)}
+
+    def set_checkpoint_state(self, checkpoint):
+        """
+        Restores the wrapped components in the worker processes from a
+        dictionary returned by get_checkpoint_state.
+
+        Raises
+        ------
+        ValueError
+            If the checkpoint is for a different number of components.
+        """
+        if len(checkpoint['components']) != len(self._components):
+            raise ValueError(
+                'checkpoint is for {} components, but this composite has '
+                '{}'.format(
+                    len(checkpoint['components']), len(self._components)))
+        self._run_on_workers([
+            ('set_checkpoint_state',
+             checkpoint['components'][i::self._n_processes])
+            for i in range(self._n_processes)])
+
+    def close(self):
+        """
+        Stops the worker processes and frees the shared memory used by this
+        composite. Calling close more than once has no further effect.
+        """
+        if not self._closed:
+            self._closed = True
+            for connection in self._connections:
+                connection.send(None)  # tells the worker to stop
+            for process, connection in zip(
+                    self._processes, self._connections):
+                process.join()
+                connection.close()
+            self._attached_segments.close()
+            self._state_segments.close()
+
+    def _ensure_open(self):
+        if self._closed:
+            raise RuntimeError(
+                'Cannot use a ProcessPrognosticComposite after it is closed')
+
+    def _run_on_workers(self, messages):
+        """
+        Sends one message to each worker, and returns the list of results
+        for each component in the order of the components.
+        """
+        self._ensure_open()
+        for connection, message in zip(self._connections, messages):
+            connection.send(message)
+        # every reply is received before raising, so that no replies are
+        # left waiting to be mistaken for those of the next message
+        replies = [connection.recv() for connection in self._connections]
+        results = [None]*len(self._components)
+        for i, (status, result) in enumerate(replies):
+            if status == 'error':
+                raise result
+            results[i::self._n_processes] = result
+        return results
+
+
+def import_shared_memory():
+    global shared_memory
+    try:
+        from multiprocessing import shared_memory
+    except ImportError:
+        raise DependencyError(
+            'ProcessPrognosticComposite requires '
+            'multiprocessing.shared_memory, which was added in Python 3.8')
+
+
+def run_worker(connection, components):
+    """
+    Runs the loop of a worker process of a ProcessPrognosticComposite, which
+    performs the actions sent through the connection on its components until
+    it receives None.
+    """
+    # needed when the worker process is spawned rather than forked
+    import_shared_memory()
+    attached_segments = AttachedSegments()
+    output_segments = SharedSegmentPool()
+    try:
+        while True:
+            message = connection.recv()
+            if message is None:
+                break
+            action, argument = message
+            try:
+                if action == 'call':
+                    state = read_dict(
+                        attached_segments, argument, copy=False,
+                        writeable=False)
+                    result = []
+                    for i, component in enumerate(components):
+                        tendencies, diagnostics = component(state)
+                        result.append((
+                            share_dict(
+                                output_segments, (i, 'tendencies'),
+                                tendencies),
+                            share_dict(
+                                output_segments, (i, 'diagnostics'),
+                                diagnostics)))
+                    del state
+                    attached_segments.close_unused()
+                elif action == 'get_checkpoint_state':
+                    result = [
+                        get_component_checkpoint(component)
+                        for component in components]
+                else:
+                    for component, checkpoint in zip(components, argument):
+                        set_component_checkpoint(component, checkpoint)
+                    result = [None]*len(components)
+                connection.send(('ok', result))
+            except Exception as err:
+                connection.send(('error', get_picklable_error(err)))
+    finally:
+        attached_segments.close()
+        output_segments.close()
+        connection.close()
+
+
+def get_picklable_error(err):
+    try:
+        pickle.dumps(err)
+        return err
+    except Exception:
+        return RuntimeError(
+            'Exception raised in worker process:\n{}'.format(
+                traceback.format_exc()))
+
+
+def share_dict(segment_pool, prefix, dictionary, names=None):
+    """
+    Returns a picklable description of a dictionary, in which DataArrays with
+    numerical data are replaced by SharedDataArray descriptions of copies of
+    them in shared memory segments from segment_pool. The segment for each
+    key is reused on later calls with the same prefix. If names is given,
+    such DataArrays whose keys are not in names are left out.
+    """
+    description = {}
+    for key, value in dictionary.items():
+        if isinstance(value, DataArray) and value.dtype.kind in 'biufc':
+            if names is not None and key not in names:
+                continue
+            if len(value.coords) > 0:
+                coords = {
+                    name: coord.variable for name, coord in
+                    value.coords.items()}
+            else:
+                coords = None
+            description[key] = SharedDataArray(
+                segment_pool.write(prefix + (key,), value.values),
+                value.shape, value.dtype, value.dims, coords,
+                value.attrs)
+        else:
+            description[key] = value
+    return description
+
+
+def read_dict(attached_segments, description, copy, writeable=True):
+    """
+    Returns the dictionary described by a description from share_dict. If
+    copy is False, the DataArrays are views of the shared memory, which are
+    read-only if writeable is False.
+    """
+    dictionary = {}
+    for key, value in description.items():
+        if isinstance(value, SharedDataArray):
+            array = np.ndarray(
+                value.shape, value.dtype,
+                buffer=attached_segments.get(value.segment_name).buf)
+            if copy:
+                array = array.copy()
+            elif not writeable:
+                array.flags.writeable = False
+            dictionary[key] = DataArray(
+                array, dims=value.dims, coords=value.coords,
+                attrs=dict(value.attrs))
+        else:
+            dictionary[key] = value
+    return dictionary
+
+
+def close_segment(segment, unlink=False):
+    try:
+        segment.close()
+    except BufferError:
+        # a view of the segment is still referenced, and its memory will
+        # be released when the process exits
+        pass
+    if unlink:
+        segment.unlink()
+
+
+class SharedSegmentPool(object):
+    """
+    Holds the shared memory segments created by this process, one for each
+    key, replacing a segment only when an array no longer fits in it.
+    """
+
+    def __init__(self):
+        self._segments = {}
+
+    def write(self, key, array):
+        """
+        Copies an array into the segment for a key, returning the name of
+        the segment.
+        """
+        segment = self._segments.get(key, None)
+        if segment is None or segment.size < array.nbytes:
+            if segment is not None:
+                close_segment(segment, unlink=True)
+            segment = shared_memory.SharedMemory(
+                create=True, size=max(array.nbytes, 1))
+            self._segments[key] = segment
+        np.ndarray(array.shape, array.dtype, buffer=segment.buf)[...] = array
+        return segment.name
+
+    def close(self):
+        for segment in self._segments.values():
+            close_segment(segment, unlink=True)
+        self._segments = {}
+
+
+class AttachedSegments(object):
+    """
+    Holds the shared memory segments created by another process which this
+    process has attached to, keeping them attached while they are in use.
+    """
+
+    def __init__(self):
+        self._segments = {}
+        self._used_names = set()
+
+    def get(self, name):
+        """
+        Returns the segment with the given name, attaching to it if needed.
+        """
+        if name not in self._segments:
+            try:
+                segment = shared_memory.SharedMemory(name=name, track=False)
+            except TypeError:
+                # before Python 3.13 attaching registers the segment with
+                # the resource tracker, which is shared with the process
+                # that created it, so the registration has no effect
+                segment = shared_memory.SharedMemory(name=name)
+            self._segments[name] = segment
+        self._used_names.add(name)
+        return self._segments[name]
+
+    def close_unused(self):
+        """
+        Detaches from segments which have not been used since the last call,
+        which have been replaced by their creator.
+        """
+        for name in list(self._segments.keys()):
+            if name not in self._used_names:
+                close_segment(self._segments.pop(name))
+        self._used_names = set()
+
+    def close(self):
+        for segment in self._segments.values():
+            close_segment(segment)
+        self._segments = {}
+        self._used_names = set()
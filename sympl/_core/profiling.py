@@ -0,0 +1,358 @@
+import functools
+import json
+import os
+import threading
+from timeit import default_timer
+from .exceptions import DependencyError
+
+# True while profiling is enabled, checked by functions instrumented with
+# profile_overhead so that they have almost no overhead otherwise
+enabled = False
+overhead_categories = ('marshalling', 'unit_conversion')
+
+
+class ProfileRegistry(object):
+    """
+    Collects the time spent in each component class while profiling is
+    enabled with :py:func:`~sympl.enable_profiling`, and exports it as a
+    summary table or a Chrome trace.
+
+    The time of each call is split into the time spent in other profiled
+    components called by it, the time spent by sympl converting quantities
+    to and from numpy arrays with properties (marshalling) and converting
+    units, and the remaining time in the component itself.
+
+    Attributes
+    ----------
+    dropped_events : int
+        The number of trace events not recorded because max_events was
+        reached.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {}
+        self._events = []
+        self._epoch = default_timer()
+        self._record_events = True
+        self._trace_memory = False
+        self._max_events = 1000000
+        self.dropped_events = 0
+
+    def configure(self, record_events=True, trace_memory=False,
+                  max_events=1000000):
+        """
+        Sets what is recorded. Called by enable_profiling.
+        """
+        self._record_events = record_events
+        self._trace_memory = trace_memory
+        self._max_events = max_events
+
+    def reset(self):
+        """Removes all recorded statistics and events."""
+        with self._lock:
+            self._stats = {}
+            self._events = []
+            self._epoch = default_timer()
+            self.dropped_events = 0
+
+    @property
+    def stats(self):
+        """
+        A dictionary whose keys are (class name, kind) pairs, where kind is
+        the sympl base class such as 'Prognostic', and values are
+        dictionaries with the number of 'calls', the 'total_time' in
+        seconds, the 'self_time' not spent in other profiled components,
+        the 'component_time', 'marshalling_time' and 'unit_conversion_time'
+        into which self_time is split, and the net bytes allocated during
+        the calls as 'memory' if memory is traced.
+        """
+        with self._lock:
+            return dict(
+                (key, value.copy()) for key, value in self._stats.items())
+
+    def summary(self):
+        """
+        Returns a table of the statistics of each component class as a
+        string, sorted by total time.
+        """
+        stats = self.stats
+        names = ['{} ({})'.format(name, kind) for name, kind in stats.keys()]
+        name_width = max([len('component')] + [len(name) for name in names])
+        columns = [
+            ('calls', 'calls', '{:d}'),
+            ('total (s)', 'total_time', '{:.4f}'),
+            ('self (s)', 'self_time', '{:.4f}'),
+            ('component (s)', 'component_time', '{:.4f}'),
+            ('marshalling (s)', 'marshalling_time', '{:.4f}'),
+            ('units (s)', 'unit_conversion_time', '{:.4f}'),
+        ]
+        if self._trace_memory:
+            columns.append(('memory (MB)', 'memory', '{:.3f}'))
+        lines = ['  '.join(
+            ['{:<{}}'.format('component', name_width)] +
+            ['{:>{}}'.format(title, len(title)) for title, _, _ in columns])]
+        for name, (key, value) in sorted(
+                zip(names, stats.items()),
+                key=lambda item: -item[1][1]['total_time']):
+            row = ['{:<{}}'.format(name, name_width)]
+            for title, stat, number_format in columns:
+                number = value[stat]
+                if stat == 'memory':
+                    number = number/1e6
+                row.append('{:>{}}'.format(
+                    number_format.format(number), len(title)))
+            lines.append('  '.join(row))
+        return '\n'.join(lines)
+
+    def get_chrome_trace(self):
+        """
+        Returns the recorded calls as a dictionary in the Chrome trace event
+        format, which can be viewed in chrome://tracing or Perfetto once
+        written as JSON.
+        """
+        with self._lock:
+            events = list(self._events)
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, filename):
+        """
+        Writes the recorded calls to a JSON file in the Chrome trace event
+        format.
+
+        Args
+        ----
+        filename : str
+            The file to write.
+        """
+        with open(filename, 'w') as f:
+            json.dump(self.get_chrome_trace(), f)
+
+    def call(self, component, kind, method, args, kwargs):
+        """
+        Calls method(component, *args, **kwargs), recording its time under
+        the class of component.
+        """
+        stack = self._get_stack()
+        if len(stack) > 0 and stack[-1].component is component:
+            # a method of a parent class called by the component itself,
+            # which is already being timed
+            return method(component, *args, **kwargs)
+        frame = CallFrame(component, kind)
+        stack.append(frame)
+        if self._trace_memory:
+            import tracemalloc
+            start_memory = tracemalloc.get_traced_memory()[0]
+        start = default_timer()
+        try:
+            return method(component, *args, **kwargs)
+        finally:
+            end = default_timer()
+            stack.pop()
+            if len(stack) > 0:
+                stack[-1].child_time += end - start
+            if self._trace_memory:
+                memory = tracemalloc.get_traced_memory()[0] - start_memory
+            else:
+                memory = 0
+            self._record_call(frame, start, end, memory)
+
+    def call_overhead(self, category, function, args, kwargs):
+        """
+        Calls function(*args, **kwargs), recording its time as the given
+        category of overhead of the component being called, if any.
+        """
+        stack = self._get_stack()
+        if len(stack) == 0 or stack[-1].overhead_category is not None:
+            # not in a component, or already counted as overhead
+            return function(*args, **kwargs)
+        frame = stack[-1]
+        frame.overhead_category = category
+        start = default_timer()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            end = default_timer()
+            frame.overhead_category = None
+            frame.overhead[category] += end - start
+            if self._record_events:
+                self._add_event(function.__name__, category, start, end)
+
+    def _get_stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def _record_call(self, frame, start, end, memory):
+        total_time = end - start
+        self_time = total_time - frame.child_time
+        key = (frame.component.__class__.__name__, frame.kind)
+        with self._lock:
+            if key not in self._stats:
+                self._stats[key] = {
+                    'calls': 0, 'total_time': 0., 'self_time': 0.,
+                    'component_time': 0., 'marshalling_time': 0.,
+                    'unit_conversion_time': 0., 'memory': 0}
+            stats = self._stats[key]
+            stats['calls'] += 1
+            stats['total_time'] += total_time
+            stats['self_time'] += self_time
+            stats['component_time'] += self_time - sum(
+                frame.overhead.values())
+            for category in overhead_categories:
+                stats[category + '_time'] += frame.overhead[category]
+            stats['memory'] += memory
+        if self._record_events:
+            self._add_event(key[0], frame.kind, start, end)
+
+    def _add_event(self, name, category, start, end):
+        with self._lock:
+            if len(self._events) >= self._max_events:
+                self.dropped_events += 1
+                return
+            self._events.append({
+                'name': name, 'cat': category, 'ph': 'X',
+                'ts': (start - self._epoch)*1e6, 'dur': (end - start)*1e6,
+                'pid': os.getpid(), 'tid': threading.current_thread().ident,
+            })
+
+
+class CallFrame(object):
+    """
+    The time recorded so far during one call of a profiled component.
+    """
+
+    __slots__ = (
+        'component', 'kind', 'child_time', 'overhead', 'overhead_category')
+
+    def __init__(self, component, kind):
+        self.component = component
+        self.kind = kind
+        self.child_time = 0.
+        self.overhead = dict(
+            (category, 0.) for category in overhead_categories)
+        self.overhead_category = None
+
+
+profile_registry = ProfileRegistry()
+# (class, method name, original method) for each method replaced while
+# profiling is enabled
+profiled_methods = []
+started_tracemalloc = False
+
+
+def profile_overhead(category):
+    """
+    Decorates a sympl function so that while profiling is enabled, its time
+    is recorded as the given category of overhead of the component calling
+    it.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapped_function(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            return profile_registry.call_overhead(
+                category, function, args, kwargs)
+        return wrapped_function
+    return decorator
+
+
+def enable_profiling(record_events=True, trace_memory=False,
+                     max_events=1000000):
+    """
+    Starts recording the time spent in each Prognostic, Diagnostic,
+    Implicit, ImplicitPrognostic, Monitor and TimeStepper class in the
+    global profile registry, sympl.profile_registry.
+
+    The calling methods of every subclass defined when this is called are
+    replaced by timed versions, until disable_profiling is called. When
+    profiling is disabled, components are therefore called without any
+    overhead.
+
+    Args
+    ----
+    record_events : bool, optional
+        If True, each call is recorded as an event for the Chrome trace.
+        Default is True.
+    trace_memory : bool, optional
+        If True, the net number of bytes allocated during each call is
+        recorded using tracemalloc, which slows down the model
+        considerably. Default is False.
+    max_events : int, optional
+        The largest number of events to record. Default is 1000000.
+
+    Raises
+    ------
+    DependencyError
+        If trace_memory is True and tracemalloc is not available.
+    """
+    global enabled, started_tracemalloc
+    if trace_memory:
+        try:
+            import tracemalloc
+        except ImportError:
+            raise DependencyError(
+                'tracemalloc, which was added in Python 3.4, is needed to '
+                'trace memory')
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracemalloc = True
+    profile_registry.configure(record_events, trace_memory, max_events)
+    if not enabled:
+        for cls, method_name, kind in get_profiled_methods():
+            method = cls.__dict__[method_name]
+            profiled_methods.append((cls, method_name, method))
+            setattr(cls, method_name, get_profiled_method(method, kind))
+        enabled = True
+
+
+def disable_profiling():
+    """
+    Stops recording the time spent in components, restoring their original
+    calling methods. The recorded statistics are kept in the profile
+    registry.
+    """
+    global enabled, started_tracemalloc
+    while len(profiled_methods) > 0:
+        cls, method_name, method = profiled_methods.pop()
+        setattr(cls, method_name, method)
+    enabled = False
+    if started_tracemalloc:
+        import tracemalloc
+        tracemalloc.stop()
+        started_tracemalloc = False
+
+
+def get_profiled_methods():
+    """
+    Returns a list of (class, method name, kind) for each method which is
+    timed while profiling is enabled.
+    """
+    from .base_components import (
+        Prognostic, Diagnostic, Implicit, ImplicitPrognostic, Monitor)
+    from .timestepping import TimeStepper
+    base_classes = [
+        (Prognostic, '__call__'), (Diagnostic, '__call__'),
+        (Implicit, '__call__'), (ImplicitPrognostic, '__call__'),
+        (Monitor, 'store'), (TimeStepper, '__call__')]
+    methods = []
+    for base_class, method_name in base_classes:
+        classes = [base_class]
+        for cls in classes:
+            if (method_name in cls.__dict__ and
+                    (cls, method_name) not in
+                    [method[:2] for method in methods]):
+                methods.append((cls, method_name, base_class.__name__))
+            classes.extend(
+                subclass for subclass in cls.__subclasses__()
+                if subclass not in classes)
+    return methods
+
+
+def get_profiled_method(method, kind):
+    @functools.wraps(method)
+    def profiled_method(self, *args, **kwargs):
+        return profile_registry.call(self, kind, method, args, kwargs)
+    return profiled_method
@@ -0,0 +1,336 @@
+import itertools
+import numpy as np
+from .array import DataArray
+from .exceptions import InvalidStateError
+
+# versions are unique across all State objects, so that a (name, version)
+# pair identifies a value even after it is copied into another State
+_version_counter = itertools.count(1)
+
+
+class State(dict):
+    """
+    A model state dictionary which checks the dimension lengths of each
+    DataArray when it is inserted, instead of every time the state is used.
+
+    A State can be used anywhere a state dictionary is expected. It keeps a
+    registry of the length of every dimension used by its DataArrays, and
+    raises InvalidStateError when a DataArray is inserted whose dimension
+    lengths are inconsistent with it. Since a State is always consistent,
+    sympl does not re-check it when it is passed to a component.
+
+    Each quantity also has a version number, which is changed whenever a
+    value is assigned to that quantity. Versions are unique across all
+    State objects and are kept by copy(), so they can be used to tell
+    whether a quantity has changed since it was last seen. Modifying the
+    data of a DataArray in-place does not change its version unless it
+    is re-assigned or mark_modified is called.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(State, self).__init__()
+        self._dimension_lengths = {}
+        self._dimension_counts = {}
+        self._versions = {}
+        self.update(*args, **kwargs)
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self),))
+
+    def __copy__(self):
+        return self.copy()
+
+    def __setitem__(self, key, value):
+        if isinstance(value, DataArray):
+            self._ensure_consistent_dimension_lengths(key, value)
+        if key in self:
+            self._unregister_dimensions(super(State, self).__getitem__(key))
+        self._register_dimensions(value)
+        super(State, self).__setitem__(key, value)
+        self._versions[key] = next(_version_counter)
+
+    def __delitem__(self, key):
+        self._unregister_dimensions(super(State, self).__getitem__(key))
+        super(State, self).__delitem__(key)
+        del self._versions[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *args):
+        if key in self:
+            value = self[key]
+            del self[key]
+            return value
+        else:
+            return super(State, self).pop(key, *args)
+
+    def popitem(self):
+        key, value = super(State, self).popitem()
+        self._unregister_dimensions(value)
+        del self._versions[key]
+        return key, value
+
+    def clear(self):
+        super(State, self).clear()
+        self._dimension_lengths.clear()
+        self._dimension_counts.clear()
+        self._versions.clear()
+
+    def copy(self):
+        """
+        Returns a shallow copy of this State, which keeps the versions of
+        its quantities.
+        """
+        return_state = self.__class__()
+        dict.update(return_state, self)
+        return_state._dimension_lengths.update(self._dimension_lengths)
+        return_state._dimension_counts.update(self._dimension_counts)
+        return_state._versions.update(self._versions)
+        return return_state
+
+    @property
+    def dimension_lengths(self):
+        """A dictionary of the length of each dimension in this State."""
+        return self._dimension_lengths.copy()
+
+    def version(self, key):
+        """
+        Returns the version number of the given quantity, which changes
+        whenever a value is assigned to it.
+        """
+        return self._versions[key]
+
+    def mark_modified(self, key):
+        """
+        Changes the version of the given quantity, indicating its data has
+        been modified in-place.
+        """
+        if key not in self:
+            raise KeyError(key)
+        self._versions[key] = next(_version_counter)
+
+    def _ensure_consistent_dimension_lengths(self, key, value):
+        for i, dim in enumerate(value.dims):
+            length = value.shape[i]
+            if dim in self._dimension_lengths and (
+                    self._dimension_lengths[dim] != length):
+                # the only DataArray with this dimension may be the one
+                # being replaced, in which case the length can change
+                if not (key in self and self._dimension_counts[dim] == 1 and
+                        dim in getattr(self[key], 'dims', ())):
+                    raise InvalidStateError(
+                        'dimension {} has multiple lengths (at least {} and '
+                        '{})'.format(dim, length, self._dimension_lengths[dim]))
+
+    def _register_dimensions(self, value):
+        if isinstance(value, DataArray):
+            for i, dim in enumerate(value.dims):
+                self._dimension_lengths[dim] = value.shape[i]
+                self._dimension_counts[dim] = (
+                    self._dimension_counts.get(dim, 0) + 1)
+
+    def _unregister_dimensions(self, value):
+        if isinstance(value, DataArray):
+            for dim in value.dims:
+                self._dimension_counts[dim] -= 1
+                if self._dimension_counts[dim] == 0:
+                    del self._dimension_counts[dim]
+                    del self._dimension_lengths[dim]
+
+
+class PackedState(State):
+    """
+    A State in which a chosen set of quantities, usually the prognostic
+    quantities, are stored together in a single contiguous one-dimensional
+    buffer. Each of these quantities is a DataArray whose data is a view
+    into the buffer, so that operations on the whole buffer (such as a
+    timestep) update every packed quantity at once, and the buffer can be
+    written out in a single operation.
+
+    A quantity stays packed as long as the DataArray viewing the buffer is
+    the value stored for it, including after in-place operations such as
+    +=. Assigning a different DataArray to a packed quantity stores it
+    as-is and removes that quantity from the packed set, so that assignments
+    never modify memory shared with copies of this PackedState.
+
+    Attributes
+    ----------
+    buffer : ndarray
+        The one-dimensional array holding the data of all packed quantities.
+    packed_names : frozenset of str
+        The quantities whose data is currently a view into buffer.
+    """
+
+    def __init__(self, state=None, packed_names=None, dtype=None):
+        """
+        Args
+        ----
+        state : dict, optional
+            The model state to pack. Its packed quantities are copied into
+            the buffer.
+        packed_names : iterable of str, optional
+            The quantities to pack, which must be DataArrays in the state.
+            By default all DataArrays in the state are packed.
+        dtype : dtype, optional
+            The dtype of the buffer. Default is float64.
+        """
+        super(PackedState, self).__init__()
+        if state is None:
+            state = {}
+        if packed_names is None:
+            packed_names = [
+                name for name, value in state.items()
+                if isinstance(value, DataArray)]
+        if dtype is None:
+            dtype = np.float64
+        layout = []
+        size = 0
+        for name in sorted(packed_names):
+            if not isinstance(state[name], DataArray):
+                raise TypeError(
+                    'quantity {} must be a DataArray to be packed'.format(name))
+            layout.append((name, size, size + state[name].size))
+            size += state[name].size
+        self._layout = tuple(layout)
+        self._slices = {name: (start, stop) for name, start, stop in layout}
+        self._templates = {name: state[name] for name in packed_names}
+        self.buffer = np.empty(size, dtype=dtype)
+        self._views = {}
+        for name, start, stop in self._layout:
+            self.buffer[start:stop] = state[name].values.ravel()
+            self._views[name] = self._create_view(name, self.buffer)
+        for key, value in state.items():
+            self[key] = self._views.get(key, value)
+
+    def __reduce__(self):
+        return (
+            self.__class__, (dict(self), self.packed_names, self.buffer.dtype))
+
+    @property
+    def packed_names(self):
+        return frozenset(self._views.keys())
+
+    def __setitem__(self, key, value):
+        if key in self._views and self._views[key] is not value:
+            del self._views[key]
+        super(PackedState, self).__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._views.pop(key, None)
+        super(PackedState, self).__delitem__(key)
+
+    def popitem(self):
+        key, value = super(PackedState, self).popitem()
+        self._views.pop(key, None)
+        return key, value
+
+    def clear(self):
+        super(PackedState, self).clear()
+        self._views.clear()
+
+    def copy(self):
+        """
+        Returns a shallow copy of this PackedState, which shares its buffer
+        and keeps the versions of its quantities.
+        """
+        return_state = super(PackedState, self).copy()
+        return_state._layout = self._layout
+        return_state._slices = self._slices
+        return_state._templates = self._templates
+        return_state.buffer = self.buffer
+        return_state._views = self._views.copy()
+        return return_state
+
+    def is_fully_packed(self):
+        """Returns True if every quantity in the layout is still packed."""
+        return len(self._views) == len(self._layout)
+
+    def has_same_layout(self, other):
+        """
+        Returns True if other is a PackedState whose buffer has the same
+        layout and dtype as the buffer of this one.
+        """
+        return (
+            isinstance(other, PackedState) and
+            other._layout == self._layout and
+            other.buffer.dtype == self.buffer.dtype)
+
+    def get_slice(self, name):
+        """
+        Returns the slice of the buffer holding the data of the given
+        quantity, which need not currently be packed.
+        """
+        start, stop = self._slices[name]
+        return slice(start, stop)
+
+    def pack(self, quantities, out=None):
+        """
+        Packs quantities with the same names and dimensions as the packed
+        quantities in this PackedState, such as their tendencies, into a
+        buffer with the same layout as this one.
+
+        Args
+        ----
+        quantities : dict
+            A dictionary containing a DataArray for every quantity in the
+            layout of this PackedState. Units are not converted.
+        out : ndarray, optional
+            The one-dimensional array into which to pack the quantities. If
+            not given, a new array is allocated.
+
+        Returns
+        -------
+        buffer : ndarray
+            A one-dimensional array containing the packed quantities.
+
+        Raises
+        ------
+        KeyError
+            If a quantity in the layout is missing from quantities.
+        """
+        if out is None:
+            out = np.empty_like(self.buffer)
+        for name, start, stop in self._layout:
+            value = quantities[name]
+            dims = self._templates[name].dims
+            if value.dims != dims:
+                value = value.transpose(*dims)
+            out[start:stop].reshape(value.shape)[...] = value.values
+        return out
+
+    def with_buffer(self, buffer):
+        """
+        Returns a copy of this PackedState whose packed quantities are
+        views into the given buffer, which must have the same size and dtype
+        as the buffer of this one. Quantities which are not packed are
+        shared with this PackedState.
+        """
+        if buffer.shape != self.buffer.shape or buffer.dtype != self.buffer.dtype:
+            raise ValueError(
+                'buffer must have shape {} and dtype {}, but has shape {} and '
+                'dtype {}'.format(
+                    self.buffer.shape, self.buffer.dtype, buffer.shape,
+                    buffer.dtype))
+        return_state = self.copy()
+        return_state.buffer = buffer
+        return_state._views = {}
+        for name, start, stop in self._layout:
+            view = self._create_view(name, buffer)
+            return_state[name] = view
+            return_state._views[name] = view
+        return return_state
+
+    def _create_view(self, name, buffer):
+        template = self._templates[name]
+        start, stop = self._slices[name]
+        view = template.copy(deep=False)  # shares coordinates
+        view.values = buffer[start:stop].reshape(template.shape)
+        view.attrs = template.attrs.copy()
+        return view
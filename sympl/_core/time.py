@@ -1,9 +1,5 @@
 from datetime import datetime as real_datetime, timedelta
 from .exceptions import DependencyError
-try:
-    import netcdftime as nt
-except ImportError:
-    nt = None
 
 
 def datetime(
@@ -47,11 +43,13 @@ def datetime(
         return real_datetime(tzinfo=tzinfo, **kwargs)
     elif tzinfo is not None:
         raise ValueError('netcdftime does not support timezone-aware datetimes')
-    elif nt is None:
+    try:
+        import netcdftime as nt
+    except ImportError:
         raise DependencyError(
             "Calendars other than 'proleptic_gregorian' require the netcdftime "
             "package, which is not installed.")
-    elif calendar.lower() in ('all_leap', '366_day'):
+    if calendar.lower() in ('all_leap', '366_day'):
         return nt.DatetimeAllLeap(**kwargs)
     elif calendar.lower() in ('no_leap', 'noleap', '365_day'):
         return nt.DatetimeNoLeap(**kwargs)
@@ -1,6 +1,14 @@
-from .base_components import PrognosticComposite
+from .base_components import (
+    PrognosticComposite, Prognostic, ImplicitPrognostic)
 import abc
+import copy
+from datetime import timedelta
+import numpy as np
 from .array import DataArray
+from .state import State, PackedState
+from .util import (
+    update_dict_by_adding_another, get_component_checkpoint,
+    set_component_checkpoint, ensemble_dim_name)
 
 
 class TimeStepper(object):
@@ -48,7 +56,11 @@ class TimeStepper(object):
             return return_value
 
     def __init__(self, prognostic_list, **kwargs):
-        self._prognostic = PrognosticComposite(*prognostic_list)
+        if isinstance(prognostic_list, PrognosticComposite):
+            # allows options such as n_threads to be set on the composite
+            self._prognostic = prognostic_list
+        else:
+            self._prognostic = PrognosticComposite(*prognostic_list)
 
     @abc.abstractmethod
     def __call__(self, state, timestep):
@@ -71,10 +83,47 @@ class TimeStepper(object):
             The model state at the next timestep.
         """
 
+    def get_checkpoint_state(self):
+        """
+        Returns a dictionary containing copies of the internal history of
+        this object and of the components it calls, such as the tendencies
+        from previous timesteps. Restoring it with set_checkpoint_state
+        into a TimeStepper constructed in the same way allows a run to be
+        continued with results identical to those of an uninterrupted run.
+
+        Returns
+        -------
+        checkpoint : dict
+            The checkpoint state, which can be pickled.
+        """
+        return {'prognostic': get_component_checkpoint(self._prognostic)}
+
+    def set_checkpoint_state(self, checkpoint):
+        """
+        Restores the internal history of this object and of the components
+        it calls from a dictionary returned by get_checkpoint_state.
+
+        Args
+        ----
+        checkpoint : dict
+            The checkpoint state.
+        """
+        set_component_checkpoint(self._prognostic, checkpoint['prognostic'])
+
     def _copy_untouched_quantities(self, old_state, new_state):
+        """
+        Adds any quantities in old_state which are not in new_state to
+        new_state. If old_state is a State, returns a State containing
+        new_state, which keeps the versions of untouched quantities.
+        """
+        if isinstance(old_state, State):
+            return_state = old_state.copy()
+            return_state.update(new_state)
+            return return_state
         for key in old_state.keys():
             if key not in new_state:
                 new_state[key] = old_state[key]
+        return new_state
 
     @property
     def inputs(self):
@@ -90,19 +139,34 @@ class TimeStepper(object):
 
 
 class AdamsBashforth(TimeStepper):
-    """A TimeStepper using the Adams-Bashforth scheme."""
+    """A TimeStepper using the Adams-Bashforth scheme.
+
+    The timestep may change between calls, in which case the coefficients
+    are computed from the actual times of the previous tendencies, so the
+    order of accuracy is kept."""
 
-    def __init__(self, prognostic_list, order=3):
+    def __init__(self, prognostic_list, order=3, reuse_buffers=False):
         """
         Initialize an Adams-Bashforth time stepper.
 
         Args
         ----
-        prognostic_list : iterable of Prognostic
-            Objects used to get tendencies for time stepping.
+        prognostic_list : iterable of Prognostic or PrognosticComposite
+            Objects used to get tendencies for time stepping. A
+            PrognosticComposite may be given to set its options, such as
+            calling the objects in parallel.
         order : int, optional
             The order of accuracy to use. Must be between
             1 and 4. 1 is the same as the Euler method. Default is 3.
+        reuse_buffers : bool, optional
+            If True, previous tendencies are stored in a preallocated ring
+            buffer and the new state is computed for each quantity with a
+            single matrix-vector product and addition into one of two
+            preallocated output arrays, instead of allocating temporary
+            arrays every step. The output arrays alternate between steps,
+            so the arrays in a returned state are overwritten two steps
+            later and must be copied if they are to be kept. Default is
+            False.
         """
         if isinstance(order, float) and order.is_integer():
             order = int(order)
@@ -111,8 +175,12 @@ class AdamsBashforth(TimeStepper):
         if not 1 <= order <= 4:
             raise ValueError('order must be between 1 and 4')
         self._order = order
-        self._timestep = None
+        self._timesteps = []
         self._tendencies_list = []
+        self._reuse_buffers = reuse_buffers
+        self._tendency_ring = None
+        self._tendency_count = 0
+        self._output_buffers = None
         super(AdamsBashforth, self).__init__(prognostic_list)
 
     def __call__(self, state, timestep):
@@ -134,28 +202,94 @@ class AdamsBashforth(TimeStepper):
             Diagnostics from the timestep of the input state.
         new_state : dict
             The model state at the next timestep.
-
-        Raises
-        ------
-        ValueError
-            If the timestep is not the same as the last time
-            step() was called on this instance of this object.
         """
-        self._ensure_constant_timestep(timestep)
         state = state.copy()
         tendencies, diagnostics = self._prognostic(state)
         convert_tendencies_units_for_state(tendencies, state)
-        self._tendencies_list.append(tendencies)
-        new_state = self._perform_step(state, timestep)
-        self._copy_untouched_quantities(state, new_state)
-        if len(self._tendencies_list) == self._order:
-            self._tendencies_list.pop(0)  # remove the oldest entry
+        step_state, step_tendencies = get_packed_step_arguments(
+            state, tendencies)
+        if self._reuse_buffers:
+            new_state = self._perform_buffered_step(
+                step_state, step_tendencies, timestep)
+        else:
+            if (len(self._tendencies_list) > 0 and
+                    (packed_key in self._tendencies_list[-1]) !=
+                    (packed_key in step_tendencies)):
+                # stored tendencies cannot be used after switching between
+                # packed and unpacked steps, so start again at first order
+                self._tendencies_list = []
+            self._tendencies_list.append(step_tendencies)
+            new_state = self._perform_step(step_state, timestep)
+            if len(self._tendencies_list) == self._order:
+                self._tendencies_list.pop(0)  # remove the oldest entry
+        self._timesteps.append(timestep.total_seconds())
+        if len(self._timesteps) == self._order:
+            self._timesteps.pop(0)
+        if step_state is state:
+            new_state = self._copy_untouched_quantities(state, new_state)
+        else:
+            new_state = state.with_buffer(new_state[packed_key])
         return diagnostics, new_state
 
+    def get_checkpoint_state(self):
+        checkpoint = super(AdamsBashforth, self).get_checkpoint_state()
+        checkpoint.update(copy.deepcopy({
+            'order': self._order,
+            'timesteps': self._timesteps,
+            'tendencies_list': self._tendencies_list,
+            'tendency_ring': self._tendency_ring,
+            'tendency_count': self._tendency_count,
+        }))
+        return checkpoint
+
+    def set_checkpoint_state(self, checkpoint):
+        """
+        Restores the internal history of this object and of the components
+        it calls from a dictionary returned by get_checkpoint_state.
+
+        Args
+        ----
+        checkpoint : dict
+            The checkpoint state.
+
+        Raises
+        ------
+        ValueError
+            If the checkpoint is from an AdamsBashforth of a different order.
+        """
+        if checkpoint['order'] != self._order:
+            raise ValueError(
+                'checkpoint is for order {}, but this AdamsBashforth has '
+                'order {}'.format(checkpoint['order'], self._order))
+        super(AdamsBashforth, self).set_checkpoint_state(checkpoint)
+        checkpoint = copy.deepcopy(checkpoint)
+        self._timesteps = checkpoint['timesteps']
+        self._tendencies_list = checkpoint['tendencies_list']
+        self._tendency_ring = checkpoint['tendency_ring']
+        self._tendency_count = checkpoint['tendency_count']
+        if self._tendency_ring is None:
+            self._output_buffers = None
+        else:
+            self._output_buffers = [
+                {key: np.empty(ring.shape[1:], dtype=ring.dtype)
+                 for key, ring in self._tendency_ring.items()}
+                for i in range(2)]
+
+    def _get_coefficients(self, order, timestep):
+        previous_timesteps = self._timesteps[len(self._timesteps) - order + 1:]
+        return get_adams_bashforth_coefficients(
+            timestep.total_seconds(), previous_timesteps)
+
     def _perform_step(self, state, timestep):
         # if we don't have enough previous tendencies built up, use lower order
         order = min(self._order, len(self._tendencies_list))
-        if order == 1:
+        if order > 1 and any(
+                previous_timestep != timestep.total_seconds()
+                for previous_timestep in self._timesteps[1 - order:]):
+            new_state = variable_bashforth(
+                state, self._tendencies_list, timestep,
+                self._get_coefficients(order, timestep))
+        elif order == 1:
             new_state = step_forward_euler(
                 state, self._tendencies_list[-1], timestep)
         elif order == 2:
@@ -169,12 +303,125 @@ class AdamsBashforth(TimeStepper):
             raise RuntimeError('order should be integer between 1 and 4')
         return new_state
 
-    def _ensure_constant_timestep(self, timestep):
-        if self._timestep is None:
-            self._timestep = timestep
-        elif self._timestep != timestep:
-            raise ValueError(
-                'timestep must be constant for Adams-Bashforth time stepping')
+    def _perform_buffered_step(self, state, tendencies, timestep):
+        arrays = {}
+        for key in tendencies.keys():
+            arrays[key] = (
+                np.asarray(getattr(state[key], 'values', state[key])),
+                get_values_like(tendencies[key], state[key]))
+        self._ensure_buffers(arrays)
+        slot = self._tendency_count % self._order
+        self._tendency_count += 1
+        order = min(self._order, self._tendency_count)
+        # weights for each slot of the ring buffer, most recent first
+        weights = np.zeros([self._order])
+        for i, coefficient in enumerate(
+                self._get_coefficients(order, timestep)):
+            weights[(slot - i) % self._order] = (
+                coefficient * timestep.total_seconds())
+        # write into whichever output buffers do not hold the input state
+        outputs = self._output_buffers[0]
+        if any(np.may_share_memory(outputs[key], value)
+               for key, (value, tendency) in arrays.items()):
+            outputs = self._output_buffers[1]
+        new_state = {}
+        for key, (value, tendency) in arrays.items():
+            ring = self._tendency_ring[key]
+            out = outputs[key]
+            ring[slot] = tendency
+            np.dot(weights.astype(ring.dtype, copy=False),
+                   ring.reshape((self._order, -1)), out=out.reshape(-1))
+            np.add(out, value, out=out)
+            new_state[key] = replace_values(state[key], out)
+        return new_state
+
+    def _ensure_buffers(self, arrays):
+        """
+        Allocates the tendency ring buffer and output buffers if they do not
+        match the given dictionary of (value, tendency) array pairs, in which
+        case stepping starts again at first order.
+        """
+        if self._tendency_ring is not None and (
+                set(self._tendency_ring.keys()) == set(arrays.keys())) and all(
+                    self._tendency_ring[key].shape[1:] == value.shape and
+                    self._tendency_ring[key].dtype ==
+                    np.result_type(value.dtype, tendency.dtype)
+                    for key, (value, tendency) in arrays.items()):
+            return
+        self._tendency_ring = {}
+        self._output_buffers = [{}, {}]
+        for key, (value, tendency) in arrays.items():
+            dtype = np.result_type(value.dtype, tendency.dtype)
+            self._tendency_ring[key] = np.zeros(
+                (self._order,) + value.shape, dtype=dtype)
+            for outputs in self._output_buffers:
+                outputs[key] = np.empty(value.shape, dtype=dtype)
+        self._tendency_count = 0
+
+
+# Adams-Bashforth coefficients for each order, most recent tendency first
+adams_bashforth_coefficients = {
+    1: (1.,),
+    2: (1.5, -0.5),
+    3: (23./12, -4./3, 5./12),
+    4: (55./24, -59./24, 37./24, -3./8),
+}
+
+
+def replace_values(value, array):
+    """
+    Returns a quantity like value whose data is the given numpy array. If
+    value is a DataArray, this is a shallow copy sharing its coordinates.
+    If value is a scalar, the scalar in the array is returned.
+    """
+    if isinstance(value, DataArray):
+        return_value = value.copy(deep=False)
+        return_value.values = array
+        return return_value
+    elif isinstance(value, np.ndarray):
+        return array
+    else:
+        return array[()]
+
+
+def get_adams_bashforth_coefficients(timestep, previous_timesteps):
+    """
+    Returns the Adams-Bashforth coefficients for a step of timestep seconds,
+    most recent tendency first, given the lengths in seconds of the previous
+    steps between the times of the tendencies (oldest first). The order is
+    one more than the number of previous steps. If the steps differ, the
+    coefficients integrate the polynomial through the tendencies at their
+    actual times over the step.
+    """
+    order = len(previous_timesteps) + 1
+    if all(step == timestep for step in previous_timesteps):
+        return adams_bashforth_coefficients[order]
+    # times of the tendencies relative to the current time, most recent first
+    times = [0.]
+    for step in reversed(previous_timesteps):
+        times.append(times[-1] - step)
+    coefficients = []
+    for i, time in enumerate(times):
+        lagrange_polynomial = np.poly1d([1.])
+        for j, other_time in enumerate(times):
+            if j != i:
+                lagrange_polynomial *= np.poly1d(
+                    [1., -other_time])/(time - other_time)
+        integral = lagrange_polynomial.integ()
+        coefficients.append((integral(timestep) - integral(0.))/timestep)
+    return tuple(coefficients)
+
+
+def get_values_like(value, reference):
+    """
+    Returns the numpy array of value, transposed to the dimension order of
+    reference if both are DataArrays.
+    """
+    if isinstance(value, DataArray):
+        if isinstance(reference, DataArray) and value.dims != reference.dims:
+            value = value.transpose(*reference.dims)
+        return value.values
+    return np.asarray(value)
 
 
 def convert_tendencies_units_for_state(tendencies, state):
@@ -203,14 +450,16 @@ class Leapfrog(TimeStepper):
 
     def __init__(
             self, prognostic_list, asselin_strength=0.05,
-            alpha=0.5):
+            alpha=0.5, reuse_buffers=False):
         """
         Initialize a Leapfrog time stepper.
 
         Args
         ----
-        prognostic_list : iterable of Prognostic
-            Objects used to get tendencies for time stepping.
+        prognostic_list : iterable of Prognostic or PrognosticComposite
+            Objects used to get tendencies for time stepping. A
+            PrognosticComposite may be given to set its options, such as
+            calling the objects in parallel.
         asselin_strength : float, optional
             The filter parameter used to determine the strength
             of the Asselin filter. Default is 0.05.
@@ -221,6 +470,14 @@ class Leapfrog(TimeStepper):
             is that of the classic Robert-Asselin time filter, while if it
             is 0.5 the filter will conserve the three-point mean.
             Default is 0.5.
+        reuse_buffers : bool, optional
+            If True, the values at the previous, current and next timesteps
+            are kept in three preallocated arrays per quantity which are
+            rotated between steps, and the step and filter are computed
+            in-place in them without allocating temporary arrays. The
+            filter then modifies the arrays of the input state in-place, and
+            the arrays in a returned state are overwritten two steps later,
+            so they must be copied if they are to be kept. Default is False.
 
         References
         ----------
@@ -232,6 +489,9 @@ class Leapfrog(TimeStepper):
         self._asselin_strength = asselin_strength
         self._timestep = None
         self._alpha = alpha
+        self._reuse_buffers = reuse_buffers
+        self._slots = None
+        self._old_slot_index = None
         super(Leapfrog, self).__init__(prognostic_list)
 
     def __call__(self, state, timestep):
@@ -268,18 +528,146 @@ class Leapfrog(TimeStepper):
         self._ensure_constant_timestep(timestep)
         tendencies, diagnostics = self._prognostic(state)
         convert_tendencies_units_for_state(tendencies, state)
-        if self._old_state is None:
-            new_state = step_forward_euler(state, tendencies, timestep)
+        step_state, step_tendencies = get_packed_step_arguments(
+            state, tendencies)
+        if (step_state is not state and not self._reuse_buffers and
+                self._old_state is not None and not (
+                    state.has_same_layout(self._old_state) and
+                    self._old_state.is_fully_packed())):
+            # the previous state cannot be stepped as a single buffer
+            step_state, step_tendencies = state, tendencies
+        if self._reuse_buffers:
+            new_state = self._perform_buffered_step(
+                step_state, step_tendencies, timestep)
+        elif self._old_state is None:
+            new_state = step_forward_euler(
+                step_state, step_tendencies, timestep)
         else:
-            state, new_state = step_leapfrog(
-                self._old_state, state, tendencies, timestep,
+            if step_state is state:
+                old_step_state = self._old_state
+            else:
+                old_step_state = {packed_key: self._old_state.buffer}
+            # when packed, the filter is applied in-place to the buffer
+            # shared by state and original_state
+            step_state, new_state = step_leapfrog(
+                old_step_state, step_state, step_tendencies, timestep,
                 asselin_strength=self._asselin_strength, alpha=self._alpha)
-        self._copy_untouched_quantities(state, new_state)
+        if step_state is state:
+            new_state = self._copy_untouched_quantities(state, new_state)
+        else:
+            new_state = state.with_buffer(new_state[packed_key])
         self._old_state = state
         for key in original_state.keys():
             original_state[key] = state[key]  # allow filtering to be applied
         return diagnostics, new_state
 
+    def get_checkpoint_state(self):
+        checkpoint = super(Leapfrog, self).get_checkpoint_state()
+        checkpoint['timestep'] = self._timestep
+        if self._reuse_buffers:
+            # only the slot holding the previous values is needed
+            checkpoint['old_state'] = None
+            if self._slots is None:
+                checkpoint['old_values'] = None
+            else:
+                checkpoint['old_values'] = {
+                    key: self._slots[key][index].copy()
+                    for key, index in self._old_slot_index.items()
+                    if index is not None}
+        else:
+            checkpoint['old_state'] = copy.deepcopy(self._old_state)
+            checkpoint['old_values'] = None
+        return checkpoint
+
+    def set_checkpoint_state(self, checkpoint):
+        super(Leapfrog, self).set_checkpoint_state(checkpoint)
+        self._timestep = checkpoint['timestep']
+        self._old_state = copy.deepcopy(checkpoint['old_state'])
+        if checkpoint['old_values'] is None:
+            self._slots = None
+            self._old_slot_index = None
+        else:
+            self._slots = {}
+            self._old_slot_index = {}
+            for key, value in checkpoint['old_values'].items():
+                self._slots[key] = [
+                    value.copy(), np.empty_like(value), np.empty_like(value)]
+                self._old_slot_index[key] = 0
+
+    def _perform_buffered_step(self, state, tendencies, timestep):
+        arrays = {}
+        for key in tendencies.keys():
+            arrays[key] = (
+                np.asarray(getattr(state[key], 'values', state[key])),
+                get_values_like(tendencies[key], state[key]))
+        self._ensure_slots(arrays)
+        dt = timestep.total_seconds()
+        strength = 0.5*self._asselin_strength
+        alpha = self._alpha
+        new_state = {}
+        for key, (value, tendency) in arrays.items():
+            slots = self._slots[key]
+            current_index = [
+                i for i, slot in enumerate(slots) if value is slot]
+            old_index = self._old_slot_index[key]
+            new_index = [
+                i for i in range(3)
+                if i != old_index and i not in current_index][0]
+            new = slots[new_index]
+            np.multiply(tendency, 2.*dt if old_index is not None else dt,
+                        out=new)
+            if old_index is None:  # first step, use forward Euler
+                np.add(new, value, out=new)
+                old_index = [i for i in range(3) if i != new_index][0]
+            else:
+                old = slots[old_index]
+                np.add(new, old, out=new)
+                # replace the old values with the filter influence
+                np.add(old, new, out=old)
+                np.subtract(old, value, out=old)
+                np.subtract(old, value, out=old)
+                if alpha != 0.:
+                    np.multiply(old, strength*alpha, out=old)
+                    np.add(value, old, out=value)
+                    if alpha != 1.:
+                        np.multiply(old, (alpha - 1.)/alpha, out=old)
+                        np.add(new, old, out=new)
+                else:
+                    np.multiply(old, -strength, out=old)
+                    np.add(new, old, out=new)
+                if not isinstance(state[key], (DataArray, np.ndarray)):
+                    state[key] = value[()]
+            if len(current_index) > 0:
+                self._old_slot_index[key] = current_index[0]
+            else:
+                # the current values are not stored in a slot, so keep a copy
+                # of them in the slot which held the old values
+                slots[old_index][...] = value
+                self._old_slot_index[key] = old_index
+            new_state[key] = replace_values(state[key], new)
+        return new_state
+
+    def _ensure_slots(self, arrays):
+        """
+        Allocates the three arrays per quantity used when reusing buffers if
+        they do not match the given dictionary of (value, tendency) array
+        pairs, in which case stepping starts again with forward Euler.
+        """
+        if self._slots is not None and (
+                set(self._slots.keys()) == set(arrays.keys())) and all(
+                    self._slots[key][0].shape == value.shape and
+                    self._slots[key][0].dtype ==
+                    np.result_type(value.dtype, tendency.dtype)
+                    for key, (value, tendency) in arrays.items()):
+            return
+        self._slots = {}
+        self._old_slot_index = {}
+        for key, (value, tendency) in arrays.items():
+            dtype = np.result_type(value.dtype, tendency.dtype)
+            self._slots[key] = [
+                np.empty(value.shape, dtype=dtype) for i in range(3)]
+            self._old_slot_index[key] = None
+
     def _ensure_constant_timestep(self, timestep):
         if self._timestep is None:
             self._timestep = timestep
@@ -288,6 +676,26 @@ class Leapfrog(TimeStepper):
                 'timestep must be constant for Leapfrog time stepping')
 
 
+# key used for the single buffer passed to the step functions when stepping
+# a PackedState
+packed_key = '__packed__'
+
+
+def get_packed_step_arguments(state, tendencies):
+    """
+    Returns the state and tendencies dictionaries to pass to the step
+    functions. If state is a PackedState whose packed quantities are exactly
+    those in tendencies, these each contain a single buffer under packed_key,
+    so that the whole state is stepped with a few vectorized operations.
+    Otherwise state and tendencies are returned unchanged.
+    """
+    if (isinstance(state, PackedState) and state.is_fully_packed() and
+            state.packed_names == frozenset(tendencies.keys())):
+        return {packed_key: state.buffer}, {packed_key: state.pack(tendencies)}
+    else:
+        return state, tendencies
+
+
 def step_leapfrog(
         old_state, state, tendencies, timestep, asselin_strength=0.05,
         alpha=1.):
@@ -336,6 +744,20 @@ def step_leapfrog(
     return state, new_state
 
 
+def variable_bashforth(state, tendencies_list, timestep, coefficients):
+    """Return the new state using Adams-Bashforth with the given
+    coefficients, most recent tendency first. tendencies_list should be a
+    list of dictionaries whose values are tendencies in units/second (from
+    oldest to newest), and timestep should be a timedelta object."""
+    return_state = {}
+    for key in tendencies_list[0].keys():
+        tendency = coefficients[0]*tendencies_list[-1][key]
+        for i in range(1, len(coefficients)):
+            tendency = tendency + coefficients[i]*tendencies_list[-1 - i][key]
+        return_state[key] = state[key] + timestep.total_seconds()*tendency
+    return return_state
+
+
 def step_forward_euler(state, tendencies, timestep):
     return_state = {}
     for key in tendencies.keys():
@@ -383,3 +805,970 @@ def fourth_bashforth(state, tendencies_list, timestep):
             37./24*tendencies_list[-3][key] - 3./8*tendencies_list[-4][key]
         )
     return return_state
+
+
+class MultiStageTimeStepper(TimeStepper):
+    """
+    A TimeStepper which evaluates its Prognostic components at several
+    intermediate stages within each timestep, storing the intermediate
+    values in arrays which are allocated once and reused every step.
+
+    If the state has a "time" quantity, it is advanced to the time of each
+    intermediate stage in the state given to the Prognostic components.
+    """
+
+    __metaclass__ = abc.ABCMeta
+
+    def __init__(self, prognostic_list, n_buffers):
+        self._n_buffers = n_buffers
+        self._buffers = None
+        super(MultiStageTimeStepper, self).__init__(prognostic_list)
+
+    def _evaluate(self, state):
+        """
+        Gets tendencies for the state, returning dictionaries of numpy arrays
+        of the stepped quantities and of their tendencies in units/second,
+        and the diagnostics. These are single buffers if state is a
+        PackedState which can be stepped as a whole.
+        """
+        tendencies, diagnostics = self._prognostic(state)
+        convert_tendencies_units_for_state(tendencies, state)
+        step_state, step_tendencies = get_packed_step_arguments(
+            state, tendencies)
+        if step_state is state:
+            step_state = {}
+            step_tendencies = {}
+            for key in tendencies.keys():
+                step_state[key] = np.asarray(
+                    getattr(state[key], 'values', state[key]))
+                step_tendencies[key] = get_values_like(
+                    tendencies[key], state[key])
+        return step_state, step_tendencies, diagnostics
+
+    def _get_buffers(self, values, tendencies):
+        """
+        Returns a list of dictionaries of arrays like each of the values,
+        which are reallocated only if the quantities, shapes or dtypes
+        change.
+        """
+        if self._buffers is None or (
+                set(self._buffers[0].keys()) != set(values.keys())) or any(
+                    self._buffers[0][key].shape != value.shape or
+                    self._buffers[0][key].dtype !=
+                    np.result_type(value.dtype, tendencies[key].dtype)
+                    for key, value in values.items()):
+            self._buffers = []
+            for i in range(self._n_buffers):
+                self._buffers.append({
+                    key: np.empty(
+                        value.shape,
+                        dtype=np.result_type(
+                            value.dtype, tendencies[key].dtype))
+                    for key, value in values.items()})
+        return self._buffers
+
+    def _create_state(self, state, values, time_offset=None):
+        """
+        Returns a copy of state in which the stepped quantities have the
+        given values, and time is advanced by time_offset if given.
+        """
+        if packed_key in values:
+            return_state = state.with_buffer(values[packed_key])
+        else:
+            return_state = state.copy()
+            for key, value in values.items():
+                return_state[key] = replace_values(state[key], value)
+        if time_offset is not None and 'time' in state:
+            return_state['time'] = state['time'] + time_offset
+        return return_state
+
+
+class SSPRungeKutta(MultiStageTimeStepper):
+    """
+    A TimeStepper using a strong stability preserving Runge-Kutta scheme,
+    with either two or three stages (Shu and Osher, 1988).
+
+    References
+    ----------
+    Shu, C.-W., and S. Osher, 1988: Efficient implementation of essentially
+    non-oscillatory shock-capturing schemes. J. Comput. Phys., 77, 439--471,
+    doi: 10.1016/0021-9991(88)90177-5.
+    """
+
+    def __init__(self, prognostic_list, stages=3):
+        """
+        Initialize a strong stability preserving Runge-Kutta time stepper.
+
+        Args
+        ----
+        prognostic_list : iterable of Prognostic or PrognosticComposite
+            Objects used to get tendencies for time stepping. A
+            PrognosticComposite may be given to set its options, such as
+            calling the objects in parallel.
+        stages : int, optional
+            The number of stages to use, either 2 or 3. The scheme with
+            n stages is accurate to order n. Default is 3.
+        """
+        if stages not in (2, 3):
+            raise ValueError('stages must be one of 2 or 3')
+        self._stages = stages
+        super(SSPRungeKutta, self).__init__(prognostic_list, n_buffers=2)
+
+    def __call__(self, state, timestep):
+        """
+        Retrieves any diagnostics and returns a new state corresponding
+        to the next timestep.
+
+        Args
+        ----
+        state : dict
+            The current model state.
+        timestep : timedelta
+            The amount of time to step forward.
+
+        Returns
+        -------
+        diagnostics : dict
+            Diagnostics from the timestep of the input state.
+        new_state : dict
+            The model state at the next timestep.
+        """
+        dt = timestep.total_seconds()
+        values, tendencies, diagnostics = self._evaluate(state)
+        stage_values, scratch = self._get_buffers(values, tendencies)
+        for key in values.keys():
+            np.multiply(tendencies[key], dt, out=stage_values[key])
+            np.add(stage_values[key], values[key], out=stage_values[key])
+        stage_coefficients = ssp_runge_kutta_coefficients[self._stages]
+        new_values = {}
+        for i, (stage_time, initial_weight, stage_weight) in enumerate(
+                stage_coefficients):
+            stage_state = self._create_state(
+                state, stage_values,
+                time_offset=timedelta(seconds=dt*stage_time))
+            _, tendencies, _ = self._evaluate(stage_state)
+            last_stage = (i == len(stage_coefficients) - 1)
+            for key in values.keys():
+                # stage_values = initial_weight*values + stage_weight*(
+                #     stage_values + dt*tendencies)
+                np.multiply(tendencies[key], dt, out=scratch[key])
+                np.add(stage_values[key], scratch[key], out=stage_values[key])
+                if last_stage:
+                    out = np.empty_like(stage_values[key])
+                    new_values[key] = out
+                else:
+                    out = stage_values[key]
+                np.multiply(stage_values[key], stage_weight, out=out)
+                np.multiply(values[key], initial_weight, out=scratch[key])
+                np.add(out, scratch[key], out=out)
+        return diagnostics, self._create_state(state, new_values)
+
+
+# for each stage after the first of the strong stability preserving
+# Runge-Kutta schemes, the stage time as a fraction of the timestep, and
+# the weights of the initial values and of the values from the last stage
+ssp_runge_kutta_coefficients = {
+    2: ((1., 0.5, 0.5),),
+    3: ((1., 0.75, 0.25), (0.5, 1./3, 2./3)),
+}
+
+
+class RK4(MultiStageTimeStepper):
+    """A TimeStepper using the classic fourth-order Runge-Kutta scheme."""
+
+    def __init__(self, prognostic_list):
+        """
+        Initialize a fourth-order Runge-Kutta time stepper.
+
+        Args
+        ----
+        prognostic_list : iterable of Prognostic or PrognosticComposite
+            Objects used to get tendencies for time stepping. A
+            PrognosticComposite may be given to set its options, such as
+            calling the objects in parallel.
+        """
+        super(RK4, self).__init__(prognostic_list, n_buffers=3)
+
+    def __call__(self, state, timestep):
+        """
+        Retrieves any diagnostics and returns a new state corresponding
+        to the next timestep.
+
+        Args
+        ----
+        state : dict
+            The current model state.
+        timestep : timedelta
+            The amount of time to step forward.
+
+        Returns
+        -------
+        diagnostics : dict
+            Diagnostics from the timestep of the input state.
+        new_state : dict
+            The model state at the next timestep.
+        """
+        dt = timestep.total_seconds()
+        values, tendencies, diagnostics = self._evaluate(state)
+        stage_values, tendency_sum, scratch = self._get_buffers(
+            values, tendencies)
+        for key in values.keys():
+            np.copyto(tendency_sum[key], tendencies[key])
+            np.multiply(tendencies[key], 0.5*dt, out=stage_values[key])
+            np.add(stage_values[key], values[key], out=stage_values[key])
+        for stage_time, weight, next_stage_time in (
+                (0.5, 2., 0.5), (0.5, 2., 1.), (1., 1., None)):
+            stage_state = self._create_state(
+                state, stage_values,
+                time_offset=timedelta(seconds=dt*stage_time))
+            _, tendencies, _ = self._evaluate(stage_state)
+            for key in values.keys():
+                if weight == 1.:
+                    np.add(tendency_sum[key], tendencies[key],
+                           out=tendency_sum[key])
+                else:
+                    np.multiply(tendencies[key], weight, out=scratch[key])
+                    np.add(tendency_sum[key], scratch[key],
+                           out=tendency_sum[key])
+                if next_stage_time is not None:
+                    np.multiply(
+                        tendencies[key], next_stage_time*dt,
+                        out=stage_values[key])
+                    np.add(stage_values[key], values[key],
+                           out=stage_values[key])
+        new_values = {}
+        for key in values.keys():
+            new_values[key] = np.empty_like(tendency_sum[key])
+            np.multiply(tendency_sum[key], dt/6., out=new_values[key])
+            np.add(new_values[key], values[key], out=new_values[key])
+        return diagnostics, self._create_state(state, new_values)
+
+
+class AdaptiveRungeKutta(MultiStageTimeStepper):
+    """
+    A TimeStepper using the Bogacki-Shampine embedded Runge-Kutta pair of
+    third and second order, which chooses its own substep length to keep an
+    estimate of the local error within given tolerances.
+
+    Each call steps forward by the requested timestep using as many
+    substeps as needed, and the substep length is carried between calls.
+    The substeps are longer when the state is changing slowly, so fewer
+    evaluations of the Prognostic components are needed.
+
+    If the state has an 'ensemble' dimension, as created by
+    :py:func:`~sympl.stack_ensemble`, the tolerances must be met by the
+    error of each ensemble member, so that all members share substeps at
+    least as short as each would need on its own.
+
+    Attributes
+    ----------
+    accepted_steps : int
+        The total number of substeps taken.
+    rejected_steps : int
+        The total number of substeps rejected for exceeding the error
+        tolerance, which were retried with a shorter substep.
+    substep : timedelta or None
+        The length of the next substep to attempt.
+
+    References
+    ----------
+    Bogacki, P., and L. F. Shampine, 1989: A 3(2) pair of Runge-Kutta
+    formulas. Appl. Math. Lett., 2, 321--325,
+    doi: 10.1016/0893-9659(89)90079-7.
+    """
+
+    def __init__(
+            self, prognostic_list, atol=1e-6, rtol=1e-3, initial_substep=None,
+            min_substep=None, safety_factor=0.9):
+        """
+        Initialize an adaptive Runge-Kutta time stepper.
+
+        Args
+        ----
+        prognostic_list : iterable of Prognostic or PrognosticComposite
+            Objects used to get tendencies for time stepping. A
+            PrognosticComposite may be given to set its options, such as
+            calling the objects in parallel.
+        atol : float or dict, optional
+            The absolute error tolerance, in the units of each quantity in
+            the state. May be a dictionary whose keys are quantity names,
+            in which case quantities not in the dictionary use 1e-6.
+            Default is 1e-6.
+        rtol : float or dict, optional
+            The relative error tolerance. May be a dictionary whose keys are
+            quantity names, in which case quantities not in the dictionary
+            use 1e-3. Default is 1e-3.
+        initial_substep : timedelta, optional
+            The length of the first substep to attempt. By default the first
+            timestep is attempted in one substep.
+        min_substep : timedelta, optional
+            The shortest substep to allow. By default substeps may be as
+            short as a 1e-10 fraction of the timestep.
+        safety_factor : float, optional
+            The factor by which the substep length estimated to meet the
+            tolerances is reduced. Default is 0.9.
+        """
+        self._atol = atol
+        self._rtol = rtol
+        self.substep = initial_substep
+        self._min_substep = min_substep
+        self._safety_factor = safety_factor
+        self.accepted_steps = 0
+        self.rejected_steps = 0
+        super(AdaptiveRungeKutta, self).__init__(prognostic_list, n_buffers=7)
+
+    def __call__(self, state, timestep):
+        """
+        Retrieves any diagnostics and returns a new state corresponding
+        to the next timestep.
+
+        Args
+        ----
+        state : dict
+            The current model state.
+        timestep : timedelta
+            The amount of time to step forward.
+
+        Returns
+        -------
+        diagnostics : dict
+            Diagnostics from the timestep of the input state.
+        new_state : dict
+            The model state at the next timestep.
+
+        Raises
+        ------
+        RuntimeError
+            If the error tolerances cannot be met with a substep of at least
+            the minimum substep length.
+        """
+        total = timestep.total_seconds()
+        if self._min_substep is None:
+            min_substep = 1e-10*total
+        else:
+            min_substep = self._min_substep.total_seconds()
+        if self.substep is None:
+            proposed = total
+        else:
+            proposed = self.substep.total_seconds()
+        values, tendencies, diagnostics = self._evaluate(state)
+        (values_now, values_next, stage_values, error, scratch,
+         first_tendencies, last_tendencies) = self._get_buffers(
+            values, tendencies)
+        tolerances = self._get_tolerances(state, values)
+        for key in values.keys():
+            np.copyto(values_now[key], values[key])
+            np.copyto(first_tendencies[key], tendencies[key])
+        elapsed = 0.
+        while total - elapsed > 1e-12*total:
+            h = min(proposed, total - elapsed)
+            error_norm = self._attempt_substep(
+                state, values_now, values_next, stage_values, error, scratch,
+                first_tendencies, last_tendencies, tolerances, elapsed, h)
+            if error_norm == 0.:
+                factor = 5.
+            elif np.isfinite(error_norm):
+                factor = min(5., max(
+                    0.2, self._safety_factor*error_norm**(-1./3)))
+            else:
+                factor = 0.2
+            if error_norm <= 1.:
+                self.accepted_steps += 1
+                elapsed += h
+                values_now, values_next = values_next, values_now
+                # the last tendencies are the first of the next substep
+                first_tendencies, last_tendencies = (
+                    last_tendencies, first_tendencies)
+                if h < proposed:  # shortened to end at the timestep
+                    proposed = max(proposed, h*factor)
+                else:
+                    proposed = h*factor
+            else:
+                self.rejected_steps += 1
+                proposed = h*factor
+                if proposed < min_substep:
+                    raise RuntimeError(
+                        'substep length fell below the minimum of {} seconds '
+                        'without meeting the error tolerances'.format(
+                            min_substep))
+        self.substep = timedelta(seconds=proposed)
+        new_values = {}
+        for key in values.keys():
+            new_values[key] = values_now[key].copy()
+        return diagnostics, self._create_state(state, new_values)
+
+    def get_checkpoint_state(self):
+        checkpoint = super(AdaptiveRungeKutta, self).get_checkpoint_state()
+        checkpoint.update({
+            'substep': self.substep,
+            'accepted_steps': self.accepted_steps,
+            'rejected_steps': self.rejected_steps,
+        })
+        return checkpoint
+
+    def set_checkpoint_state(self, checkpoint):
+        super(AdaptiveRungeKutta, self).set_checkpoint_state(checkpoint)
+        self.substep = checkpoint['substep']
+        self.accepted_steps = checkpoint['accepted_steps']
+        self.rejected_steps = checkpoint['rejected_steps']
+
+    def _attempt_substep(
+            self, state, values_now, values_next, stage_values, error, scratch,
+            first_tendencies, last_tendencies, tolerances, elapsed, h):
+        """
+        Computes the values after a substep of h seconds starting elapsed
+        seconds after the time of state into values_next, and the tendencies
+        at those values into last_tendencies. Returns the root-mean-square error
+        estimate relative to the tolerances, which is the largest of the
+        root-mean-square errors of each ensemble member if the state has an
+        ensemble dimension.
+        """
+        for key in values_now.keys():
+            np.multiply(first_tendencies[key], 2./9*h, out=values_next[key])
+            np.add(values_next[key], values_now[key], out=values_next[key])
+            np.multiply(first_tendencies[key], -5./72*h, out=error[key])
+            np.multiply(first_tendencies[key], 0.5*h, out=stage_values[key])
+            np.add(stage_values[key], values_now[key], out=stage_values[key])
+        for stage_time, next_weight, error_weight, next_stage_time in (
+                (0.5, 1./3, 1./12, 0.75), (0.75, 4./9, 1./9, None)):
+            _, tendencies, _ = self._evaluate(self._create_state(
+                state, stage_values,
+                time_offset=timedelta(seconds=elapsed + stage_time*h)))
+            for key in values_now.keys():
+                np.multiply(tendencies[key], next_weight*h, out=scratch[key])
+                np.add(values_next[key], scratch[key], out=values_next[key])
+                np.multiply(tendencies[key], error_weight*h, out=scratch[key])
+                np.add(error[key], scratch[key], out=error[key])
+                if next_stage_time is not None:
+                    np.multiply(
+                        tendencies[key], next_stage_time*h,
+                        out=stage_values[key])
+                    np.add(stage_values[key], values_now[key],
+                           out=stage_values[key])
+        _, tendencies, _ = self._evaluate(self._create_state(
+            state, values_next, time_offset=timedelta(seconds=elapsed + h)))
+        squared_sum = 0.
+        size = 0
+        for key in values_now.keys():
+            np.copyto(last_tendencies[key], tendencies[key])
+            np.multiply(tendencies[key], -1./8*h, out=scratch[key])
+            np.add(error[key], scratch[key], out=error[key])
+            # scale the error by atol + rtol*max(|y_n|, |y_n+1|)
+            np.abs(values_now[key], out=stage_values[key])
+            np.abs(values_next[key], out=scratch[key])
+            np.maximum(
+                stage_values[key], scratch[key], out=stage_values[key])
+            for region, atol, rtol, member_shape in tolerances[key]:
+                stage_values[key][region] *= rtol
+                stage_values[key][region] += atol
+            np.divide(error[key], stage_values[key], out=error[key])
+            if all(member_shape is None
+                   for _, _, _, member_shape in tolerances[key]):
+                squared_sum += np.sum(np.square(error[key]))
+                size += error[key].size
+                continue
+            # sum the squared error of each ensemble member separately
+            for region, _, _, member_shape in tolerances[key]:
+                squared = np.square(error[key][region])
+                if member_shape is None:
+                    squared_sum += np.sum(squared)
+                    size += squared.size
+                else:
+                    squared_sum += np.sum(
+                        squared.reshape(member_shape), axis=(0, 2))
+                    size += squared.size // member_shape[1]
+        if size == 0:
+            return 0.
+        return np.sqrt(np.max(squared_sum)/size)
+
+    def _get_tolerances(self, state, values):
+        """
+        Returns a dictionary with a list of (region, atol, rtol, member_shape)
+        for each of the values, where region indexes the part of the array
+        with those tolerances. If the quantity in that region has an ensemble
+        dimension, member_shape is a shape to which the region can be
+        reshaped so that its second axis is the ensemble dimension, and
+        otherwise it is None.
+        """
+        if packed_key in values:
+            names = state.packed_names
+        else:
+            names = values.keys()
+        regions = {}
+        for name in names:
+            if isinstance(self._atol, dict):
+                atol = self._atol.get(name, 1e-6)
+            else:
+                atol = self._atol
+            if isinstance(self._rtol, dict):
+                rtol = self._rtol.get(name, 1e-3)
+            else:
+                rtol = self._rtol
+            dims = getattr(state[name], 'dims', ())
+            if ensemble_dim_name in dims:
+                shape = state[name].shape
+                axis = dims.index(ensemble_dim_name)
+                member_shape = (
+                    int(np.prod(shape[:axis])), shape[axis],
+                    int(np.prod(shape[axis + 1:])))
+            else:
+                member_shape = None
+            if packed_key in values:
+                regions.setdefault(packed_key, []).append(
+                    (state.get_slice(name), atol, rtol, member_shape))
+            else:
+                regions[name] = [(Ellipsis, atol, rtol, member_shape)]
+        return regions
+
+
+class MultiRateTimeStepper(TimeStepper):
+    """
+    A TimeStepper which calls groups of Prognostic components at different
+    rates, so that expensive slowly-varying components can be called less
+    often than cheap fast-varying ones.
+
+    Each timestep is divided into substeps, whose number is the largest
+    number of substeps given for any group. The group(s) with the most
+    substeps are stepped every substep by an inner TimeStepper. The
+    tendencies from each other group are computed at the start of each of
+    its own substeps and included in the inner stepping as a forcing, which
+    is either held fixed or linearly extrapolated in time from the last two
+    times the group was called.
+
+    If the state has a "time" quantity, it is advanced to the start of each
+    substep in the state given to the components, and the returned state has
+    the same time as the input state.
+    """
+
+    def __init__(
+            self, groups, time_stepper_class=None, extrapolate=False):
+        """
+        Initialize a multi-rate time stepper.
+
+        Args
+        ----
+        groups : iterable of (iterable of Prognostic, int)
+            Pairs of a list of Prognostic components and the number of times
+            they are called per timestep. The largest number of substeps
+            must be a multiple of all the others.
+        time_stepper_class : type, optional
+            The TimeStepper class used to step the fastest group at each
+            substep, which must accept a list of Prognostic components as its
+            only argument. Default is SSPRungeKutta.
+        extrapolate : bool, optional
+            If True, the tendencies from slower groups are linearly
+            extrapolated in time from the last two times they were computed,
+            instead of being held fixed. Default is False.
+
+        Raises
+        ------
+        ValueError
+            If a number of substeps is not a positive integer, or the largest
+            number of substeps is not a multiple of the others.
+        """
+        groups = [(tuple(prognostic_list), substeps)
+                  for prognostic_list, substeps in groups]
+        if len(groups) == 0:
+            raise ValueError('at least one group must be given')
+        for prognostic_list, substeps in groups:
+            if not isinstance(substeps, int) or substeps < 1:
+                raise ValueError(
+                    'number of substeps must be a positive integer')
+        self._substeps = max(substeps for _, substeps in groups)
+        if any(self._substeps % substeps != 0 for _, substeps in groups):
+            raise ValueError(
+                'the largest number of substeps ({}) must be a multiple of '
+                'the number of substeps of every group'.format(self._substeps))
+        if time_stepper_class is None:
+            time_stepper_class = SSPRungeKutta
+        self._slow_groups = []
+        fast_prognostics = []
+        for prognostic_list, substeps in groups:
+            if substeps == self._substeps:
+                fast_prognostics.extend(prognostic_list)
+            else:
+                self._slow_groups.append(SlowTendencyGroup(
+                    PrognosticComposite(*prognostic_list),
+                    self._substeps // substeps))
+        self._forcing = SlowTendencyForcing(self._slow_groups, extrapolate)
+        self._time_stepper = time_stepper_class(
+            fast_prognostics + [self._forcing])
+        self._elapsed = 0.
+        super(MultiRateTimeStepper, self).__init__(
+            [prognostic for prognostic_list, _ in groups
+             for prognostic in prognostic_list])
+
+    def __call__(self, state, timestep):
+        """
+        Retrieves any diagnostics and returns a new state corresponding
+        to the next timestep.
+
+        Args
+        ----
+        state : dict
+            The current model state.
+        timestep : timedelta
+            The amount of time to step forward.
+
+        Returns
+        -------
+        diagnostics : dict
+            Diagnostics from the timestep of the input state.
+        new_state : dict
+            The model state at the next timestep.
+        """
+        substep = timestep.total_seconds()/self._substeps
+        original_time = state.get('time', None)
+        diagnostics = {}
+        for i in range(self._substeps):
+            substep_start = self._elapsed + i*substep
+            if i > 0 and 'time' in state:
+                # state is a new dictionary returned by the inner stepper
+                state['time'] = original_time + timedelta(seconds=i*substep)
+            for group in self._slow_groups:
+                if i % group.stride == 0:
+                    group_diagnostics = group.update(state, substep_start)
+                    if i == 0:
+                        diagnostics.update(group_diagnostics)
+            # a forcing linear in time is integrated exactly over the substep
+            # by its value at the midpoint
+            self._forcing.time = substep_start + 0.5*substep
+            substep_diagnostics, state = self._time_stepper(
+                state, timedelta(seconds=substep))
+            if i == 0:
+                diagnostics.update(substep_diagnostics)
+        if 'time' in state:
+            state['time'] = original_time
+        self._elapsed += timestep.total_seconds()
+        return diagnostics, state
+
+    def get_checkpoint_state(self):
+        checkpoint = super(MultiRateTimeStepper, self).get_checkpoint_state()
+        checkpoint.update({
+            'elapsed': self._elapsed,
+            'time_stepper': get_component_checkpoint(self._time_stepper),
+            'slow_groups': [
+                group.get_checkpoint_state() for group in self._slow_groups],
+        })
+        return checkpoint
+
+    def set_checkpoint_state(self, checkpoint):
+        super(MultiRateTimeStepper, self).set_checkpoint_state(checkpoint)
+        self._elapsed = checkpoint['elapsed']
+        set_component_checkpoint(
+            self._time_stepper, checkpoint['time_stepper'])
+        for group, group_checkpoint in zip(
+                self._slow_groups, checkpoint['slow_groups']):
+            group.set_checkpoint_state(group_checkpoint)
+
+
+class SlowTendencyGroup(object):
+    """
+    Holds the last two sets of tendencies computed by a group of Prognostic
+    components in a MultiRateTimeStepper, and the times they were computed.
+    """
+
+    def __init__(self, prognostic, stride):
+        self.prognostic = prognostic
+        self.stride = stride
+        self.tendencies = None
+        self.time = None
+        self.previous_tendencies = None
+        self.previous_time = None
+
+    def update(self, state, time):
+        """
+        Computes and stores tendencies for the state at the given time in
+        seconds, returning the diagnostics.
+        """
+        tendencies, diagnostics = self.prognostic(state)
+        convert_tendencies_units_for_state(tendencies, state)
+        self.previous_tendencies, self.previous_time = (
+            self.tendencies, self.time)
+        self.tendencies, self.time = tendencies, time
+        return diagnostics
+
+    def get_checkpoint_state(self):
+        return copy.deepcopy({
+            'tendencies': self.tendencies,
+            'time': self.time,
+            'previous_tendencies': self.previous_tendencies,
+            'previous_time': self.previous_time,
+        })
+
+    def set_checkpoint_state(self, checkpoint):
+        checkpoint = copy.deepcopy(checkpoint)
+        self.tendencies = checkpoint['tendencies']
+        self.time = checkpoint['time']
+        self.previous_tendencies = checkpoint['previous_tendencies']
+        self.previous_time = checkpoint['previous_time']
+
+    def get_tendencies(self, time, extrapolate):
+        """
+        Returns new arrays of the tendencies at the given time in seconds,
+        extrapolated from the last two sets of tendencies if extrapolate is
+        True and there are two sets.
+        """
+        return_tendencies = {}
+        for key, value in self.tendencies.items():
+            if (extrapolate and self.previous_tendencies is not None and
+                    key in self.previous_tendencies):
+                slope_factor = (time - self.time)/(
+                    self.time - self.previous_time)
+                return_tendencies[key] = value + slope_factor*(
+                    value - self.previous_tendencies[key])
+                if isinstance(value, DataArray):
+                    return_tendencies[key].attrs = value.attrs.copy()
+            else:
+                return_tendencies[key] = value.copy()
+        return return_tendencies
+
+
+class SlowTendencyForcing(Prognostic):
+    """
+    A Prognostic returning the sum of the tendencies held by the slower
+    groups of a MultiRateTimeStepper at the time given by its time attribute.
+    """
+
+    def __init__(self, groups, extrapolate):
+        self._groups = groups
+        self._extrapolate = extrapolate
+        self.time = None
+
+    def __call__(self, state):
+        return_tendencies = {}
+        for group in self._groups:
+            update_dict_by_adding_another(
+                return_tendencies,
+                group.get_tendencies(self.time, self._extrapolate))
+        return return_tendencies, {}
+
+
+class IMEXTimeStepper(TimeStepper):
+    """
+    A TimeStepper which treats a list of Implicit or ImplicitPrognostic
+    components implicitly and a list of Prognostic components explicitly,
+    so that stiff processes do not limit the timestep.
+
+    Two schemes are available. "strang" uses Strang splitting, applying the
+    implicit components for half a timestep before and after stepping the
+    Prognostic components with an explicit TimeStepper, and can be used with
+    any implicit components. "ars222" uses the second-order IMEX Runge-Kutta
+    scheme ARS(2,2,2) of Ascher et al. (1997), which couples the implicit and
+    explicit terms within each stage. It assumes each implicit component
+    solves the backward Euler problem x_new = x + timestep*L(x_new) for its
+    tendency L, which it uses to solve the implicit stages.
+
+    If the state has a "time" quantity, it is advanced to the time of each
+    stage in the state given to the components, and the returned state has
+    the same time as the input state.
+
+    References
+    ----------
+    Ascher, U. M., S. J. Ruuth, and R. J. Spiteri, 1997: Implicit-explicit
+    Runge-Kutta methods for time-dependent partial differential equations.
+    Appl. Numer. Math., 25, 151--167, doi: 10.1016/S0168-9274(97)00056-1.
+    """
+
+    def __init__(
+            self, implicit_list, prognostic_list, scheme='strang',
+            time_stepper_class=None):
+        """
+        Initialize an implicit-explicit time stepper.
+
+        Args
+        ----
+        implicit_list : iterable of Implicit or ImplicitPrognostic
+            Objects treated implicitly, which are applied in turn.
+        prognostic_list : iterable of Prognostic or PrognosticComposite
+            Objects used to get tendencies treated explicitly.
+        scheme : str, optional
+            Either "strang" or "ars222". Default is "strang".
+        time_stepper_class : type, optional
+            For the "strang" scheme, the TimeStepper class used to step the
+            Prognostic components, which must accept a list of Prognostic
+            components as its only argument. Default is SSPRungeKutta.
+        """
+        if scheme not in ('strang', 'ars222'):
+            raise ValueError(
+                "scheme must be one of 'strang' or 'ars222', got "
+                "{}".format(scheme))
+        self._scheme = scheme
+        self._implicit_list = tuple(implicit_list)
+        if not isinstance(prognostic_list, PrognosticComposite):
+            prognostic_list = tuple(prognostic_list)
+        if scheme == 'strang':
+            if time_stepper_class is None:
+                time_stepper_class = SSPRungeKutta
+            self._explicit_time_stepper = time_stepper_class(prognostic_list)
+        super(IMEXTimeStepper, self).__init__(prognostic_list)
+
+    @property
+    def inputs(self):
+        return tuple(set(self._prognostic.inputs).union(
+            *[component.inputs for component in self._implicit_list]))
+
+    @property
+    def outputs(self):
+        return tuple(set(self._prognostic.tendencies).union(
+            self._get_implicit_outputs()))
+
+    @property
+    def diagnostics(self):
+        return tuple(set(self._prognostic.diagnostics).union(
+            *[component.diagnostics for component in self._implicit_list]))
+
+    def __call__(self, state, timestep):
+        """
+        Retrieves any diagnostics and returns a new state corresponding
+        to the next timestep.
+
+        Args
+        ----
+        state : dict
+            The current model state.
+        timestep : timedelta
+            The amount of time to step forward.
+
+        Returns
+        -------
+        diagnostics : dict
+            Diagnostics from the components at the first time they are
+            called, which for the implicit components of the "ars222" scheme
+            and the explicit components of the "strang" scheme is at an
+            intermediate stage rather than the input state.
+        new_state : dict
+            The model state at the next timestep.
+        """
+        if self._scheme == 'strang':
+            diagnostics, new_state = self._perform_strang_step(
+                state, timestep)
+        else:
+            diagnostics, new_state = self._perform_ars222_step(
+                state, timestep)
+        if 'time' in state:
+            new_state['time'] = state['time']
+        return diagnostics, new_state
+
+    def get_checkpoint_state(self):
+        checkpoint = super(IMEXTimeStepper, self).get_checkpoint_state()
+        checkpoint['implicit'] = [
+            get_component_checkpoint(component)
+            for component in self._implicit_list]
+        if self._scheme == 'strang':
+            checkpoint['explicit_time_stepper'] = get_component_checkpoint(
+                self._explicit_time_stepper)
+        return checkpoint
+
+    def set_checkpoint_state(self, checkpoint):
+        super(IMEXTimeStepper, self).set_checkpoint_state(checkpoint)
+        for component, component_checkpoint in zip(
+                self._implicit_list, checkpoint['implicit']):
+            set_component_checkpoint(component, component_checkpoint)
+        if self._scheme == 'strang':
+            set_component_checkpoint(
+                self._explicit_time_stepper,
+                checkpoint['explicit_time_stepper'])
+
+    def _perform_strang_step(self, state, timestep):
+        half_timestep = timedelta(seconds=0.5*timestep.total_seconds())
+        diagnostics, half_state = self._apply_implicit(state, half_timestep)
+        explicit_diagnostics, explicit_state = self._explicit_time_stepper(
+            half_state, timestep)
+        diagnostics.update(explicit_diagnostics)
+        if 'time' in state:
+            explicit_state['time'] = state['time'] + half_timestep
+        _, new_state = self._apply_implicit(explicit_state, half_timestep)
+        return diagnostics, new_state
+
+    def _perform_ars222_step(self, state, timestep):
+        h = timestep.total_seconds()
+        gamma = 1. - 1./np.sqrt(2.)
+        delta = 1. - 1./(2.*gamma)
+        first_tendencies, diagnostics = self._prognostic(state)
+        convert_tendencies_units_for_state(first_tendencies, state)
+        stage_input = self._create_stage_input(
+            state, [(first_tendencies, gamma*h)], gamma*h)
+        implicit_diagnostics, stage_state = self._apply_implicit(
+            stage_input, timedelta(seconds=gamma*h))
+        diagnostics.update(implicit_diagnostics)
+        implicit_tendencies = {}
+        for key in self._get_implicit_outputs():
+            if key in stage_state:
+                implicit_tendencies[key] = (
+                    stage_state[key] - stage_input[key])/(gamma*h)
+        second_tendencies, _ = self._prognostic(stage_state)
+        convert_tendencies_units_for_state(second_tendencies, stage_state)
+        stage_input = self._create_stage_input(
+            state, [(first_tendencies, delta*h),
+                    (second_tendencies, (1. - delta)*h),
+                    (implicit_tendencies, (1. - gamma)*h)], h)
+        # the scheme is stiffly accurate, so the last stage is the new state
+        _, new_state = self._apply_implicit(
+            stage_input, timedelta(seconds=gamma*h))
+        return diagnostics, new_state
+
+    def _create_stage_input(self, state, weighted_tendencies, time_offset):
+        """
+        Returns a copy of state to which each dictionary of tendencies in
+        weighted_tendencies is added, multiplied by its weight in seconds,
+        with time advanced by time_offset seconds.
+        """
+        return_state = state.copy()
+        return_state.update(
+            step_weighted_tendencies(state, weighted_tendencies))
+        if 'time' in state:
+            return_state['time'] = state['time'] + timedelta(
+                seconds=time_offset)
+        return return_state
+
+    def _get_implicit_outputs(self):
+        outputs = set()
+        for component in self._implicit_list:
+            if isinstance(component, ImplicitPrognostic):
+                outputs.update(component.tendencies)
+            else:
+                outputs.update(component.outputs)
+        return outputs
+
+    def _apply_implicit(self, state, timestep):
+        """
+        Applies each implicit component in turn over the timestep, returning
+        the diagnostics and a copy of state containing the new values.
+        """
+        diagnostics = {}
+        state = state.copy()
+        for component in self._implicit_list:
+            if isinstance(component, ImplicitPrognostic):
+                tendencies, component_diagnostics = component(state, timestep)
+                convert_tendencies_units_for_state(tendencies, state)
+                new_values = step_forward_euler(state, tendencies, timestep)
+            else:
+                component_diagnostics, new_values = component(state, timestep)
+                for key, value in new_values.items():
+                    if (isinstance(value, DataArray) and
+                            'units' in value.attrs and key in state and
+                            'units' in getattr(state[key], 'attrs', {})):
+                        new_values[key] = value.to_units(
+                            state[key].attrs['units'])
+            diagnostics.update(component_diagnostics)
+            state.update(new_values)
+        return diagnostics, state
+
+
+def step_weighted_tendencies(state, weighted_tendencies):
+    """
+    Returns a dictionary containing, for every quantity with a tendency in
+    any of the dictionaries of tendencies in weighted_tendencies, the value
+    in state plus the sum of its tendencies each multiplied by their weight.
+    weighted_tendencies should be an iterable of (tendencies, weight) pairs
+    with tendencies in units/second and weights in seconds.
+    """
+    return_state = {}
+    for tendencies, weight in weighted_tendencies:
+        for key in tendencies.keys():
+            if key not in return_state:
+                return_state[key] = state[key] + weight*tendencies[key]
+            else:
+                return_state[key] = return_state[key] + weight*tendencies[key]
+    return return_state
@@ -1,22 +1,155 @@
 # -*- coding: utf-8 -*-
-import pint
+import threading
+import numpy as np
+from .cache import PlanCache
+from .profiling import profile_overhead
 
+_unit_registry = None
+_unit_registry_lock = threading.Lock()
 
-class UnitRegistry(pint.UnitRegistry):
 
-    def __call__(self, input_string, **kwargs):
-        return super(UnitRegistry, self).__call__(
-            input_string.replace(
-                u'%', 'percent').replace(
-                u'°', 'degree'
-            ),
-            **kwargs)
+def get_unit_registry():
+    """
+    Returns the pint UnitRegistry used by sympl. Importing pint and building
+    the registry is slow, so this is only done the first time it is needed.
+    """
+    global _unit_registry
+    if _unit_registry is None:
+        with _unit_registry_lock:
+            if _unit_registry is None:
+                _unit_registry = create_unit_registry()
+    return _unit_registry
 
 
-unit_registry = UnitRegistry()
-unit_registry.define('degrees_north = degree_north = degree_N = degrees_N = degreeN = degreesN')
-unit_registry.define('degrees_east = degree_east = degree_E = degrees_E = degreeE = degreesE')
-unit_registry.define('percent = 0.01*count = %')
+def create_unit_registry():
+    import pint
+
+    class UnitRegistry(pint.UnitRegistry):
+
+        def __call__(self, input_string, **kwargs):
+            return super(UnitRegistry, self).__call__(
+                input_string.replace(
+                    u'%', 'percent').replace(
+                    u'°', 'degree'
+                ),
+                **kwargs)
+
+    registry = UnitRegistry()
+    registry.define('degrees_north = degree_north = degree_N = degrees_N = degreeN = degreesN')
+    registry.define('degrees_east = degree_east = degree_E = degrees_E = degreeE = degreesE')
+    registry.define('percent = 0.01*count = %')
+    return registry
+
+
+class LazyUnitRegistry(object):
+    """
+    Stands in for the pint UnitRegistry returned by get_unit_registry, which
+    is only created when this object is first called or has an attribute
+    retrieved.
+    """
+
+    def __call__(self, *args, **kwargs):
+        return get_unit_registry()(*args, **kwargs)
+
+    def __getattr__(self, item):
+        return getattr(get_unit_registry(), item)
+
+
+unit_registry = LazyUnitRegistry()
+
+conversion_plan_cache = PlanCache(maxsize=256)
+
+
+class UnitConversionPlan(object):
+    """
+    An affine conversion new_value = scale*value + offset from one unit to
+    another, resolved once so that it can be applied to raw numpy arrays
+    without going through pint.
+
+    Attributes
+    ----------
+    scale : float
+        The factor by which values are multiplied.
+    offset : float
+        The value added after scaling. Non-zero only for offset units, such
+        as degC to K.
+    """
+
+    __slots__ = ('scale', 'offset')
+
+    def __init__(self, scale, offset=0.):
+        self.scale = scale
+        self.offset = offset
+
+    @property
+    def is_identity(self):
+        return self.scale == 1. and self.offset == 0.
+
+    def apply(self, value, out=None):
+        """
+        Returns the converted value. If out is given, it should be a numpy
+        array into which the converted value is written, and which is
+        returned. Otherwise a new object is returned.
+        """
+        if out is None:
+            if self.offset == 0.:
+                return value*self.scale
+            else:
+                return value*self.scale + self.offset
+        elif self.is_identity:
+            if out is not value:
+                np.copyto(out, value)
+        else:
+            np.multiply(value, self.scale, out=out)
+            if self.offset != 0.:
+                np.add(out, self.offset, out=out)
+        return out
+
+    def __repr__(self):
+        return 'UnitConversionPlan(scale={!r}, offset={!r})'.format(
+            self.scale, self.offset)
+
+
+def create_conversion_plan(from_units, to_units):
+    """
+    Resolves the scale and offset of the conversion from from_units to
+    to_units using the unit registry.
+
+    Raises
+    ------
+    ValueError
+        If the units are not compatible.
+    pint.UndefinedUnitError
+        If either unit string is not recognized.
+    """
+    from pint import DimensionalityError
+    registry = get_unit_registry()
+    from_quantity = registry(from_units)
+    to_quantity = registry(to_units)
+    # the scale is the ratio of the factors to the root units, which are
+    # multiplicative even for offset units, and only the zero point goes
+    # through the offset conversion, so no precision is lost by subtracting
+    # two converted values
+    try:
+        zero = registry.Quantity(0., from_quantity.units).to(
+            to_quantity.units).magnitude
+    except DimensionalityError as err:
+        raise ValueError(str(err))
+    from_factor, _ = registry.get_root_units(from_quantity.units)
+    to_factor, _ = registry.get_root_units(to_quantity.units)
+    scale = (
+        from_factor*from_quantity.magnitude)/(to_factor*to_quantity.magnitude)
+    offset = zero/to_quantity.magnitude
+    return UnitConversionPlan(float(scale), float(offset))
+
+
+def get_conversion_plan(from_units, to_units):
+    """
+    Returns a UnitConversionPlan from from_units to to_units, using a cached
+    plan if this conversion has been requested before.
+    """
+    return conversion_plan_cache.get(
+        (from_units, to_units), create_conversion_plan, from_units, to_units)
 
 
 def is_valid_unit(unit_string):
@@ -24,25 +157,70 @@ def is_valid_unit(unit_string):
     unit_string = unit_string.replace(
         '%', 'percent').replace(
         '°', 'degree')
+    from pint import UndefinedUnitError
     try:
-        unit_registry(unit_string)
-    except pint.UndefinedUnitError:
+        get_unit_registry()(unit_string)
+    except UndefinedUnitError:
         return False
     else:
         return True
 
 
-def data_array_to_units(value, units):
+@profile_overhead('unit_conversion')
+def data_array_to_units(value, units, inplace=False, out=None):
     if not hasattr(value, 'attrs') or 'units' not in value.attrs:
         raise TypeError(
             'Cannot retrieve units from type {}'.format(type(value)))
-    elif unit_registry(value.attrs['units']) != unit_registry(units):
+    if inplace and out is not None:
+        raise ValueError('out cannot be given when converting in-place')
+    plan = get_conversion_plan(value.attrs['units'], units)
+    if inplace:
+        out = value
+    if out is not None:
+        ensure_can_hold_conversion(value, out, plan)
+        plan.apply(value.values, out=out.values)
         attrs = value.attrs.copy()
-        value = (unit_registry(value.attrs['units'])*value).to(units).magnitude
         attrs['units'] = units
-        value.attrs = attrs
+        out.attrs = attrs
+        return out
+    elif not plan.is_identity:
+        attrs = value.attrs.copy()
+        attrs['units'] = units
+        value = value.__class__(
+            plan.apply(value.values), coords=value.coords, dims=value.dims,
+            name=value.name, attrs=attrs)
     return value
 
 
+def ensure_can_hold_conversion(value, out, plan):
+    """
+    Raises an exception if the DataArray out cannot hold the result of
+    converting the DataArray value using the given UnitConversionPlan.
+
+    Raises
+    ------
+    ValueError
+        If out does not have the same dimensions and shape as value.
+    TypeError
+        If the dtype of out cannot hold the converted values, for example
+        when converting an integer array with a non-integer scale factor.
+    """
+    if out is not value and (
+            out.dims != value.dims or out.shape != value.shape):
+        raise ValueError(
+            'out has dims {} and shape {}, but must match dims {} and '
+            'shape {} of the converted array'.format(
+                out.dims, out.shape, value.dims, value.shape))
+    if plan.is_identity:
+        result_dtype = value.dtype
+    else:
+        result_dtype = np.result_type(value.values, plan.scale, plan.offset)
+    if not np.can_cast(result_dtype, out.dtype, casting='same_kind'):
+        raise TypeError(
+            'Cannot store unit-converted values of dtype {} in an array '
+            'with dtype {}'.format(result_dtype, out.dtype))
+
+
+@profile_overhead('unit_conversion')
 def from_unit_to_another(value, original_units, new_units):
-    return (unit_registry(original_units)*value).to(new_units).magnitude
+    return get_conversion_plan(original_units, new_units).apply(value)
@@ -1,11 +1,17 @@
 from datetime import datetime
+import itertools
+import zlib
 
 import numpy as np
 from six import string_types
 
 from .array import DataArray
+from .cache import PlanCache
+from .profiling import profile_overhead
+from .state import State
 from .exceptions import (
-    SharedKeyError, InvalidStateError, InvalidPropertyDictError)
+    SharedKeyError, InvalidStateError, InvalidPropertyDictError,
+    ArrayCopyError)
 
 try:
     from numba import jit
@@ -18,6 +24,18 @@ except ImportError:
             return signature_or_function
 
 dim_names = {'x': ['x'], 'y': ['y'], 'z': ['z']}
+# dimension along which the members of an ensemble are stacked
+ensemble_dim_name = 'ensemble'
+# incremented whenever dim_names is modified, so cached plans depending on
+# the direction names can be invalidated
+dim_names_version = 0
+
+fingerprint_methods = ('auto', 'version', 'sampled', 'full')
+# used to give a unique fingerprint to values which cannot be fingerprinted
+fingerprint_counter = itertools.count()
+
+array_plan_cache = PlanCache(maxsize=1024)
+restoration_plan_cache = PlanCache(maxsize=1024)
 
 # internal exceptions used only within this module
 
@@ -35,6 +53,8 @@ class ShapeMismatchError(Exception):
 
 
 def ensure_consistent_dimension_lengths(state):
+    if isinstance(state, State):
+        return  # checked when each quantity was inserted
     dimension_lengths = {}
     for name, array in state.items():
         if isinstance(array, DataArray):
@@ -102,7 +122,9 @@ def independent_wildcards_first(item_list):
     return zip(name_list, properties_list)
 
 
-def get_numpy_arrays_with_properties(state, property_dictionary):
+@profile_overhead('marshalling')
+def get_numpy_arrays_with_properties(
+        state, property_dictionary, allow_copy=True, copy_report=None):
     """
     Parameters
     ----------
@@ -118,14 +140,29 @@ def get_numpy_arrays_with_properties(state, property_dictionary):
         is present, its value should be a quantity also present in
         property_dictionary, and it will be ensured that any shared wildcard
         dimensions ('x', 'y', 'z', '*') for this quantity match the same
-        dimensions as the specified quantity.
+        dimensions as the specified quantity. If the optional property
+        "batch_ensemble" is True, an 'ensemble' dimension which is not
+        collected by the dims is added as the first axis of the array.
+    allow_copy : bool, optional
+        If False, an exception is raised when a returned array cannot be a
+        view of the memory of the DataArray in the state, either because
+        its units must be converted or because its memory layout cannot
+        be transposed and reshaped to the requested dims without copying.
+        Default is True.
+    copy_report : dict, optional
+        If given, for each returned array which is a copy rather than a view
+        of state memory, an entry is added with the quantity name as key
+        and a dictionary as value, with 'nbytes' giving the size of the copy
+        in bytes and 'reason' giving 'units' or 'layout' depending on why the
+        copy was made.
 
     Returns
     -------
     out_dict : dict
         A dictionary whose keys are quantity names and values are numpy arrays
         containing the data for those quantities, as specified by
-        property_dictionary.
+        property_dictionary. Arrays are views of the memory of the state
+        wherever possible.
 
     Raises
     ------
@@ -136,6 +173,8 @@ def get_numpy_arrays_with_properties(state, property_dictionary):
     InvalidPropertyError
         If a quantity in property_dictionary is missing values for "dims" or
         "units".
+    ArrayCopyError
+        If allow_copy is False and an array had to be copied.
     """
     ensure_consistent_dimension_lengths(state)
     out_dict = {}
@@ -169,11 +208,13 @@ def get_numpy_arrays_with_properties(state, property_dictionary):
                 out_dict[out_name], matches[quantity_name] = get_numpy_array(
                     quantity_array,
                     out_dims=properties['dims'], return_wildcard_matches=True,
-                    require_wildcard_matches=matches[properties['match_dims_like']])
+                    require_wildcard_matches=matches[properties['match_dims_like']],
+                    batch_ensemble=properties.get('batch_ensemble', False))
             else:
                 out_dict[out_name], matches[quantity_name] = get_numpy_array(
                     quantity_array,
-                    out_dims=properties['dims'], return_wildcard_matches=True)
+                    out_dims=properties['dims'], return_wildcard_matches=True,
+                    batch_ensemble=properties.get('batch_ensemble', False))
         except NoMatchForDirectionError as err:
             raise InvalidStateError(
                 'dimension {} is missing from quantity {}'.format(
@@ -185,13 +226,43 @@ def get_numpy_arrays_with_properties(state, property_dictionary):
                 'quantity to have dimension {} (but it does)'.format(
                     properties['dims'], quantity_name, err)
             )
+        if copy_report is not None or not allow_copy:
+            check_for_array_copy(
+                quantity_name, state[quantity_name], quantity_array,
+                out_dict[out_name], allow_copy, copy_report)
     ensure_dims_like_are_satisfied(matches, property_dictionary)
     return out_dict
 
 
+def check_for_array_copy(
+        quantity_name, state_array, converted_array, numpy_array, allow_copy,
+        copy_report):
+    """
+    Determines whether numpy_array, retrieved from state_array after it was
+    converted to converted_array, is a copy rather than a view of the memory
+    of state_array. If it is, raises ArrayCopyError if allow_copy is False,
+    and otherwise records the copy in copy_report if it is not None.
+    """
+    if numpy_array.nbytes == 0:
+        return
+    elif converted_array is not state_array:
+        reason = 'units'
+    elif not np.may_share_memory(numpy_array, state_array.values):
+        reason = 'layout'
+    else:
+        return
+    if not allow_copy:
+        raise ArrayCopyError(
+            'quantity {} had to be copied ({} bytes) because of its {}'.format(
+                quantity_name, numpy_array.nbytes, reason))
+    elif copy_report is not None:
+        copy_report[quantity_name] = {
+            'nbytes': numpy_array.nbytes, 'reason': reason}
+
+
 def get_numpy_array(
         data_array, out_dims, return_wildcard_matches=False,
-        require_wildcard_matches=None):
+        require_wildcard_matches=None, batch_ensemble=False):
     """
     Retrieve a numpy array with the desired dimensions and dimension order
     from the given DataArray, using transpose and creating length 1 dimensions
@@ -217,6 +288,12 @@ def get_numpy_array(
         A dictionary mapping wildcards to matches. If the wildcard is used in
         out_dims, ensures that it matches the quantities present in this
         dictionary, in the same order.
+    batch_ensemble : bool, optional
+        If True and data_array has an 'ensemble' dimension which is not
+        collected by '*' or listed in out_dims, it is added as the first
+        axis of the output, so that ensemble members are processed as a
+        batch. Otherwise such a dimension raises an exception as any other
+        dimension not in out_dims does. Default is False.
 
     Returns
     -------
@@ -232,46 +309,115 @@ def get_numpy_array(
 
     """
     if (len(data_array.values.shape) == 0) and (len(out_dims) == 0):
-        direction_to_names = {}  # required in case we need wildcard_matches
         return_array = data_array.values  # special case, 0-dimensional scalar array
+        wildcard_matches = {}
     else:
-        current_dim_names = dim_names.copy()
-        for dim in out_dims:
-            if dim not in ('x', 'y', 'z', '*'):
-                current_dim_names[dim] = [dim]
-        direction_to_names = get_input_array_dim_names(
-            data_array, out_dims, current_dim_names)
-        if require_wildcard_matches is not None:
-            for direction in out_dims:
-                if (direction in require_wildcard_matches and
-                        same_list(direction_to_names[direction],
-                                  require_wildcard_matches[direction])):
-                    direction_to_names[direction] = require_wildcard_matches[
-                        direction]
-                else:
-                    # we could raise an exception here, because this is
-                    # inconsistent, but that exception is already raised
-                    # elsewhere when ensure_dims_like_are_satisfied is called
-                    pass
-        target_dimension_order = get_target_dimension_order(
-            out_dims, direction_to_names)
-        for dim in data_array.dims:
-            if dim not in target_dimension_order:
-                raise DimensionNotInOutDimsError(dim)
-        slices_or_none = get_slices_and_placeholder_nones(
-            data_array, out_dims, direction_to_names)
-        final_shape = get_final_shape(data_array, out_dims, direction_to_names)
-        return_array = np.reshape(data_array.transpose(
-            *target_dimension_order).values[slices_or_none], final_shape)
+        plan = get_array_extraction_plan(
+            data_array, out_dims, require_wildcard_matches, batch_ensemble)
+        return_array = plan.apply(data_array.values)
+        wildcard_matches = plan.wildcard_matches
     if return_wildcard_matches:
-        wildcard_matches = {
-            key: value for key, value in direction_to_names.items()
-            if key in ('x', 'y', 'z', '*')}
-        return return_array, wildcard_matches
+        return return_array, wildcard_matches.copy()
     else:
         return return_array
 
 
+class ArrayExtractionPlan(object):
+    """
+    A precomputed recipe for retrieving a numpy array with the desired
+    dimensions from the values of a DataArray, as done by get_numpy_array.
+
+    Attributes
+    ----------
+    transpose_axes : tuple of int
+        The order into which the axes of the input array are transposed.
+    index : tuple
+        Slices spanning each transposed axis, and None wherever a length 1
+        axis must be created.
+    final_shape : tuple of int
+        The shape the indexed array is reshaped to.
+    wildcard_matches : dict
+        A mapping from wildcards ('x', 'y', 'z', or '*') used in out_dims to
+        the dimensions they matched, in order.
+    """
+
+    __slots__ = ('transpose_axes', 'index', 'final_shape', 'wildcard_matches')
+
+    def __init__(self, transpose_axes, index, final_shape, wildcard_matches):
+        self.transpose_axes = transpose_axes
+        self.index = index
+        self.final_shape = final_shape
+        self.wildcard_matches = wildcard_matches
+
+    def apply(self, array):
+        return np.reshape(
+            array.transpose(self.transpose_axes)[self.index], self.final_shape)
+
+
+def get_array_extraction_plan(
+        data_array, out_dims, require_wildcard_matches=None,
+        batch_ensemble=False):
+    """
+    Returns an ArrayExtractionPlan for retrieving data with out_dims from
+    data_array, using a cached plan if one exists for the same dimensions,
+    shape, out_dims, batch_ensemble and direction names.
+    """
+    if require_wildcard_matches is None:
+        required_key = None
+    else:
+        required_key = tuple(
+            (direction, tuple(require_wildcard_matches[direction]))
+            for direction in out_dims if direction in require_wildcard_matches)
+    key = (
+        data_array.dims, data_array.shape, tuple(out_dims), required_key,
+        batch_ensemble, dim_names_version)
+    return array_plan_cache.get(
+        key, create_array_extraction_plan,
+        data_array, out_dims, require_wildcard_matches, batch_ensemble)
+
+
+def create_array_extraction_plan(
+        data_array, out_dims, require_wildcard_matches=None,
+        batch_ensemble=False):
+    if batch_ensemble:
+        out_dims = add_ensemble_dim(data_array.dims, out_dims)
+    current_dim_names = dim_names.copy()
+    for dim in out_dims:
+        if dim not in ('x', 'y', 'z', '*'):
+            current_dim_names[dim] = [dim]
+    direction_to_names = get_input_array_dim_names(
+        data_array, out_dims, current_dim_names)
+    if require_wildcard_matches is not None:
+        for direction in out_dims:
+            if (direction in require_wildcard_matches and
+                    same_list(direction_to_names[direction],
+                              require_wildcard_matches[direction])):
+                direction_to_names[direction] = require_wildcard_matches[
+                    direction]
+            else:
+                # we could raise an exception here, because this is
+                # inconsistent, but that exception is already raised
+                # elsewhere when ensure_dims_like_are_satisfied is called
+                pass
+    target_dimension_order = get_target_dimension_order(
+        out_dims, direction_to_names)
+    for dim in data_array.dims:
+        if dim not in target_dimension_order:
+            raise DimensionNotInOutDimsError(dim)
+    slices_or_none = get_slices_and_placeholder_nones(
+        data_array, out_dims, direction_to_names)
+    final_shape = get_final_shape(data_array, out_dims, direction_to_names)
+    wildcard_matches = {
+        key: value for key, value in direction_to_names.items()
+        if key in ('x', 'y', 'z', '*')}
+    return ArrayExtractionPlan(
+        transpose_axes=tuple(
+            data_array.dims.index(dim) for dim in target_dimension_order),
+        index=tuple(slices_or_none),
+        final_shape=tuple(final_shape),
+        wildcard_matches=wildcard_matches)
+
+
 def ensure_dims_like_are_satisfied(matches, property_dictionary):
     for quantity_name, properties in property_dictionary.items():
         if 'match_dims_like' in properties:
@@ -297,8 +443,10 @@ def ensure_dims_like_are_satisfied(matches, property_dictionary):
                             matches[quantity_name][wildcard_dim]))
 
 
+@profile_overhead('marshalling')
 def restore_data_arrays_with_properties(
-        raw_arrays, output_properties, input_state, input_properties):
+        raw_arrays, output_properties, input_state, input_properties,
+        out=None):
     """
     Parameters
     ----------
@@ -319,7 +467,15 @@ def restore_data_arrays_with_properties(
         A dictionary whose keys are quantity names and values are dictionaries
         with input properties for those quantities. The property "dims" must be
         present, indicating the dimensions that the quantity was transformed to
-        when taken as input to a component.
+        when taken as input to a component, and the optional property
+        "batch_ensemble" indicates whether an 'ensemble' dimension was added
+        as the first axis.
+    out : dict, optional
+        A dictionary whose keys are quantity names and values are
+        preallocated DataArrays, such as those returned by a previous call.
+        Output quantities present in this dictionary have their data
+        written into the given DataArray, which is returned, instead of
+        a new DataArray being created.
 
     Returns
     -------
@@ -353,12 +509,19 @@ def restore_data_arrays_with_properties(
         array = raw_arrays[from_name]
         from_dims = input_properties[dims_like]['dims']
         result_like = input_state[dims_like]
+        if out is not None:
+            out_array = out.get(quantity_name, None)
+        else:
+            out_array = None
         try:
             out_dict[quantity_name] = restore_dimensions(
                 array,
                 from_dims=from_dims,
                 result_like=result_like,
-                result_attrs=attrs)
+                result_attrs=attrs,
+                out=out_array,
+                batch_ensemble=input_properties[dims_like].get(
+                    'batch_ensemble', False))
         except ShapeMismatchError:
             raise InvalidPropertyDictError(
                 'output quantity {} has dims_like input {}, but the '
@@ -372,7 +535,9 @@ def restore_data_arrays_with_properties(
     return out_dict
 
 
-def restore_dimensions(array, from_dims, result_like, result_attrs=None):
+def restore_dimensions(
+        array, from_dims, result_like, result_attrs=None, out=None,
+        batch_ensemble=False):
     """
     Restores a numpy array to a DataArray with similar dimensions to a reference
     Data Array. This is meant to be the reverse of get_numpy_array.
@@ -397,18 +562,103 @@ def restore_dimensions(array, from_dims, result_like, result_attrs=None):
     result_attrs : dict, optional
         A dictionary with the desired attributes of the output DataArray. If
         not given, no attributes will be set.
+    out : DataArray, optional
+        A preallocated DataArray with the same dimensions and shape as
+        result_like, into which the data is written. Its coordinates are
+        left unchanged, and its attributes are replaced.
+    batch_ensemble : bool, optional
+        If True and result_like has an 'ensemble' dimension which is not
+        collected by '*' or listed in from_dims, it is taken to be the first
+        axis of the numpy array, as returned by get_numpy_array with
+        batch_ensemble=True. Default is False.
 
     Returns
     -------
     data_array : DataArray
         The output DataArray with the same dimensions as the reference
-        DataArray.
+        DataArray. Unless out is given, its data is a view of array where
+        possible, and its coordinates are those of result_like.
+
+    Raises
+    ------
+    ValueError
+        If out does not have the same dimensions and shape as result_like.
 
     See Also
     --------
     :py:function:~sympl.get_numpy_array: : Retrieves a numpy array with desired
         dimensions from a given DataArray.
     """
+    plan = get_restoration_plan(
+        array, from_dims, result_like, batch_ensemble)
+    if out is not None:
+        if out.dims != result_like.dims or out.shape != result_like.shape:
+            raise ValueError(
+                'out has dims {} and shape {}, but must match dims {} and '
+                'shape {} of result_like'.format(
+                    out.dims, out.shape, result_like.dims, result_like.shape))
+        np.copyto(out.values, plan.apply(array))
+        data_array = out
+    elif isinstance(result_like, DataArray):
+        # a shallow copy shares the indexes of result_like and the data of
+        # its other coordinates, rather than rebuilding them
+        data_array = result_like.copy(deep=False)
+        data_array.values = plan.apply(array)
+        data_array.name = None
+    else:
+        data_array = DataArray(
+            plan.apply(array), dims=result_like.dims,
+            coords=result_like.coords)
+    if result_attrs is not None:
+        data_array.attrs = result_attrs
+    else:
+        data_array.attrs = {}
+    return data_array
+
+
+class RestorationPlan(object):
+    """
+    A precomputed recipe for restoring a numpy array to the dimensions of a
+    reference DataArray, as done by restore_dimensions.
+
+    Attributes
+    ----------
+    original_shape : tuple of int
+        The shape the array is reshaped to, which separates any dimensions
+        collected by a single direction.
+    transpose_axes : tuple of int
+        The order into which the reshaped axes are transposed to match the
+        reference DataArray.
+    """
+
+    __slots__ = ('original_shape', 'transpose_axes')
+
+    def __init__(self, original_shape, transpose_axes):
+        self.original_shape = original_shape
+        self.transpose_axes = transpose_axes
+
+    def apply(self, array):
+        return np.reshape(array, self.original_shape).transpose(
+            self.transpose_axes)
+
+
+def get_restoration_plan(array, from_dims, result_like, batch_ensemble=False):
+    """
+    Returns a RestorationPlan for restoring array with from_dims to the
+    dimensions of result_like, using a cached plan if one exists for the
+    same from_dims, dimensions, shapes, batch_ensemble and direction names.
+    """
+    key = (
+        tuple(from_dims), result_like.dims, result_like.shape, array.shape,
+        batch_ensemble, dim_names_version)
+    return restoration_plan_cache.get(
+        key, create_restoration_plan, array, from_dims, result_like,
+        batch_ensemble)
+
+
+def create_restoration_plan(array, from_dims, result_like, batch_ensemble=False):
+    if batch_ensemble:
+        from_dims = add_ensemble_dim(result_like.dims, from_dims)
     current_dim_names = dim_names.copy()
     for dim in from_dims:
         if dim not in ('x', 'y', 'z', '*'):
@@ -417,23 +667,145 @@ def restore_dimensions(array, from_dims, result_like, result_attrs=None):
         result_like, from_dims, current_dim_names)
     original_shape = []
     original_dims = []
-    original_coords = []
     for direction in from_dims:
         if direction in direction_to_names.keys():
             for name in direction_to_names[direction]:
-                original_shape.append(len(result_like.coords[name]))
+                original_shape.append(
+                    result_like.shape[result_like.dims.index(name)])
                 original_dims.append(name)
-                original_coords.append(result_like.coords[name])
-    if np.product(array.shape) != np.product(original_shape):
+    if np.prod(array.shape) != np.prod(original_shape):
         raise ShapeMismatchError
-    data_array = DataArray(
-        np.reshape(array, original_shape),
-        dims=original_dims,
-        coords=original_coords).transpose(
-            *list(result_like.dims))
-    if result_attrs is not None:
-        data_array.attrs = result_attrs
-    return data_array
+    if not same_list(original_dims, result_like.dims):
+        raise ValueError(
+            'from_dims {} do not describe all dimensions of result_like, '
+            'which has dims {}'.format(from_dims, result_like.dims))
+    return RestorationPlan(
+        original_shape=tuple(original_shape),
+        transpose_axes=tuple(
+            original_dims.index(dim) for dim in result_like.dims))
+
+
+def add_ensemble_dim(dims, out_dims):
+    """
+    Returns out_dims with the ensemble dimension added first if it is in dims
+    but would not be matched by any of out_dims, and out_dims otherwise.
+    """
+    if (ensemble_dim_name not in dims or '*' in out_dims or
+            ensemble_dim_name in out_dims):
+        return out_dims
+    for direction in out_dims:
+        if ensemble_dim_name in dim_names.get(direction, ()):
+            return out_dims
+    return [ensemble_dim_name] + list(out_dims)
+
+
+def stack_ensemble(states):
+    """
+    Combines the states of several ensemble members into a single state in
+    which each DataArray has a new first dimension 'ensemble', so that all
+    members can be stepped forward by a single call to a TimeStepper.
+
+    Args
+    ----
+    states : iterable of dict
+        The model states of the ensemble members, which must contain the same
+        quantities with the same dimensions. Quantities other than DataArrays,
+        such as 'time', must be equal in every state.
+
+    Returns
+    -------
+    state : dict
+        The combined model state, which is a State if the first of the given
+        states is a State. DataArrays keep the coordinates and attributes of
+        the first member.
+
+    Raises
+    ------
+    ValueError
+        If no states are given, or the states do not contain the same
+        quantities, or a quantity which is not a DataArray differs between
+        them.
+    InvalidStateError
+        If a DataArray does not have the same dimensions in every state, or
+        already has an 'ensemble' dimension.
+    """
+    states = list(states)
+    if len(states) == 0:
+        raise ValueError('at least one state must be given')
+    first = states[0]
+    return_state = {}
+    for name, value in first.items():
+        if any(name not in state for state in states[1:]):
+            raise ValueError(
+                'quantity {} is not present in every state'.format(name))
+        if isinstance(value, DataArray):
+            if ensemble_dim_name in value.dims:
+                raise InvalidStateError(
+                    'quantity {} already has an {} dimension'.format(
+                        name, ensemble_dim_name))
+            for state in states[1:]:
+                if state[name].dims != value.dims:
+                    raise InvalidStateError(
+                        'quantity {} has dims {} in one state and {} in '
+                        'another'.format(name, value.dims, state[name].dims))
+            return_state[name] = DataArray(
+                np.stack([state[name].values for state in states]),
+                dims=(ensemble_dim_name,) + value.dims,
+                coords=value.coords, attrs=value.attrs.copy())
+        else:
+            if any(state[name] != value for state in states[1:]):
+                raise ValueError(
+                    'quantity {} must be equal in every state'.format(name))
+            return_state[name] = value
+    if any(len(state) != len(first) for state in states[1:]):
+        raise ValueError('states do not contain the same quantities')
+    if isinstance(first, State):
+        return_state = State(return_state)
+    return return_state
+
+
+def unstack_ensemble(state):
+    """
+    Splits a state combined by stack_ensemble into the states of its
+    ensemble members. DataArrays in the returned states are views into the
+    DataArrays of the combined state.
+
+    Args
+    ----
+    state : dict
+        A model state in which DataArrays may have an 'ensemble' dimension.
+
+    Returns
+    -------
+    states : list of dict
+        The model state of each ensemble member.
+
+    Raises
+    ------
+    InvalidStateError
+        If no DataArray in the state has an 'ensemble' dimension.
+    """
+    n_members = None
+    for value in state.values():
+        if (isinstance(value, DataArray) and
+                ensemble_dim_name in value.dims):
+            n_members = value.shape[value.dims.index(ensemble_dim_name)]
+            break
+    if n_members is None:
+        raise InvalidStateError(
+            'state has no quantity with an {} dimension'.format(
+                ensemble_dim_name))
+    states = []
+    for i in range(n_members):
+        member_state = {}
+        for name, value in state.items():
+            if (isinstance(value, DataArray) and
+                    ensemble_dim_name in value.dims):
+                member_state[name] = value.isel(**{ensemble_dim_name: i})
+            else:
+                member_state[name] = value
+        states.append(member_state)
+    return states
 
 
 def datetime64_to_datetime(dt64):
@@ -458,6 +830,7 @@ def set_direction_names(x=None, y=None, z=None):
             dim_names[key] = [key, value]
         elif value is not None:
             dim_names[key] = [key] + list(value)
+    direction_names_changed()
 
 
 def add_direction_names(x=None, y=None, z=None):
@@ -470,6 +843,18 @@ def add_direction_names(x=None, y=None, z=None):
             dim_names[key].append(value)
         elif value is not None:
             dim_names[key].extend(value)
+    direction_names_changed()
+
+
+def direction_names_changed():
+    """
+    Invalidates any cached plans which depend on the direction names. Must be
+    called whenever dim_names is modified.
+    """
+    global dim_names_version
+    dim_names_version += 1
+    array_plan_cache.clear()
+    restoration_plan_cache.clear()
 
 
 def combine_dimensions(arrays, out_dims):
@@ -540,12 +925,97 @@ def update_dict_by_adding_another(dict1, dict2):
         else:
             if (isinstance(dict1[key], DataArray) and isinstance(dict2[key], DataArray) and
                     ('units' in dict1[key].attrs) and ('units' in dict2[key].attrs)):
+                # dict2 may hold a component's own buffers, so convert into
+                # a new array rather than rescaling them in-place
                 dict1[key] += dict2[key].to_units(dict1[key].attrs['units'])
             else:
                 dict1[key] += dict2[key]  # += is in-place addition operator
     return  # not returning anything emphasizes that this is in-place
 
 
+def get_component_checkpoint(component):
+    """
+    Returns the checkpoint state of a component if it has a
+    get_checkpoint_state method, and None otherwise.
+    """
+    if hasattr(component, 'get_checkpoint_state'):
+        return component.get_checkpoint_state()
+    return None
+
+
+def set_component_checkpoint(component, checkpoint):
+    """
+    Restores a component from a checkpoint state returned by
+    get_component_checkpoint, doing nothing if the checkpoint is None.
+    """
+    if checkpoint is not None:
+        component.set_checkpoint_state(checkpoint)
+
+
+def get_fingerprint(state, name, method='auto'):
+    """
+    Returns a value which changes whenever the quantity with the given name
+    in the state changes, or None if the quantity is not in the state.
+
+    DataArrays and numpy arrays are fingerprinted by their dimensions, shape,
+    dtype and units, together with information about their data which
+    depends on the method. Any other value is used as its own fingerprint.
+
+    Args
+    ----
+    state : dict
+        A model state dictionary.
+    name : str
+        The name of the quantity.
+    method : str, optional
+        'version' to use the address of the data together with the version
+        of the quantity if state is a State, which is fastest but does not
+        detect data modified in-place (unless State.mark_modified is
+        called). Other dictionaries have no versions, and a freed address
+        can be reused by new data, so 'full' is used for them instead.
+        'sampled' to use a checksum of a regular sample of at most
+        about 4096 values, which can miss changes to values not sampled.
+        'full' to use a checksum of all the data. 'auto' to use 'version' if
+        state is a State, and 'full' otherwise. Default is 'auto'.
+
+    Raises
+    ------
+    ValueError
+        If method is not a valid fingerprint method.
+    """
+    if method not in fingerprint_methods:
+        raise ValueError(
+            'method must be one of {}, got {}'.format(
+                fingerprint_methods, method))
+    if name not in state:
+        return None
+    if method in ('auto', 'version') and not isinstance(state, State):
+        method = 'full'
+    elif method == 'auto':
+        method = 'version'
+    value = state[name]
+    if not (isinstance(value, np.ndarray) or isinstance(value, DataArray)):
+        return 'value', value
+    array = np.asarray(value)
+    description = (
+        getattr(value, 'dims', None), array.shape, array.dtype.str,
+        getattr(value, 'attrs', {}).get('units', None))
+    if method == 'version':
+        return (
+            'version', description, state.version(name),
+            array.__array_interface__['data'][0], array.strides)
+    elif array.dtype.kind == 'O':
+        # the data of object arrays are references, which cannot be
+        # checksummed, so they are assumed to change on every call
+        return 'object', next(fingerprint_counter)
+    elif method == 'sampled' and array.ndim > 0:
+        samples_per_axis = max(1, int(4096**(1./array.ndim)))
+        array = array[tuple(
+            slice(None, None, max(1, -(-length // samples_per_axis)))
+            for length in array.shape)]
+    return method, description, zlib.crc32(np.ascontiguousarray(array))
+
+
 def ensure_no_shared_keys(dict1, dict2):
     """
     Raises SharedKeyError if there exists a key present in both
@@ -1,5 +1,16 @@
-from .base_components import ImplicitPrognostic
+import copy
+import multiprocessing
+import threading
+from multiprocessing.pool import ThreadPool
+import numpy as np
+from six.moves import queue
+from .base_components import ImplicitPrognostic, Monitor
 from .array import DataArray
+from .cache import PlanCache
+from .util import (
+    get_component_checkpoint, set_component_checkpoint,
+    get_array_extraction_plan, get_numpy_array, restore_dimensions,
+    get_fingerprint, fingerprint_methods)
 
 
 class ScalingWrapper(object):
@@ -111,6 +122,12 @@ class ScalingWrapper(object):
     def __getattr__(self, item):
         return getattr(self._component, item)
 
+    def get_checkpoint_state(self):
+        return {'component': get_component_checkpoint(self._component)}
+
+    def set_checkpoint_state(self, checkpoint):
+        set_component_checkpoint(self._component, checkpoint['component'])
+
     def __call__(self, state, timestep=None):
 
         scaled_state = {}
@@ -202,10 +219,183 @@ class UpdateFrequencyWrapper(object):
             self._last_update_time = state['time']
         return self._cached_output
 
+    def get_checkpoint_state(self):
+        """
+        Returns a dictionary containing copies of the cached output and the
+        time it was computed, and the checkpoint state of the wrapped object.
+        """
+        checkpoint = copy.deepcopy({
+            'cached_output': self._cached_output,
+            'last_update_time': self._last_update_time,
+        })
+        checkpoint['prognostic'] = get_component_checkpoint(self._prognostic)
+        return checkpoint
+
+    def set_checkpoint_state(self, checkpoint):
+        """
+        Restores the cached output and the wrapped object from a dictionary
+        returned by get_checkpoint_state.
+        """
+        self._cached_output = copy.deepcopy(checkpoint['cached_output'])
+        self._last_update_time = checkpoint['last_update_time']
+        set_component_checkpoint(self._prognostic, checkpoint['prognostic'])
+
     def __getattr__(self, item):
         return getattr(self._prognostic, item)
 
 
+class MemoizationWrapper(object):
+    """
+    Wraps a Prognostic or Diagnostic so that when it is called with inputs
+    it has already been called with, it returns its cached output instead
+    of computing it again.
+
+    The inputs are identified by a fingerprint of each quantity in the
+    input_properties of the wrapped component (see
+    :py:func:`~sympl.get_fingerprint`), so the component's output must
+    depend only on those quantities. This is useful for components whose
+    inputs rarely or never change, such as those computing geometry or
+    fields derived from orography.
+
+    Outputs for the most recently used inputs are kept in a cache whose
+    number of entries, and optionally total size in bytes, is limited.
+
+    Example
+    -------
+    This is how the wrapper might be used on a Diagnostic computing grid
+    cell areas, which would be computed only once.
+
+    >>> cell_area = MemoizationWrapper(CellArea(), fingerprint='version')
+    """
+
+    def __init__(
+            self, component, maxsize=8, max_memory=None, fingerprint='full',
+            copy_data=True):
+        """
+        Args
+        ----
+        component : Prognostic or Diagnostic
+            The object to be wrapped.
+        maxsize : int, optional
+            The largest number of outputs to keep. Default is 8.
+        max_memory : int, optional
+            The largest total size in bytes of the arrays in the outputs
+            kept. An output larger than this is not kept. By default there
+            is no limit.
+        fingerprint : str, optional
+            How inputs are fingerprinted, which is one of 'version',
+            'sampled', 'full' or 'auto', as described in
+            :py:func:`~sympl.get_fingerprint`. Default is 'full'.
+        copy_data : bool, optional
+            If True, the arrays of an output are copied whenever it is
+            returned, since callers such as PrognosticComposite may modify
+            the arrays they are given in-place, which would change the
+            cached output. Default is True.
+
+        Raises
+        ------
+        TypeError
+            If the component is not a Prognostic or Diagnostic.
+        ValueError
+            If maxsize or max_memory is negative, or fingerprint is not a
+            valid fingerprint method.
+        """
+        if (hasattr(component, 'output_properties') or
+                not hasattr(component, 'input_properties')):
+            raise TypeError('Component must be a Prognostic or Diagnostic')
+        if fingerprint not in fingerprint_methods:
+            raise ValueError(
+                'fingerprint must be one of {}, got {}'.format(
+                    fingerprint_methods, fingerprint))
+        if max_memory is not None and max_memory < 0:
+            raise ValueError('max_memory must be non-negative')
+        self._component = component
+        self._fingerprint = fingerprint
+        self._copy_data = copy_data
+        self._cache = PlanCache(
+            maxsize=maxsize, max_memory=max_memory, get_size=get_output_size)
+
+    def __getattr__(self, item):
+        return getattr(self._component, item)
+
+    def __call__(self, state):
+        """
+        Returns the output of the wrapped component for the state, using a
+        cached output if the component has already been called with the
+        same inputs.
+
+        Args
+        ----
+        state : dict
+            A model state dictionary.
+
+        Returns
+        -------
+        output : dict or tuple of dict
+            The output of the wrapped component.
+        """
+        key = tuple(
+            (name, get_fingerprint(state, name, self._fingerprint))
+            for name in sorted(self._component.inputs))
+        output = self._cache.get(key, self._component, state)
+        if self._copy_data:
+            return copy_output(output)
+        else:
+            return output
+
+    @property
+    def hits(self):
+        """The number of calls which returned a cached output."""
+        return self._cache.hits
+
+    @property
+    def misses(self):
+        """The number of calls which called the wrapped component."""
+        return self._cache.misses
+
+    def cache_info(self):
+        """
+        Returns a dictionary with the number of hits and misses, the
+        fraction of calls which were hits, and the number of entries and
+        total size in bytes of the cached outputs.
+        """
+        info = self._cache.info()
+        calls = info['hits'] + info['misses']
+        info['hit_rate'] = info['hits']/float(calls) if calls > 0 else 0.
+        info['memory'] = self._cache.memory
+        return info
+
+    def clear_cache(self):
+        """Removes all cached outputs and resets the hit and miss counts."""
+        self._cache.clear()
+
+
+def get_output_size(output):
+    """
+    Returns the total size in bytes of the arrays in the output of a
+    component, which is a dictionary or a tuple of dictionaries.
+    """
+    if isinstance(output, dict):
+        output = (output, )
+    return sum(
+        value.nbytes for dictionary in output for value in dictionary.values()
+        if isinstance(value, (DataArray, np.ndarray)))
+
+
+def copy_output(output):
+    """
+    Returns a copy of the output of a component, which is a dictionary or a
+    tuple of dictionaries, in which the data of arrays are copied.
+    """
+    if isinstance(output, dict):
+        return dict(
+            (name, value.copy())
+            if isinstance(value, (DataArray, np.ndarray)) else (name, value)
+            for name, value in output.items())
+    else:
+        return tuple(copy_output(dictionary) for dictionary in output)
+
+
 class TendencyInDiagnosticsWrapper(object):
     """
     Wraps a prognostic object so that when it is called, it returns all
@@ -266,6 +456,12 @@ class TendencyInDiagnosticsWrapper(object):
             diagnostics[diagnostic_name] = tendencies[quantity_name]
         return tendencies, diagnostics
 
+    def get_checkpoint_state(self):
+        return {'prognostic': get_component_checkpoint(self._prognostic)}
+
+    def set_checkpoint_state(self, checkpoint):
+        set_component_checkpoint(self._prognostic, checkpoint['prognostic'])
+
     def __getattr__(self, item):
         return getattr(self._prognostic, item)
 
@@ -311,6 +507,12 @@ class TimeDifferencingWrapper(ImplicitPrognostic):
                         varname, type(data_array)))
         return tendencies, diagnostics
 
+    def get_checkpoint_state(self):
+        return {'implicit': get_component_checkpoint(self._implicit)}
+
+    def set_checkpoint_state(self, checkpoint):
+        set_component_checkpoint(self._implicit, checkpoint['implicit'])
+
     @property
     def tendencies(self):
         return list(self.tendency_properties.keys())
@@ -324,3 +526,476 @@ class TimeDifferencingWrapper(ImplicitPrognostic):
     def __getattr__(self, item):
         if item not in ('outputs', 'output_properties'):
             return getattr(self._implicit, item)
+
+
+class AsyncMonitorWrapper(Monitor):
+    """
+    Wraps a Monitor so that states are stored in it by a background thread,
+    allowing slow output such as writing files or drawing plots to overlap
+    with the integration of the model.
+
+    When store is called, a snapshot of the state is put in a queue of
+    bounded length, from which the background thread passes each state to
+    the wrapped Monitor in order. If the queue is full, the backpressure
+    policy determines whether store waits for space, or a state is dropped.
+    Any exception raised by the wrapped Monitor is raised again by the next
+    call to store, flush or close.
+
+    Example
+    -------
+    This is how the wrapper should be used on a NetCDFMonitor which writes
+    each state as it is stored.
+
+    >>> monitor = AsyncMonitorWrapper(
+    >>>     NetCDFMonitor('output.nc', write_on_store=True), maxsize=4)
+    >>> for i in range(n_steps):
+    >>>     diagnostics, next_state = time_stepper(state, timestep)
+    >>>     state.update(diagnostics)
+    >>>     monitor.store(state)
+    >>>     next_state['time'] = state['time'] + timestep
+    >>>     state = next_state
+    >>> monitor.close()
+
+    Attributes
+    ----------
+    dropped_count : int
+        The number of states dropped because the queue was full.
+    """
+
+    policies = ('block', 'drop_oldest', 'drop_newest')
+
+    def __init__(self, monitor, maxsize=2, policy='block', copy_data=True):
+        """
+        Args
+        ----
+        monitor : Monitor
+            The object to be wrapped.
+        maxsize : int, optional
+            The largest number of states which may be waiting to be stored.
+            Default is 2.
+        policy : str, optional
+            What to do when store is called while the queue is full. If
+            'block', wait until there is space. If 'drop_oldest', discard
+            the state which has waited longest. If 'drop_newest', discard
+            the state being stored. Default is 'block'.
+        copy_data : bool, optional
+            If True, the data of each DataArray in the state is copied when
+            it is stored, since TimeSteppers such as Leapfrog modify the
+            arrays of the state passed to them. If False, only the state
+            dictionary is copied, which is safe only if the arrays are not
+            modified after they are stored. Default is True.
+
+        Raises
+        ------
+        ValueError
+            If maxsize is less than 1 or policy is not a valid policy.
+        """
+        if maxsize < 1:
+            raise ValueError('maxsize must be at least 1')
+        if policy not in self.policies:
+            raise ValueError(
+                'policy must be one of {}, got {}'.format(
+                    self.policies, policy))
+        self._monitor = monitor
+        self._policy = policy
+        self._copy_data = copy_data
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._error = None
+        self._closed = False
+        self.dropped_count = 0
+        self._thread = threading.Thread(target=self._store_queued_states)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __getattr__(self, item):
+        return getattr(self._monitor, item)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def store(self, state):
+        """
+        Puts a snapshot of the state in the queue to be stored in the wrapped
+        Monitor.
+
+        Args
+        ----
+        state : dict
+            A model state dictionary.
+
+        Raises
+        ------
+        RuntimeError
+            If the wrapper has been closed.
+        """
+        if self._closed:
+            raise RuntimeError('cannot store a state after close is called')
+        self._raise_error()
+        snapshot = self._snapshot(state)
+        if self._policy == 'block':
+            self._queue.put(snapshot)
+        elif self._policy == 'drop_newest':
+            try:
+                self._queue.put_nowait(snapshot)
+            except queue.Full:
+                self.dropped_count += 1
+        else:
+            while True:
+                try:
+                    self._queue.put_nowait(snapshot)
+                    break
+                except queue.Full:
+                    try:
+                        self._queue.get_nowait()
+                        self._queue.task_done()
+                        self.dropped_count += 1
+                    except queue.Empty:
+                        pass  # the background thread made space
+
+    def flush(self):
+        """
+        Waits until every queued state has been stored in the wrapped
+        Monitor.
+        """
+        self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        """
+        Waits until every queued state has been stored in the wrapped
+        Monitor, and stops the background thread. Calling close more than
+        once has no further effect.
+        """
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)  # tells the background thread to stop
+            self._thread.join()
+        self._raise_error()
+
+    def _snapshot(self, state):
+        snapshot = {}
+        for name, value in state.items():
+            if self._copy_data and isinstance(value, DataArray):
+                snapshot[name] = value.copy(deep=False)
+                snapshot[name].values = value.values.copy()
+            else:
+                snapshot[name] = value
+        return snapshot
+
+    def _store_queued_states(self):
+        while True:
+            state = self._queue.get()
+            try:
+                if state is None:
+                    return
+                if self._error is None:
+                    self._monitor.store(state)
+            except Exception as err:
+                self._error = err
+            finally:
+                self._queue.task_done()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+
+class ColumnChunkWrapper(object):
+    """
+    Wraps a Prognostic or Diagnostic whose columns are computed independently
+    of each other, so that it is called in parallel on chunks of columns.
+
+    The chunks are taken along the longest horizontal dimension of the
+    state, found by matching the dimensions of each DataArray to the 'x'
+    and 'y' directions in the same way as
+    :py:func:`~sympl.get_numpy_array`. Each chunk of the state is passed to
+    the wrapped component on a pool of threads or processes, and the outputs
+    for each chunk are joined together with
+    :py:func:`~sympl.restore_dimensions`. Every output of the component must
+    have the dimension which is chunked.
+
+    With static scheduling, the chunks are divided between the workers
+    before any are computed, which has the least overhead. With dynamic
+    scheduling, each worker takes the next chunk from a shared queue when
+    it finishes one, which balances the load when some columns (such as
+    cloudy columns) are more expensive than others.
+
+    A thread pool is faster for components which release the GIL, such as
+    those using numpy or compiled code, and the wrapped component must then
+    be safe to call from several threads at once. With a process pool, the
+    component is copied into each worker process and the chunks of the
+    state are pickled, so the component must not rely on internal state
+    being kept between calls.
+
+    Example
+    -------
+    This is how a radiation scheme might be computed on 4 threads, with
+    chunks of 8 columns given to the threads as they become free.
+
+    >>> radiation = ColumnChunkWrapper(
+    >>>     Radiation(), n_workers=4, schedule='dynamic', chunk_size=8)
+    >>> tendencies, diagnostics = radiation(state)
+    """
+
+    schedules = ('static', 'dynamic')
+    pool_types = ('thread', 'process')
+
+    def __init__(
+            self, component, n_workers=None, schedule='static',
+            chunk_size=None, pool='thread'):
+        """
+        Args
+        ----
+        component : Prognostic or Diagnostic
+            The component to be wrapped.
+        n_workers : int, optional
+            The number of threads or processes on which to call the
+            component. Default is the number of CPUs.
+        schedule : str, optional
+            'static' to divide the chunks evenly between the workers
+            beforehand, or 'dynamic' to give the next chunk to whichever
+            worker is free. Default is 'static'.
+        chunk_size : int, optional
+            The length of each chunk along the chunked dimension. By
+            default each worker gets one chunk with static scheduling, and
+            four chunks with dynamic scheduling.
+        pool : str, optional
+            'thread' to call the component on a pool of threads, or
+            'process' to call it on a pool of processes. Default is
+            'thread'.
+
+        Raises
+        ------
+        TypeError
+            If the component is not a Prognostic or Diagnostic.
+        ValueError
+            If n_workers or chunk_size is less than 1, or schedule or pool
+            is not a valid option.
+        """
+        if hasattr(component, 'tendency_properties'):
+            self._component_type = 'Prognostic'
+        elif (hasattr(component, 'diagnostic_properties') and
+                not hasattr(component, 'output_properties')):
+            self._component_type = 'Diagnostic'
+        else:
+            raise TypeError('Component must be a Prognostic or Diagnostic')
+        if n_workers is None:
+            n_workers = multiprocessing.cpu_count()
+        elif n_workers < 1:
+            raise ValueError('n_workers must be at least 1')
+        if chunk_size is not None and chunk_size < 1:
+            raise ValueError('chunk_size must be at least 1')
+        if schedule not in self.schedules:
+            raise ValueError(
+                'schedule must be one of {}, got {}'.format(
+                    self.schedules, schedule))
+        if pool not in self.pool_types:
+            raise ValueError(
+                'pool must be one of {}, got {}'.format(
+                    self.pool_types, pool))
+        self._component = component
+        self._n_workers = n_workers
+        self._schedule = schedule
+        self._chunk_size = chunk_size
+        self._pool_type = pool
+        self._pool = None
+
+    def __getattr__(self, item):
+        return getattr(self._component, item)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __call__(self, state):
+        """
+        Calls the wrapped component on chunks of columns of the state in
+        parallel, and returns the joined outputs.
+
+        Args
+        ----
+        state : dict
+            A model state dictionary.
+
+        Returns
+        -------
+        tendencies : dict
+            The tendencies returned by the component, if it is a Prognostic.
+        diagnostics : dict
+            The diagnostics returned by the component.
+
+        Raises
+        ------
+        ValueError
+            If an output of the component does not have the chunked
+            dimension.
+        """
+        chunk_dim, length = get_chunk_dimension(state)
+        if chunk_dim is None or length <= 1 or self._n_workers == 1:
+            return self._component(state)
+        if self._chunk_size is not None:
+            chunk_size = self._chunk_size
+        elif self._schedule == 'static':
+            chunk_size = -(-length // self._n_workers)  # ceiling division
+        else:
+            chunk_size = -(-length // (4*self._n_workers))
+        chunk_states = [
+            get_chunk_state(state, chunk_dim, slice(start, start + chunk_size))
+            for start in range(0, length, chunk_size)]
+        chunk_outputs = self._call_on_chunks(chunk_states)
+        if self._component_type == 'Prognostic':
+            return (
+                join_chunk_outputs(
+                    [output[0] for output in chunk_outputs], chunk_dim),
+                join_chunk_outputs(
+                    [output[1] for output in chunk_outputs], chunk_dim))
+        else:
+            return join_chunk_outputs(chunk_outputs, chunk_dim)
+
+    def close(self):
+        """
+        Stops the threads or processes used by this wrapper. They are
+        started again if the wrapper is called afterwards.
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def _call_on_chunks(self, chunk_states):
+        """
+        Returns the outputs of the component for each chunk of the state,
+        in the same order as chunk_states.
+        """
+        if self._pool is None:
+            if self._pool_type == 'thread':
+                self._pool = ThreadPool(self._n_workers)
+            else:
+                self._pool = multiprocessing.Pool(
+                    self._n_workers, initializer=set_worker_component,
+                    initargs=(self._component,))
+        if self._pool_type == 'thread':
+            function = self._call_component
+        else:
+            function = call_worker_component
+        if self._schedule == 'static':
+            # the chunks are dealt out to the workers in turn, one task each
+            tasks = [
+                chunk_states[i::self._n_workers]
+                for i in range(min(self._n_workers, len(chunk_states)))]
+            outputs = [None]*len(chunk_states)
+            for i, task_outputs in enumerate(self._pool.map(
+                    function, [(task, ) for task in tasks], chunksize=1)):
+                outputs[i::self._n_workers] = task_outputs
+        else:
+            outputs = [None]*len(chunk_states)
+            for i, chunk_output in self._pool.imap_unordered(
+                    function,
+                    [(chunk_state, i)
+                     for i, chunk_state in enumerate(chunk_states)],
+                    chunksize=1):
+                outputs[i] = chunk_output
+        return outputs
+
+    def _call_component(self, task):
+        return call_component_on_task(self._component, task)
+
+
+# the component called by the worker processes of a ColumnChunkWrapper
+worker_component = None
+
+
+def set_worker_component(component):
+    global worker_component
+    worker_component = component
+
+
+def call_worker_component(task):
+    return call_component_on_task(worker_component, task)
+
+
+def call_component_on_task(component, task):
+    """
+    Calls the component on each chunk of the state in a task, which is
+    either a tuple containing a list of chunks, whose list of outputs is
+    returned, or a (chunk, index) pair, for which an (index, output) pair
+    is returned.
+    """
+    if len(task) == 1:
+        return [component(chunk_state) for chunk_state in task[0]]
+    else:
+        chunk_state, index = task
+        return index, component(chunk_state)
+
+
+def get_chunk_dimension(state):
+    """
+    Returns the name and length of the longest dimension of the DataArrays
+    in the state which matches the 'x' or 'y' direction, or (None, 0) if
+    there is none.
+    """
+    chunk_dim, length = None, 0
+    for value in state.values():
+        if isinstance(value, DataArray):
+            matches = get_array_extraction_plan(
+                value, ['x', 'y', '*']).wildcard_matches
+            for dim in matches['x'] + matches['y']:
+                if value.shape[value.dims.index(dim)] > length:
+                    chunk_dim = dim
+                    length = value.shape[value.dims.index(dim)]
+    return chunk_dim, length
+
+
+def get_chunk_state(state, chunk_dim, chunk_slice):
+    """
+    Returns a copy of the state in which each DataArray with the chunked
+    dimension is replaced by a view of the given chunk of it.
+    """
+    chunk_state = {}
+    for name, value in state.items():
+        if isinstance(value, DataArray) and chunk_dim in value.dims:
+            chunk_state[name] = value.isel(**{chunk_dim: chunk_slice})
+        else:
+            chunk_state[name] = value
+    return chunk_state
+
+
+def join_chunk_outputs(chunk_outputs, chunk_dim):
+    """
+    Joins the output dictionaries returned for each chunk of the state
+    along the chunked dimension.
+    """
+    joined_outputs = {}
+    for name, value in chunk_outputs[0].items():
+        if not (isinstance(value, DataArray) and chunk_dim in value.dims):
+            raise ValueError(
+                'Output {} does not have the dimension {} along which the '
+                'state is divided into chunks, so it cannot be computed '
+                'for each chunk separately.'.format(name, chunk_dim))
+        joined_array = np.concatenate(
+            [get_numpy_array(output[name], [chunk_dim, '*'])
+             for output in chunk_outputs], axis=0)
+        shape = list(value.shape)
+        shape[value.dims.index(chunk_dim)] = joined_array.shape[0]
+        result_coords = {
+            coord_name: coord for coord_name, coord in value.coords.items()
+            if chunk_dim not in coord.dims}
+        if chunk_dim in value.coords:
+            result_coords[chunk_dim] = np.concatenate(
+                [output[name].coords[chunk_dim].values
+                 for output in chunk_outputs])
+        # only the dimensions and shape of result_like are used, so its data
+        # can be a broadcast view of a single value
+        result_like = DataArray(
+            np.broadcast_to(np.zeros((), dtype=value.dtype), shape),
+            dims=value.dims, coords=result_coords)
+        joined_outputs[name] = restore_dimensions(
+            joined_array, [chunk_dim, '*'], result_like,
+            result_attrs=dict(value.attrs))
+    return joined_outputs
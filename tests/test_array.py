@@ -71,5 +71,88 @@ def test_array_unit_conversion_different_units_doesnt_modify_original():
     assert a.attrs['units'] == 'km'
 
 
+def test_array_unit_conversion_inplace():
+    a = DataArray(np.array([1., 2., 3.]),
+                  attrs={'units': 'km', 'foo': 'bar'})
+    buffer = a.values
+    result = a.to_units('m', inplace=True)
+    assert result is a
+    assert a.values is buffer
+    assert (a.values == np.array([1000., 2000., 3000.])).all()
+    assert a.attrs == {'units': 'm', 'foo': 'bar'}
+
+
+def test_array_unit_conversion_inplace_offset_units():
+    a = DataArray(np.array([0., 10.]), attrs={'units': 'degC'})
+    a.to_units('K', inplace=True)
+    assert np.allclose(a.values, [273.15, 283.15])
+    assert a.attrs['units'] == 'K'
+
+
+def test_array_unit_conversion_inplace_keeps_float32():
+    a = DataArray(np.array([1., 2.], dtype=np.float32), attrs={'units': 'km'})
+    a.to_units('m', inplace=True)
+    assert a.dtype == np.float32
+    assert (a.values == np.array([1000., 2000.])).all()
+
+
+def test_array_unit_conversion_inplace_raises_on_integer_scaling():
+    a = DataArray(np.array([1, 2, 3]), attrs={'units': 'm'})
+    with pytest.raises(TypeError):
+        a.to_units('km', inplace=True)
+    assert (a.values == np.array([1, 2, 3])).all()
+    assert a.attrs['units'] == 'm'
+
+
+def test_array_unit_conversion_inplace_integer_same_units():
+    a = DataArray(np.array([1, 2, 3]), attrs={'units': 'm'})
+    a.to_units('meter', inplace=True)
+    assert (a.values == np.array([1, 2, 3])).all()
+    assert a.attrs['units'] == 'meter'
+
+
+def test_array_unit_conversion_out():
+    a = DataArray(np.array([1., 2., 3.]), dims=['x'],
+                  attrs={'units': 'km', 'foo': 'bar'})
+    out = DataArray(np.zeros(3), dims=['x'], attrs={'units': 'degK'})
+    buffer = out.values
+    result = a.to_units('m', out=out)
+    assert result is out
+    assert out.values is buffer
+    assert (out.values == np.array([1000., 2000., 3000.])).all()
+    assert out.attrs == {'units': 'm', 'foo': 'bar'}
+    assert (a.values == np.array([1., 2., 3.])).all()
+    assert a.attrs['units'] == 'km'
+
+
+def test_array_unit_conversion_out_same_units_copies():
+    a = DataArray(np.array([1., 2., 3.]), dims=['x'], attrs={'units': 'm'})
+    out = DataArray(np.zeros(3), dims=['x'])
+    a.to_units('m', out=out)
+    assert (out.values == np.array([1., 2., 3.])).all()
+    assert out.attrs['units'] == 'm'
+
+
+def test_array_unit_conversion_out_raises_on_shape_mismatch():
+    a = DataArray(np.array([1., 2., 3.]), dims=['x'], attrs={'units': 'km'})
+    out = DataArray(np.zeros(4), dims=['x'])
+    with pytest.raises(ValueError):
+        a.to_units('m', out=out)
+
+
+def test_array_unit_conversion_out_raises_on_integer_out():
+    a = DataArray(np.array([1., 2., 3.]), dims=['x'], attrs={'units': 'km'})
+    out = DataArray(np.zeros(3, dtype=np.int64), dims=['x'])
+    with pytest.raises(TypeError):
+        a.to_units('m', out=out)
+
+
+def test_array_unit_conversion_raises_on_inplace_and_out():
+    a = DataArray(np.array([1., 2., 3.]), dims=['x'], attrs={'units': 'km'})
+    out = DataArray(np.zeros(3), dims=['x'])
+    with pytest.raises(ValueError):
+        a.to_units('m', inplace=True, out=out)
+
+
 if __name__ == '__main__':
     pytest.main([__file__])
@@ -1,8 +1,13 @@
 import pytest
 import mock
+import threading
+import copy
+import pickle
+from datetime import timedelta
+import numpy as np
 from sympl import (
     Prognostic, Diagnostic, Monitor, PrognosticComposite, DiagnosticComposite,
-    MonitorComposite, SharedKeyError, DataArray
+    MonitorComposite, SharedKeyError, DataArray, AdamsBashforth, State
 )
 
 def same_list(list1, list2):
@@ -270,5 +275,239 @@ def test_diagnostic_composite_ensures_valid_state():
             'Should not be able to have overlapping diagnostics in composite')
 
 
+class MockScaledPrognostic(Prognostic):
+
+    input_properties = {
+        'air_temperature': {'dims': ['*'], 'units': 'K'},
+    }
+
+    def __init__(self, factor, units):
+        self._factor = factor
+        self._units = units
+
+    def __call__(self, state):
+        tendencies = {
+            'air_temperature': DataArray(
+                np.sin(state['air_temperature'].values*self._factor),
+                dims=state['air_temperature'].dims,
+                attrs={'units': self._units}),
+        }
+        diagnostics = {'diagnostic_{}'.format(self._factor): self._factor}
+        return tendencies, diagnostics
+
+
+def get_scaled_prognostics():
+    return [
+        MockScaledPrognostic(0.1, 'K/s'),
+        MockScaledPrognostic(0.3, 'K/day'),
+        MockScaledPrognostic(0.7, 'mK/s'),
+        MockScaledPrognostic(1.1, 'K/hour'),
+    ]
+
+
+def get_temperature_state():
+    return {
+        'air_temperature': DataArray(
+            np.linspace(250., 300., 7), dims=['x'], attrs={'units': 'K'}),
+        'time': timedelta(0),
+    }
+
+
+def test_parallel_prognostic_composite_matches_serial():
+    serial = PrognosticComposite(*get_scaled_prognostics())
+    parallel = PrognosticComposite(*get_scaled_prognostics(), n_threads=4)
+    tendencies, diagnostics = serial(get_temperature_state())
+    parallel_tendencies, parallel_diagnostics = parallel(
+        get_temperature_state())
+    assert parallel_diagnostics == diagnostics
+    assert parallel_tendencies['air_temperature'].attrs == (
+        tendencies['air_temperature'].attrs)
+    assert np.all(
+        parallel_tendencies['air_temperature'].values ==
+        tendencies['air_temperature'].values)
+
+
+def test_parallel_prognostic_composite_in_time_stepper():
+    time_stepper = AdamsBashforth(get_scaled_prognostics())
+    parallel_time_stepper = AdamsBashforth(
+        PrognosticComposite(*get_scaled_prognostics(), n_threads=2))
+    state = get_temperature_state()
+    parallel_state = get_temperature_state()
+    for i in range(3):
+        _, state = time_stepper(state, timedelta(seconds=10))
+        _, parallel_state = parallel_time_stepper(
+            parallel_state, timedelta(seconds=10))
+    assert np.all(
+        parallel_state['air_temperature'].values ==
+        state['air_temperature'].values)
+
+
+class MockEventDiagnostic(Diagnostic):
+
+    def __init__(self, event, name, wait):
+        self._event = event
+        self._name = name
+        self._wait = wait
+
+    def __call__(self, state):
+        if self._wait:
+            # only set if the other diagnostic runs at the same time
+            return {self._name: self._event.wait(5.)}
+        else:
+            self._event.set()
+            return {self._name: True}
+
+
+def test_parallel_diagnostic_composite_runs_concurrently():
+    event = threading.Event()
+    composite = DiagnosticComposite(
+        MockEventDiagnostic(event, 'waited', wait=True),
+        MockEventDiagnostic(event, 'set', wait=False),
+        n_threads=2)
+    diagnostics = composite({})
+    assert diagnostics == {'waited': True, 'set': True}
+
+
+def test_composite_rejects_invalid_n_threads():
+    with pytest.raises(ValueError):
+        PrognosticComposite(MockPrognostic(), n_threads=0)
+    with pytest.raises(TypeError):
+        DiagnosticComposite(MockDiagnostic(), threads=2)
+    with pytest.raises(TypeError):
+        MonitorComposite(MockMonitor(), n_threads=2)
+
+
+def test_parallel_composite_close_stops_threads():
+    with PrognosticComposite(
+            *get_scaled_prognostics(), n_threads=2) as composite:
+        composite(get_temperature_state())
+        n_threads = threading.active_count()
+    assert threading.active_count() < n_threads
+    # the threads are started again when needed
+    tendencies, _ = composite(get_temperature_state())
+    composite.close()
+    composite.close()
+    assert 'air_temperature' in tendencies
+
+
+def test_parallel_composite_can_be_copied_and_pickled():
+    composite = PrognosticComposite(*get_scaled_prognostics(), n_threads=2)
+    tendencies, _ = composite(get_temperature_state())
+    for other in (
+            copy.deepcopy(composite), pickle.loads(pickle.dumps(composite))):
+        other_tendencies, _ = other(get_temperature_state())
+        assert np.all(
+            other_tendencies['air_temperature'].values ==
+            tendencies['air_temperature'].values)
+        other.close()
+    composite.close()
+
+
+class MockFunctionDiagnostic(Diagnostic):
+
+    def __init__(self, inputs, output, function):
+        self.input_properties = {
+            name: {'dims': ['x'], 'units': 'm'} for name in inputs}
+        self.diagnostic_properties = {output: {'dims': ['x'], 'units': 'm'}}
+        self._inputs = inputs
+        self._output = output
+        self._function = function
+        self.call_count = 0
+
+    def __call__(self, state):
+        self.call_count += 1
+        return {self._output: self._function(
+            *[state[name] for name in self._inputs])}
+
+
+def get_dependent_diagnostics():
+    return [
+        MockFunctionDiagnostic(['b'], 'c', lambda b: b*2.),
+        MockFunctionDiagnostic(['a'], 'b', lambda a: a + 1.),
+        MockFunctionDiagnostic(['d'], 'e', lambda d: d - 1.),
+    ]
+
+
+def get_dependency_state():
+    return {
+        'a': DataArray(np.ones(3), dims=['x'], attrs={'units': 'm'}),
+        'd': DataArray(np.zeros(3), dims=['x'], attrs={'units': 'm'}),
+    }
+
+
+def test_diagnostic_composite_orders_by_dependencies():
+    composite = DiagnosticComposite(*get_dependent_diagnostics())
+    diagnostics = composite(get_dependency_state())
+    assert np.all(diagnostics['b'].values == 2.)
+    assert np.all(diagnostics['c'].values == 4.)
+    assert np.all(diagnostics['e'].values == -1.)
+
+
+def test_diagnostic_composite_detects_cycles():
+    with pytest.raises(ValueError):
+        DiagnosticComposite(
+            MockFunctionDiagnostic(['b'], 'a', lambda b: b),
+            MockFunctionDiagnostic(['a'], 'b', lambda a: a))
+
+
+def test_diagnostic_composite_allows_own_diagnostic_as_input():
+    composite = DiagnosticComposite(
+        MockFunctionDiagnostic(['a'], 'a_max', lambda a: a),
+        MockFunctionDiagnostic(['e', 'a_max'], 'e', lambda e, a_max: e))
+    state = get_dependency_state()
+    state['e'] = DataArray(np.ones(3), dims=['x'], attrs={'units': 'm'})
+    diagnostics = composite(state)
+    assert np.all(diagnostics['e'].values == 1.)
+
+
+def test_diagnostic_composite_skips_unchanged_state_inputs():
+    c_component, b_component, e_component = get_dependent_diagnostics()
+    composite = DiagnosticComposite(
+        c_component, b_component, e_component, skip_unchanged=True)
+    state = State(get_dependency_state())
+    first_diagnostics = composite(state)
+    second_diagnostics = composite(state)
+    assert [c_component.call_count, b_component.call_count,
+            e_component.call_count] == [1, 1, 1]
+    assert second_diagnostics['c'] is first_diagnostics['c']
+    state['a'] = DataArray(np.ones(3)*2., dims=['x'], attrs={'units': 'm'})
+    diagnostics = composite(state)
+    assert [c_component.call_count, b_component.call_count,
+            e_component.call_count] == [2, 2, 1]
+    assert np.all(diagnostics['c'].values == 6.)
+
+
+def test_diagnostic_composite_skips_unchanged_dict_inputs():
+    c_component, b_component, e_component = get_dependent_diagnostics()
+    composite = DiagnosticComposite(
+        c_component, b_component, e_component, skip_unchanged=True)
+    state = get_dependency_state()
+    composite(state)
+    state['d'].values[:] = 5.
+    diagnostics = composite(state)
+    assert [c_component.call_count, b_component.call_count,
+            e_component.call_count] == [1, 1, 2]
+    assert np.all(diagnostics['e'].values == 4.)
+
+
+def test_diagnostic_composite_always_calls_components_without_inputs():
+    diagnostic = MockFunctionDiagnostic([], 'a', lambda: 1.)
+    composite = DiagnosticComposite(diagnostic, skip_unchanged=True)
+    composite({})
+    composite({})
+    assert diagnostic.call_count == 2
+
+
+def test_diagnostic_composite_runs_independent_branches_concurrently():
+    event = threading.Event()
+    composite = DiagnosticComposite(
+        MockFunctionDiagnostic(['a'], 'b', lambda a: event.wait(5.)),
+        MockFunctionDiagnostic(['d'], 'e', lambda d: event.set() or True),
+        MockFunctionDiagnostic(['b', 'e'], 'c', lambda b, e: b and e),
+        n_threads=2)
+    diagnostics = composite(get_dependency_state())
+    assert diagnostics['c']
+
+
 if __name__ == '__main__':
     pytest.main([__file__])
@@ -0,0 +1,160 @@
+import pytest
+import os
+from datetime import timedelta
+import numpy as np
+from sympl import (
+    Prognostic, Implicit, DataArray, PackedState, AdamsBashforth, Leapfrog,
+    AdaptiveRungeKutta, MultiRateTimeStepper, IMEXTimeStepper,
+    UpdateFrequencyWrapper, CheckpointMonitor)
+from .test_timestepping import MockDecayPrognostic, get_state
+
+
+class MockTimePrognostic(Prognostic):
+
+    def __call__(self, state):
+        tendencies = {
+            'air_temperature': DataArray(
+                np.ones((3, 4))*np.sin(state['time'].total_seconds()),
+                dims=['x', 'y'], attrs={'units': 'K/s'}),
+        }
+        return tendencies, {}
+
+
+class MockRelaxationImplicit(Implicit):
+
+    def __call__(self, state, timestep):
+        new_state = {
+            'air_temperature': DataArray(
+                state['air_temperature'].values/(
+                    1. + timestep.total_seconds()),
+                dims=state['air_temperature'].dims, attrs={'units': 'K'}),
+        }
+        return {}, new_state
+
+
+def get_prognostics():
+    return [
+        MockDecayPrognostic(),
+        UpdateFrequencyWrapper(MockTimePrognostic(), timedelta(seconds=3))]
+
+
+time_stepper_factories = {
+    'adams_bashforth': lambda: AdamsBashforth(get_prognostics(), order=3),
+    'adams_bashforth_buffered': lambda: AdamsBashforth(
+        get_prognostics(), order=4, reuse_buffers=True),
+    'leapfrog': lambda: Leapfrog(get_prognostics()),
+    'leapfrog_buffered': lambda: Leapfrog(
+        get_prognostics(), reuse_buffers=True),
+    'adaptive_runge_kutta': lambda: AdaptiveRungeKutta(
+        get_prognostics(), rtol=1e-8),
+    'multi_rate': lambda: MultiRateTimeStepper(
+        [([MockDecayPrognostic()], 4),
+         ([UpdateFrequencyWrapper(
+             MockTimePrognostic(), timedelta(seconds=3))], 2)],
+        time_stepper_class=AdamsBashforth, extrapolate=True),
+    'imex': lambda: IMEXTimeStepper(
+        [MockRelaxationImplicit()], get_prognostics(),
+        time_stepper_class=AdamsBashforth),
+}
+
+
+@pytest.mark.parametrize('packed', [False, True])
+@pytest.mark.parametrize('name', sorted(time_stepper_factories.keys()))
+def test_restart_from_checkpoint_is_exact(tmpdir, name, packed):
+    filename = str(tmpdir.join('checkpoint.pkl'))
+    factory = time_stepper_factories[name]
+    timestep = timedelta(seconds=1)
+    time_stepper = factory()
+    checkpoint_monitor = CheckpointMonitor(filename, [time_stepper])
+    state = get_state(packed)
+    for i in range(4):
+        diagnostics, state = time_stepper(state, timestep)
+        state['time'] += timestep
+    checkpoint_monitor.store(state)
+    for i in range(4):
+        diagnostics, state = time_stepper(state, timestep)
+        state['time'] += timestep
+
+    restarted_time_stepper = factory()
+    restarted_state = CheckpointMonitor(
+        filename, [restarted_time_stepper]).load()
+    assert isinstance(restarted_state, PackedState) == packed
+    for i in range(4):
+        diagnostics, restarted_state = restarted_time_stepper(
+            restarted_state, timestep)
+        restarted_state['time'] += timestep
+    assert restarted_state['time'] == state['time']
+    assert np.all(
+        restarted_state['air_temperature'].values ==
+        state['air_temperature'].values)
+
+
+def test_adams_bashforth_restart_does_not_spin_up_again():
+    time_stepper = AdamsBashforth([MockDecayPrognostic()], order=3)
+    state = get_state()
+    for i in range(3):
+        diagnostics, state = time_stepper(state, timedelta(seconds=1))
+    checkpoint = time_stepper.get_checkpoint_state()
+    assert len(checkpoint['tendencies_list']) == 2
+    restarted_time_stepper = AdamsBashforth([MockDecayPrognostic()], order=3)
+    restarted_time_stepper.set_checkpoint_state(checkpoint)
+    fresh_time_stepper = AdamsBashforth([MockDecayPrognostic()], order=3)
+    diagnostics, new_state = time_stepper(state, timedelta(seconds=1))
+    diagnostics, restarted_state = restarted_time_stepper(
+        state, timedelta(seconds=1))
+    diagnostics, fresh_state = fresh_time_stepper(state, timedelta(seconds=1))
+    assert np.all(
+        restarted_state['air_temperature'].values ==
+        new_state['air_temperature'].values)
+    assert not np.all(
+        fresh_state['air_temperature'].values ==
+        new_state['air_temperature'].values)
+
+
+def test_checkpoint_is_not_modified_by_later_steps():
+    time_stepper = AdamsBashforth(
+        [MockDecayPrognostic()], order=2, reuse_buffers=True)
+    state = get_state()
+    diagnostics, state = time_stepper(state, timedelta(seconds=1))
+    checkpoint = time_stepper.get_checkpoint_state()
+    ring = checkpoint['tendency_ring']['air_temperature'].copy()
+    for i in range(3):
+        diagnostics, state = time_stepper(state, timedelta(seconds=1))
+    assert np.all(checkpoint['tendency_ring']['air_temperature'] == ring)
+
+
+def test_update_frequency_wrapper_checkpoint():
+    wrapper = UpdateFrequencyWrapper(
+        MockTimePrognostic(), timedelta(seconds=10))
+    state = get_state()
+    state['time'] = timedelta(seconds=1)
+    tendencies, diagnostics = wrapper(state)
+    restarted_wrapper = UpdateFrequencyWrapper(
+        MockTimePrognostic(), timedelta(seconds=10))
+    restarted_wrapper.set_checkpoint_state(wrapper.get_checkpoint_state())
+    state['time'] = timedelta(seconds=5)
+    restarted_tendencies, diagnostics = restarted_wrapper(state)
+    assert np.all(
+        restarted_tendencies['air_temperature'].values == np.sin(1.))
+
+
+def test_adams_bashforth_checkpoint_requires_same_order():
+    time_stepper = AdamsBashforth([MockDecayPrognostic()], order=3)
+    with pytest.raises(ValueError):
+        AdamsBashforth([MockDecayPrognostic()], order=2).set_checkpoint_state(
+            time_stepper.get_checkpoint_state())
+
+
+def test_checkpoint_monitor_requires_same_components(tmpdir):
+    filename = str(tmpdir.join('checkpoint.pkl'))
+    CheckpointMonitor(
+        filename, [AdamsBashforth([MockDecayPrognostic()])]).store(get_state())
+    assert os.path.isfile(filename)
+    with pytest.raises(ValueError):
+        CheckpointMonitor(filename, [Leapfrog([MockDecayPrognostic()])]).load()
+    with pytest.raises(ValueError):
+        CheckpointMonitor(filename, []).load()
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
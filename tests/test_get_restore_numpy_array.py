@@ -1,9 +1,10 @@
 import pytest
 from sympl import (
-    DataArray, set_direction_names, get_numpy_array,
+    DataArray, set_direction_names, add_direction_names, get_numpy_array,
     restore_dimensions, get_numpy_arrays_with_properties,
     restore_data_arrays_with_properties, InvalidStateError,
-    InvalidPropertyDictError)
+    InvalidPropertyDictError, ArrayCopyError)
+from sympl._core.util import array_plan_cache, DimensionNotInOutDimsError
 import numpy as np
 import unittest
 
@@ -309,6 +310,63 @@ def test_get_numpy_array_zyx_to_starz_doesnt_copy():
     assert numpy_array.base is array.values
 
 
+def test_get_numpy_array_reuses_cached_plan():
+    array_plan_cache.clear()
+    array = DataArray(
+        np.random.randn(2, 3, 4),
+        dims=['lon', 'lat', 'mid_levels'],
+        attrs={'units': ''}
+    )
+    first = get_numpy_array(array, ['mid_levels', '*'])
+    assert array_plan_cache.info()['misses'] == 1
+    second = get_numpy_array(array, ['mid_levels', '*'])
+    assert array_plan_cache.info()['misses'] == 1
+    assert array_plan_cache.info()['hits'] == 1
+    assert np.all(first == second)
+    other_shape = DataArray(
+        np.random.randn(3, 3, 4),
+        dims=['lon', 'lat', 'mid_levels'],
+        attrs={'units': ''}
+    )
+    numpy_array = get_numpy_array(other_shape, ['mid_levels', '*'])
+    assert array_plan_cache.info()['misses'] == 2
+    assert numpy_array.shape == (4, 9)
+
+
+def test_get_numpy_array_cached_plan_invalidated_by_direction_names():
+    array = DataArray(
+        np.random.randn(2, 3),
+        dims=['foo', 'bar'],
+        attrs={'units': ''}
+    )
+    try:
+        set_direction_names(x=['foo'], y=['bar'])
+        numpy_array = get_numpy_array(array, ['y', 'x'])
+        assert numpy_array.shape == (3, 2)
+        set_direction_names(x=['bar'], y=['foo'])
+        numpy_array = get_numpy_array(array, ['y', 'x'])
+        assert numpy_array.shape == (2, 3)
+        set_direction_names(x=['foo'], y=[])
+        numpy_array = get_numpy_array(array, ['x', 'y', '*'])
+        assert numpy_array.shape == (2, 1, 3)
+        add_direction_names(y=['bar'])
+        numpy_array = get_numpy_array(array, ['x', 'y', '*'])
+        assert numpy_array.shape == (2, 3, 1)
+    finally:
+        set_direction_names(x=[], y=[], z=[])
+
+
+def test_get_numpy_array_errors_not_cached():
+    array = DataArray(
+        np.random.randn(2, 3),
+        dims=['foo', 'bar'],
+        attrs={'units': ''}
+    )
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            get_numpy_array(array, ['foo'])
+
+
 def test_restore_dimensions_complicated_asterisk():
     array = DataArray(
         np.random.randn(2, 3, 4, 5),
@@ -415,6 +473,134 @@ def test_restore_dimensions_starz_to_zyx_with_attrs():
     assert restored_array.attrs['units'] == 'K'
 
 
+def test_restore_dimensions_shares_coords_and_data():
+    array = DataArray(
+        np.random.randn(2, 3, 4),
+        dims=['z', 'y', 'x'],
+        attrs={'units': ''},
+        coords={'x': np.arange(4.), 'area': (['y', 'x'], np.ones((3, 4)))},
+    )
+    numpy_array = get_numpy_array(array, ['*', 'z'])
+    restored = restore_dimensions(
+        numpy_array, from_dims=['*', 'z'], result_like=array,
+        result_attrs={'units': 'm'})
+    assert restored.dims == array.dims
+    assert np.all(restored.values == array.values)
+    assert np.byte_bounds(restored.values) == np.byte_bounds(array.values)
+    assert restored.indexes['x'] is array.indexes['x']
+    assert np.byte_bounds(restored.coords['area'].values) == np.byte_bounds(
+        array.coords['area'].values)
+    assert restored.attrs == {'units': 'm'}
+    assert array.attrs == {'units': ''}
+
+
+def test_restore_dimensions_into_out():
+    array = DataArray(
+        np.random.randn(2, 3, 4),
+        dims=['z', 'y', 'x'],
+        attrs={'units': ''},
+    )
+    out = DataArray(
+        np.zeros((2, 3, 4)), dims=['z', 'y', 'x'], attrs={'units': 'K'})
+    out_values = out.values
+    numpy_array = get_numpy_array(array, ['*', 'z'])
+    restored = restore_dimensions(
+        numpy_array, from_dims=['*', 'z'], result_like=array,
+        result_attrs={'units': 'm'}, out=out)
+    assert restored is out
+    assert out.values is out_values
+    assert np.all(out.values == array.values)
+    assert out.attrs == {'units': 'm'}
+
+
+def test_restore_dimensions_raises_on_incompatible_out():
+    array = DataArray(
+        np.random.randn(2, 3, 4),
+        dims=['z', 'y', 'x'],
+        attrs={'units': ''},
+    )
+    out = DataArray(np.zeros((4, 3, 2)), dims=['x', 'y', 'z'])
+    numpy_array = get_numpy_array(array, ['*', 'z'])
+    with pytest.raises(ValueError):
+        restore_dimensions(
+            numpy_array, from_dims=['*', 'z'], result_like=array, out=out)
+
+
+def test_get_numpy_array_puts_ensemble_first():
+    array = DataArray(
+        np.random.randn(2, 3, 4),
+        dims=['z', 'ensemble', 'x'],
+        attrs={'units': ''},
+    )
+    numpy_array = get_numpy_array(array, ['x', 'z'], batch_ensemble=True)
+    assert numpy_array.shape == (3, 4, 2)
+    assert np.all(numpy_array == np.transpose(array.values, (1, 2, 0)))
+    restored = restore_dimensions(
+        numpy_array, from_dims=['x', 'z'], result_like=array,
+        batch_ensemble=True)
+    assert restored.dims == ('z', 'ensemble', 'x')
+    assert np.all(restored.values == array.values)
+
+
+def test_get_numpy_array_raises_on_ensemble_without_opt_in():
+    array = DataArray(
+        np.random.randn(2, 3, 4),
+        dims=['z', 'ensemble', 'x'],
+        attrs={'units': ''},
+    )
+    with pytest.raises(DimensionNotInOutDimsError):
+        get_numpy_array(array, ['x', 'z'])
+    with pytest.raises(ValueError):
+        restore_dimensions(
+            np.random.randn(4, 2), from_dims=['x', 'z'], result_like=array)
+
+
+def test_get_numpy_arrays_with_properties_requires_batch_ensemble():
+    state = {
+        'air_temperature': DataArray(
+            np.random.randn(5, 3, 4),
+            dims=['ensemble', 'x', 'z'],
+            attrs={'units': 'K'},
+        ),
+    }
+    property_dictionary = {
+        'air_temperature': {'dims': ['x', 'z'], 'units': 'K'},
+    }
+    with pytest.raises(InvalidStateError):
+        get_numpy_arrays_with_properties(state, property_dictionary)
+    property_dictionary['air_temperature']['batch_ensemble'] = True
+    arrays = get_numpy_arrays_with_properties(state, property_dictionary)
+    assert arrays['air_temperature'].shape == (5, 3, 4)
+    restored = restore_data_arrays_with_properties(
+        arrays, {'air_temperature': {'units': 'K'}}, state,
+        property_dictionary)
+    assert restored['air_temperature'].dims == ('ensemble', 'x', 'z')
+
+
+def test_get_numpy_array_collects_ensemble_in_wildcard():
+    array = DataArray(
+        np.random.randn(5, 3, 4),
+        dims=['ensemble', 'x', 'z'],
+        attrs={'units': ''},
+    )
+    numpy_array = get_numpy_array(array, ['*', 'z'])
+    assert numpy_array.shape == (15, 4)
+    restored = restore_dimensions(
+        numpy_array, from_dims=['*', 'z'], result_like=array)
+    assert restored.dims == ('ensemble', 'x', 'z')
+    assert np.all(restored.values == array.values)
+
+
+def test_get_numpy_array_keeps_explicit_ensemble_position():
+    array = DataArray(
+        np.random.randn(5, 3),
+        dims=['ensemble', 'x'],
+        attrs={'units': ''},
+    )
+    numpy_array = get_numpy_array(array, ['x', 'ensemble'])
+    assert numpy_array.shape == (3, 5)
+
+
 def test_restore_dimensions_3d_reverse():
     array = DataArray(
         np.random.randn(2, 3, 4),
@@ -1067,6 +1253,93 @@ class GetNumpyArraysWithPropertiesTests(unittest.TestCase):
         else:
             raise AssertionError('should have raised InvalidStateError')
 
+    def test_view_not_reported_as_copy(self):
+        T_array = np.zeros([2, 3, 4], dtype=np.float64) + 280.
+        property_dictionary = {
+            'air_temperature': {
+                'units': 'degK',
+                'dims': ['*', 'z'],
+            },
+        }
+        state = {
+            'air_temperature': DataArray(
+                T_array,
+                dims=['x', 'y', 'z'],
+                attrs={'units': 'degK'},
+            ),
+        }
+        copy_report = {}
+        return_value = get_numpy_arrays_with_properties(
+            state, property_dictionary, allow_copy=False,
+            copy_report=copy_report)
+        assert return_value['air_temperature'].base is T_array
+        assert copy_report == {}
+
+    def test_layout_copy_is_reported(self):
+        T_array = np.zeros([2, 3, 4], dtype=np.float64) + 280.
+        property_dictionary = {
+            'air_temperature': {
+                'units': 'degK',
+                'dims': ['y', '*'],
+                'alias': 'T',
+            },
+        }
+        state = {
+            'air_temperature': DataArray(
+                T_array,
+                dims=['x', 'y', 'z'],
+                attrs={'units': 'degK'},
+            ),
+        }
+        copy_report = {}
+        return_value = get_numpy_arrays_with_properties(
+            state, property_dictionary, copy_report=copy_report)
+        assert return_value['T'].shape == (3, 8)
+        assert copy_report == {
+            'air_temperature': {'nbytes': 2*3*4*8, 'reason': 'layout'}}
+
+    def test_unit_conversion_copy_is_reported(self):
+        T_array = np.zeros([2, 3, 4], dtype=np.float32) + 280.
+        property_dictionary = {
+            'air_temperature': {
+                'units': 'degC',
+                'dims': ['x', 'y', 'z'],
+            },
+        }
+        state = {
+            'air_temperature': DataArray(
+                T_array,
+                dims=['x', 'y', 'z'],
+                attrs={'units': 'degK'},
+            ),
+        }
+        copy_report = {}
+        get_numpy_arrays_with_properties(
+            state, property_dictionary, copy_report=copy_report)
+        assert copy_report == {
+            'air_temperature': {'nbytes': 2*3*4*4, 'reason': 'units'}}
+
+    def test_strict_mode_raises_on_copy(self):
+        T_array = np.zeros([2, 3, 4], dtype=np.float64) + 280.
+        property_dictionary = {
+            'air_temperature': {
+                'units': 'degK',
+                'dims': ['y', '*'],
+            },
+        }
+        state = {
+            'air_temperature': DataArray(
+                T_array,
+                dims=['x', 'y', 'z'],
+                attrs={'units': 'degK'},
+            ),
+        }
+        with self.assertRaises(ArrayCopyError) as context:
+            get_numpy_arrays_with_properties(
+                state, property_dictionary, allow_copy=False)
+        assert 'air_temperature' in str(context.exception)
+        assert '192 bytes' in str(context.exception)
+
 
 class RestoreDataArraysWithPropertiesTests(unittest.TestCase):
 
@@ -1230,6 +1503,48 @@ class RestoreDataArraysWithPropertiesTests(unittest.TestCase):
         assert return_value['air_temperature_tendency'].coords['z'].attrs['units'] == 'cm'
         assert return_value['air_temperature_tendency'].dims == input_state['air_temperature'].dims
 
+    def test_restores_into_out(self):
+        input_state = {
+            'air_temperature': DataArray(
+                np.zeros([2, 2, 4]),
+                dims=['x', 'y', 'z'],
+                attrs={'units': 'degK'},
+            )
+        }
+        input_properties = {
+            'air_temperature': {
+                'dims': ['z', 'x', 'y'],
+                'units': 'degK',
+            }
+        }
+        output_properties = {
+            'air_temperature_tendency': {
+                'dims_like': 'air_temperature',
+                'units': 'degK/s',
+            },
+            'air_pressure': {
+                'dims_like': 'air_temperature',
+                'units': 'Pa',
+            },
+        }
+        raw_arrays = {
+            'air_temperature_tendency': np.ones([4, 2, 2]),
+            'air_pressure': np.ones([4, 2, 2]),
+        }
+        out = {
+            'air_temperature_tendency': DataArray(
+                np.zeros([2, 2, 4]), dims=['x', 'y', 'z']),
+        }
+        return_value = restore_data_arrays_with_properties(
+            raw_arrays, output_properties, input_state, input_properties,
+            out=out)
+        assert return_value['air_temperature_tendency'] is out[
+            'air_temperature_tendency']
+        assert np.all(out['air_temperature_tendency'].values == 1.)
+        assert out['air_temperature_tendency'].attrs['units'] == 'degK/s'
+        assert return_value['air_pressure'].dims == ('x', 'y', 'z')
+        assert np.all(return_value['air_pressure'].values == 1.)
+
     def test_restores_matched_coords(self):
         set_direction_names(x=['lon'], y=['lat'], z=['height'])
         x = np.array([0., 10.])
@@ -0,0 +1,48 @@
+import pytest
+import subprocess
+import sys
+
+# Time in seconds that importing sympl may take once its required
+# dependencies numpy and xarray have already been imported.
+IMPORT_TIME_BUDGET = 0.1
+
+
+def run_python(code):
+    return subprocess.check_output(
+        [sys.executable, '-c', code]).decode('utf-8').strip()
+
+
+def test_import_sympl_does_not_import_optional_backends():
+    output = run_python(
+        'import sys\n'
+        'import sympl\n'
+        'print(",".join(name for name in ("pint", "netCDF4", "netcdftime") '
+        'if name in sys.modules))\n')
+    assert output == ''
+
+
+def test_unit_registry_created_on_first_use():
+    output = run_python(
+        'import sympl\n'
+        'from sympl._core import units\n'
+        'print(units._unit_registry is None)\n'
+        'sympl.DataArray([1.], attrs={"units": "km"}).to_units("m")\n'
+        'print(units._unit_registry is None)\n')
+    assert output.split() == ['True', 'False']
+
+
+def test_import_time_within_budget():
+    # take the best of a few runs to reduce noise from the test machine
+    import_times = []
+    for _ in range(3):
+        import_times.append(float(run_python(
+            'import numpy, xarray\n'
+            'import time\n'
+            'start = time.time()\n'
+            'import sympl\n'
+            'print(time.time() - start)\n')))
+    assert min(import_times) < IMPORT_TIME_BUDGET
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,136 @@
+import pytest
+from datetime import timedelta
+import numpy as np
+from sympl import (
+    Model, Prognostic, Diagnostic, Monitor, AdamsBashforth, DataArray)
+
+
+class MockPrognostic(Prognostic):
+
+    def __call__(self, state):
+        tendencies = {
+            'air_temperature': DataArray(
+                -0.01*state['air_temperature'].values, dims=['x'],
+                attrs={'units': 'K/s'}),
+        }
+        return tendencies, {'prognostic_diagnostic': state['time']}
+
+
+class MockDiagnostic(Diagnostic):
+
+    def __call__(self, state):
+        return {'mean_air_temperature': DataArray(
+            np.mean(state['air_temperature'].values), attrs={'units': 'K'})}
+
+
+class MockMonitor(Monitor):
+
+    def __init__(self):
+        self.times = []
+        self.states = []
+
+    def store(self, state):
+        self.times.append(state['time'])
+        self.states.append(state)
+
+
+def get_state():
+    return {
+        'air_temperature': DataArray(
+            np.ones(3)*273., dims=['x'], attrs={'units': 'K'}),
+        'time': timedelta(0),
+    }
+
+
+def get_model(monitors=()):
+    return Model(
+        AdamsBashforth([MockPrognostic()]), timedelta(minutes=10),
+        diagnostic_list=[MockDiagnostic()], monitors=monitors)
+
+
+def test_model_run_matches_manual_loop():
+    state = get_state()
+    time_stepper = AdamsBashforth([MockPrognostic()])
+    for i in range(5):
+        diagnostics, next_state = time_stepper(state, timedelta(minutes=10))
+        next_state['time'] = state['time'] + timedelta(minutes=10)
+        state = next_state
+    model_state = get_model().run(get_state(), n_steps=5)
+    assert model_state['time'] == timedelta(minutes=50)
+    assert np.all(
+        model_state['air_temperature'].values ==
+        state['air_temperature'].values)
+
+
+def test_model_stores_complete_states_in_monitors():
+    monitor = MockMonitor()
+    get_model(monitors=[monitor]).run(get_state(), n_steps=3)
+    assert monitor.times == [timedelta(minutes=10*i) for i in range(3)]
+    for state in monitor.states:
+        assert 'mean_air_temperature' in state
+        assert state['prognostic_diagnostic'] == state['time']
+
+
+def test_model_monitor_step_cadence():
+    monitor = MockMonitor()
+    get_model(monitors=[(monitor, 3)]).run(get_state(), n_steps=7)
+    assert monitor.times == [timedelta(minutes=10*i) for i in (0, 3, 6)]
+
+
+def test_model_monitor_time_cadence():
+    monitor = MockMonitor()
+    get_model(monitors=[(monitor, timedelta(minutes=25))]).run(
+        get_state(), n_steps=8)
+    assert monitor.times == [timedelta(minutes=10*i) for i in (0, 3, 5)]
+
+
+def test_model_step_cadence_continues_across_runs():
+    monitor = MockMonitor()
+    model = get_model(monitors=[(monitor, 2)])
+    state = model.run(get_state(), n_steps=3)
+    model.run(state, n_steps=3)
+    assert model.step_count == 6
+    assert monitor.times == [timedelta(minutes=10*i) for i in (0, 2, 4)]
+
+
+def test_model_runs_until_end_time():
+    state = get_model().run(get_state(), end_time=timedelta(minutes=35))
+    assert state['time'] == timedelta(minutes=40)
+
+
+def test_model_iterate_yields_each_state():
+    model = get_model()
+    times = []
+    for state in model.iterate(get_state(), n_steps=4):
+        assert 'mean_air_temperature' in state
+        times.append(state['time'])
+    assert times == [timedelta(minutes=10*i) for i in range(4)]
+    assert model.last_state['time'] == timedelta(minutes=40)
+
+
+def test_model_records_timings():
+    model = get_model(monitors=[MockMonitor()])
+    model.run(get_state(), n_steps=3)
+    assert set(model.timings.keys()) == {
+        'diagnostics', 'time_stepper', 'monitors'}
+    assert model.timings['time_stepper'] > 0.
+    model.reset_timings()
+    assert all(value == 0. for value in model.timings.values())
+
+
+def test_model_requires_one_of_n_steps_or_end_time():
+    model = get_model()
+    with pytest.raises(ValueError):
+        model.iterate(get_state())
+    with pytest.raises(ValueError):
+        model.run(get_state(), n_steps=1, end_time=timedelta(hours=1))
+
+
+@pytest.mark.parametrize('cadence', [0, 1.5, timedelta(0)])
+def test_model_rejects_invalid_cadence(cadence):
+    with pytest.raises(ValueError):
+        get_model(monitors=[(MockMonitor(), cadence)])
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
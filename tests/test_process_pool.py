@@ -0,0 +1,164 @@
+import pytest
+from datetime import timedelta
+import numpy as np
+from sympl import (
+    Prognostic, PrognosticComposite, ProcessPrognosticComposite,
+    AdamsBashforth, DataArray, DependencyError)
+from .test_base_components import get_scaled_prognostics
+from .test_wrapper import MockCountingPrognostic, get_height_state
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+requires_shared_memory = pytest.mark.skipif(
+    shared_memory is None, reason='multiprocessing.shared_memory is required')
+
+
+class MockModifyingPrognostic(Prognostic):
+
+    input_properties = {
+        'air_temperature': {'dims': ['x'], 'units': 'K'},
+    }
+
+    def __call__(self, state):
+        state['air_temperature'].values[:] = 1.
+        return {}, {}
+
+
+def get_state(shape=(4, 3)):
+    return {
+        'air_temperature': DataArray(
+            250. + np.arange(np.prod(shape)).reshape(shape),
+            dims=['x', 'y'][:len(shape)], attrs={'units': 'K'}),
+        'time': timedelta(hours=1),
+    }
+
+
+@requires_shared_memory
+def test_process_composite_matches_serial():
+    serial = PrognosticComposite(*get_scaled_prognostics())
+    tendencies, diagnostics = serial(get_state())
+    with ProcessPrognosticComposite(
+            *get_scaled_prognostics(), n_processes=2) as composite:
+        process_tendencies, process_diagnostics = composite(get_state())
+    assert process_tendencies['air_temperature'].attrs == (
+        tendencies['air_temperature'].attrs)
+    assert np.all(
+        process_tendencies['air_temperature'].values ==
+        tendencies['air_temperature'].values)
+    assert set(process_diagnostics.keys()) == set(diagnostics.keys())
+    for key, value in diagnostics.items():
+        if isinstance(value, DataArray):
+            assert np.all(process_diagnostics[key].values == value.values)
+        else:
+            assert process_diagnostics[key] == value
+
+
+@requires_shared_memory
+def test_process_composite_outputs_are_not_overwritten():
+    with ProcessPrognosticComposite(
+            MockCountingPrognostic(), MockCountingPrognostic()) as composite:
+        first_tendencies, _ = composite(get_height_state(1.))
+        second_tendencies, _ = composite(get_height_state(2.))
+    assert np.all(
+        first_tendencies['air_temperature'].values == np.arange(100.)*2e-3)
+    assert np.all(
+        second_tendencies['air_temperature'].values == np.arange(100.)*4e-3)
+
+
+@requires_shared_memory
+def test_process_composite_shares_only_inputs():
+    state = get_height_state()
+    state['unused_quantity'] = DataArray(
+        np.zeros(1000), dims=['z'], attrs={'units': ''})
+    with ProcessPrognosticComposite(MockCountingPrognostic()) as composite:
+        composite(state)
+        assert list(composite._state_segments._segments.keys()) == [
+            ('surface_height',)]
+
+
+@requires_shared_memory
+def test_process_composite_handles_changing_shapes():
+    with ProcessPrognosticComposite(*get_scaled_prognostics()) as composite:
+        for shape in [(2, 3), (5, 4), (3,), (5, 4)]:
+            tendencies, _ = composite(get_state(shape))
+            expected, _ = PrognosticComposite(*get_scaled_prognostics())(
+                get_state(shape))
+            assert np.all(
+                tendencies['air_temperature'].values ==
+                expected['air_temperature'].values)
+
+
+@requires_shared_memory
+def test_process_composite_in_time_stepper():
+    time_stepper = AdamsBashforth(get_scaled_prognostics())
+    state = get_state()
+    with ProcessPrognosticComposite(*get_scaled_prognostics()) as composite:
+        process_time_stepper = AdamsBashforth(composite)
+        process_state = get_state()
+        for i in range(3):
+            _, state = time_stepper(state, timedelta(seconds=10))
+            _, process_state = process_time_stepper(
+                process_state, timedelta(seconds=10))
+    assert np.all(
+        process_state['air_temperature'].values ==
+        state['air_temperature'].values)
+
+
+@requires_shared_memory
+def test_process_composite_checkpoint():
+    with ProcessPrognosticComposite(
+            MockCountingPrognostic(), MockCountingPrognostic(),
+            MockCountingPrognostic(), n_processes=2) as composite:
+        composite(get_height_state())
+        composite(get_height_state())
+        checkpoint = composite.get_checkpoint_state()
+    assert checkpoint == {'components': [{'call_count': 2}]*3}
+    with ProcessPrognosticComposite(
+            MockCountingPrognostic(), MockCountingPrognostic(),
+            MockCountingPrognostic(), n_processes=2) as composite:
+        composite.set_checkpoint_state(checkpoint)
+        composite(get_height_state())
+        with pytest.raises(ValueError):
+            composite.set_checkpoint_state({'components': []})
+        assert composite.get_checkpoint_state() == {
+            'components': [{'call_count': 3}]*3}
+
+
+@requires_shared_memory
+def test_process_composite_raises_worker_errors():
+    with ProcessPrognosticComposite(
+            MockCountingPrognostic(), MockModifyingPrognostic()) as composite:
+        # input arrays are read-only in the worker processes
+        with pytest.raises(ValueError):
+            composite(get_height_state())
+        state = get_height_state()
+        composite.set_checkpoint_state(
+            {'components': [{'call_count': 0}, None]})
+        with pytest.raises(ValueError):
+            composite(state)
+    assert np.all(state['air_temperature'].values == 0.)
+    with pytest.raises(RuntimeError):
+        composite(get_state())
+
+
+@requires_shared_memory
+def test_process_composite_rejects_invalid_n_processes():
+    with pytest.raises(ValueError):
+        ProcessPrognosticComposite(MockCountingPrognostic(), n_processes=0)
+    with pytest.raises(TypeError):
+        ProcessPrognosticComposite(MockCountingPrognostic(), n_threads=2)
+
+
+@pytest.mark.skipif(
+    shared_memory is not None,
+    reason='multiprocessing.shared_memory is available')
+def test_process_composite_requires_shared_memory():
+    with pytest.raises(DependencyError):
+        ProcessPrognosticComposite(MockCountingPrognostic())
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
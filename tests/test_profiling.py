@@ -0,0 +1,230 @@
+import json
+import os
+from datetime import timedelta
+import pytest
+import numpy as np
+from sympl import (
+    Prognostic, Diagnostic, Monitor, AdamsBashforth, DataArray,
+    enable_profiling, disable_profiling, profile_registry,
+    get_numpy_arrays_with_properties, restore_data_arrays_with_properties)
+from sympl._core.units import data_array_to_units
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+class MockPrognostic(Prognostic):
+
+    def __call__(self, state):
+        return {
+            'air_temperature': DataArray(
+                -0.01*state['air_temperature'].values, dims=['x'],
+                attrs={'units': 'K/s'}),
+        }, {}
+
+
+class MockSubclassPrognostic(MockPrognostic):
+
+    def __call__(self, state):
+        return super(MockSubclassPrognostic, self).__call__(state)
+
+
+class MockMarshallingDiagnostic(Diagnostic):
+
+    input_properties = {
+        'air_temperature': {'dims': ['x'], 'units': 'degC'},
+    }
+    diagnostic_properties = {
+        'air_temperature_squared': {
+            'dims_like': 'air_temperature', 'units': 'degC^2'},
+    }
+
+    def __call__(self, state):
+        raw_state = get_numpy_arrays_with_properties(
+            state, self.input_properties)
+        raw_diagnostics = {
+            'air_temperature_squared': raw_state['air_temperature']**2}
+        return restore_data_arrays_with_properties(
+            raw_diagnostics, self.diagnostic_properties, state,
+            self.input_properties)
+
+
+class MockAllocatingDiagnostic(Diagnostic):
+
+    def __call__(self, state):
+        return {'large_quantity': DataArray(
+            np.ones(100000), dims=['x'], attrs={'units': ''})}
+
+
+class MockMonitor(Monitor):
+
+    def store(self, state):
+        pass
+
+
+def get_state():
+    return {
+        'air_temperature': DataArray(
+            np.ones(3)*273., dims=['x'], attrs={'units': 'K'}),
+        'time': timedelta(0),
+    }
+
+
+@pytest.fixture(autouse=True)
+def reset_profiling():
+    profile_registry.reset()
+    yield
+    disable_profiling()
+    profile_registry.reset()
+
+
+def test_profiling_records_nested_calls():
+    time_stepper = AdamsBashforth([MockPrognostic()])
+    state = get_state()
+    enable_profiling()
+    for i in range(3):
+        diagnostics, state = time_stepper(state, timedelta(minutes=10))
+    disable_profiling()
+    stats = profile_registry.stats
+    prognostic_stats = stats[('MockPrognostic', 'Prognostic')]
+    stepper_stats = stats[('AdamsBashforth', 'TimeStepper')]
+    assert prognostic_stats['calls'] == 3
+    assert stepper_stats['calls'] == 3
+    assert stepper_stats['total_time'] >= prognostic_stats['total_time']
+    assert np.isclose(
+        stepper_stats['self_time'],
+        stepper_stats['total_time'] - prognostic_stats['total_time'])
+
+
+def test_profiling_counts_super_calls_once():
+    prognostic = MockSubclassPrognostic()
+    enable_profiling()
+    prognostic(get_state())
+    disable_profiling()
+    stats = profile_registry.stats
+    assert stats[('MockSubclassPrognostic', 'Prognostic')]['calls'] == 1
+    assert ('MockPrognostic', 'Prognostic') not in stats
+
+
+def test_profiling_records_monitor_store():
+    enable_profiling()
+    MockMonitor().store(get_state())
+    disable_profiling()
+    assert profile_registry.stats[('MockMonitor', 'Monitor')]['calls'] == 1
+
+
+def test_profiling_splits_marshalling_and_unit_conversion():
+    diagnostic = MockMarshallingDiagnostic()
+    enable_profiling()
+    diagnostic(get_state())
+    disable_profiling()
+    stats = profile_registry.stats[('MockMarshallingDiagnostic', 'Diagnostic')]
+    assert stats['marshalling_time'] > 0.
+    # unit conversion inside marshalling is counted only as marshalling
+    assert stats['unit_conversion_time'] == 0.
+    assert np.isclose(
+        stats['self_time'],
+        stats['component_time'] + stats['marshalling_time'])
+
+
+def test_profiling_records_unit_conversion():
+
+    class MockConvertingPrognostic(MockPrognostic):
+        def __call__(self, state):
+            data_array_to_units(state['air_temperature'], 'degC')
+            return {}, {}
+
+    enable_profiling()
+    MockConvertingPrognostic()(get_state())
+    disable_profiling()
+    stats = profile_registry.stats[('MockConvertingPrognostic', 'Prognostic')]
+    assert stats['unit_conversion_time'] > 0.
+    assert stats['marshalling_time'] == 0.
+
+
+def test_overhead_outside_components_is_not_recorded():
+    enable_profiling()
+    data_array_to_units(get_state()['air_temperature'], 'degC')
+    disable_profiling()
+    assert profile_registry.stats == {}
+    assert profile_registry.get_chrome_trace()['traceEvents'] == []
+
+
+def test_nothing_recorded_when_disabled():
+    MockPrognostic()(get_state())
+    MockMarshallingDiagnostic()(get_state())
+    assert profile_registry.stats == {}
+
+
+def test_disable_profiling_restores_methods():
+    original = MockPrognostic.__dict__['__call__']
+    enable_profiling()
+    assert MockPrognostic.__dict__['__call__'] is not original
+    enable_profiling()  # enabling again does not wrap twice
+    disable_profiling()
+    assert MockPrognostic.__dict__['__call__'] is original
+
+
+def test_chrome_trace(tmpdir):
+    time_stepper = AdamsBashforth([MockPrognostic()])
+    enable_profiling()
+    time_stepper(get_state(), timedelta(minutes=10))
+    disable_profiling()
+    filename = os.path.join(str(tmpdir), 'trace.json')
+    profile_registry.write_chrome_trace(filename)
+    with open(filename, 'r') as f:
+        trace = json.load(f)
+    events = trace['traceEvents']
+    for event in events:
+        assert event['ph'] == 'X'
+        assert event['dur'] >= 0.
+    assert set(
+        event['name'] for event in events if event['cat'] in
+        ('TimeStepper', 'Prognostic')) == {'AdamsBashforth', 'MockPrognostic'}
+    # unit conversion of the tendencies by the time stepper
+    assert 'unit_conversion' in set(event['cat'] for event in events)
+    stepper_event = [e for e in events if e['name'] == 'AdamsBashforth'][0]
+    prognostic_event = [e for e in events if e['name'] == 'MockPrognostic'][0]
+    assert stepper_event['ts'] <= prognostic_event['ts']
+    assert stepper_event['cat'] == 'TimeStepper'
+
+
+def test_max_events_drops_events():
+    prognostic = MockPrognostic()
+    enable_profiling(max_events=2)
+    for i in range(5):
+        prognostic(get_state())
+    disable_profiling()
+    assert len(profile_registry.get_chrome_trace()['traceEvents']) == 2
+    assert profile_registry.dropped_events == 3
+    assert profile_registry.stats[('MockPrognostic', 'Prognostic')][
+        'calls'] == 5
+
+
+def test_summary_contains_components():
+    time_stepper = AdamsBashforth([MockPrognostic()])
+    enable_profiling(record_events=False)
+    time_stepper(get_state(), timedelta(minutes=10))
+    disable_profiling()
+    summary = profile_registry.summary()
+    assert 'AdamsBashforth (TimeStepper)' in summary
+    assert 'MockPrognostic (Prognostic)' in summary
+    assert profile_registry.get_chrome_trace()['traceEvents'] == []
+
+
+@pytest.mark.skipif(tracemalloc is None, reason='tracemalloc not available')
+def test_profiling_traces_memory():
+    diagnostic = MockAllocatingDiagnostic()
+    enable_profiling(trace_memory=True)
+    assert tracemalloc.is_tracing()
+    outputs = diagnostic({})
+    disable_profiling()
+    assert not tracemalloc.is_tracing()
+    stats = profile_registry.stats[('MockAllocatingDiagnostic', 'Diagnostic')]
+    assert stats['memory'] >= outputs['large_quantity'].values.nbytes
+    assert 'memory (MB)' in profile_registry.summary()
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
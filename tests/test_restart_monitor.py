@@ -24,19 +24,15 @@ state = {
 }
 
 
-def test_restart_monitor_initializes():
-    restart_filename = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'restart.nc')
-    if os.path.isfile(restart_filename):
-        os.remove(restart_filename)
+def test_restart_monitor_initializes(tmpdir):
+    restart_filename = str(tmpdir.join('restart.nc'))
     assert not os.path.isfile(restart_filename)
     RestartMonitor(restart_filename)
     assert not os.path.isfile(restart_filename)  # should not create file on init
 
 
-def test_restart_monitor_stores_state():
-    restart_filename = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'restart.nc')
-    if os.path.isfile(restart_filename):
-        os.remove(restart_filename)
+def test_restart_monitor_stores_state(tmpdir):
+    restart_filename = str(tmpdir.join('restart.nc'))
     assert not os.path.isfile(restart_filename)
     monitor = RestartMonitor(restart_filename)
     assert not os.path.isfile(restart_filename)  # should not create file on init
@@ -0,0 +1,218 @@
+import pytest
+import numpy as np
+import copy
+from datetime import timedelta
+from sympl import (
+    State, PackedState, DataArray, InvalidStateError, Prognostic,
+    AdamsBashforth, Leapfrog, get_numpy_arrays_with_properties)
+from .test_timestepping import MockDecayPrognostic
+
+
+def get_array(shape, dims):
+    return DataArray(np.zeros(shape), dims=dims, attrs={'units': 'm'})
+
+
+def test_state_is_dict():
+    state = State({'a': get_array((2, 3), ['x', 'y']), 'time': 0.})
+    assert isinstance(state, dict)
+    assert set(state.keys()) == {'a', 'time'}
+
+
+def test_state_records_dimension_lengths():
+    state = State(a=get_array((2, 3), ['x', 'y']), b=get_array((4,), ['z']))
+    assert state.dimension_lengths == {'x': 2, 'y': 3, 'z': 4}
+
+
+def test_state_raises_on_inconsistent_insert():
+    state = State(a=get_array((2, 3), ['x', 'y']))
+    with pytest.raises(InvalidStateError):
+        state['b'] = get_array((3,), ['x'])
+    assert 'b' not in state
+
+
+def test_state_raises_on_inconsistent_init():
+    with pytest.raises(InvalidStateError):
+        State(a=get_array((2, 3), ['x', 'y']), b=get_array((3,), ['x']))
+
+
+def test_state_allows_replacing_only_array_with_dimension():
+    state = State(a=get_array((2, 3), ['x', 'y']), b=get_array((3,), ['y']))
+    state['a'] = get_array((5, 3), ['x', 'y'])
+    assert state.dimension_lengths == {'x': 5, 'y': 3}
+    with pytest.raises(InvalidStateError):
+        state['a'] = get_array((5, 4), ['x', 'y'])
+
+
+def test_state_forgets_dimensions_of_removed_arrays():
+    state = State(a=get_array((2, 3), ['x', 'y']), b=get_array((3,), ['y']))
+    del state['a']
+    assert state.dimension_lengths == {'y': 3}
+    state.pop('b')
+    assert state.dimension_lengths == {}
+    state['c'] = get_array((4,), ['y'])
+    assert state.dimension_lengths == {'y': 4}
+
+
+def test_state_version_changes_on_assignment():
+    array = get_array((2,), ['x'])
+    state = State(a=array, b=get_array((2,), ['x']))
+    version_a = state.version('a')
+    version_b = state.version('b')
+    assert version_a != version_b
+    state['a'] = array
+    assert state.version('a') != version_a
+    assert state.version('b') == version_b
+
+
+def test_state_mark_modified_changes_version():
+    state = State(a=get_array((2,), ['x']))
+    version = state.version('a')
+    state['a'].values[:] = 1.
+    assert state.version('a') == version
+    state.mark_modified('a')
+    assert state.version('a') != version
+    with pytest.raises(KeyError):
+        state.mark_modified('b')
+
+
+def test_state_copy_keeps_versions_and_dimensions():
+    state = State(a=get_array((2,), ['x']))
+    state_copy = state.copy()
+    assert isinstance(state_copy, State)
+    assert state_copy.version('a') == state.version('a')
+    assert state_copy.dimension_lengths == {'x': 2}
+    state_copy['a'] = get_array((2,), ['x'])
+    assert state_copy.version('a') != state.version('a')
+
+
+def test_state_deepcopy():
+    state = State(a=get_array((2,), ['x']), time=1.)
+    state_copy = copy.deepcopy(state)
+    assert isinstance(state_copy, State)
+    assert state_copy.dimension_lengths == {'x': 2}
+    assert state_copy['a'] is not state['a']
+    assert state_copy['time'] == 1.
+
+
+def test_state_skips_revalidation_in_get_numpy_arrays():
+    state = State(a=get_array((2, 3), ['x', 'y']))
+    arrays = get_numpy_arrays_with_properties(
+        state, {'a': {'dims': ['x', 'y'], 'units': 'm'}})
+    assert arrays['a'].shape == (2, 3)
+
+
+class MockPrognostic(Prognostic):
+
+    def __call__(self, state):
+        tendency = DataArray(np.ones(2), dims=['x'], attrs={'units': 'm/s'})
+        return {'a': tendency}, {}
+
+
+@pytest.mark.parametrize('timestepper_class', [AdamsBashforth, Leapfrog])
+def test_timestepper_returns_state_keeping_untouched_versions(
+        timestepper_class):
+    state = State(
+        a=get_array((2,), ['x']), b=get_array((2,), ['x']),
+        time=timedelta(0))
+    version_a = state.version('a')
+    version_b = state.version('b')
+    time_stepper = timestepper_class([MockPrognostic()])
+    diagnostics, new_state = time_stepper(state, timedelta(seconds=1))
+    assert isinstance(new_state, State)
+    assert np.all(new_state['a'].values == 1.)
+    assert new_state.version('b') == version_b
+    assert new_state.version('a') != version_a
+
+
+def get_packable_state():
+    return {
+        'a': DataArray(
+            np.arange(6.).reshape((2, 3)), dims=['x', 'y'],
+            attrs={'units': 'm'}),
+        'b': DataArray(
+            np.arange(3.) + 10., dims=['y'], attrs={'units': 'K'}),
+        'time': timedelta(0),
+    }
+
+
+def test_packed_state_views_buffer():
+    state = PackedState(get_packable_state())
+    assert state.packed_names == frozenset(['a', 'b'])
+    assert state.buffer.shape == (9,)
+    assert state['a'].dims == ('x', 'y')
+    assert state['a'].attrs['units'] == 'm'
+    assert np.all(state['a'].values == np.arange(6.).reshape((2, 3)))
+    state.buffer[:] = 0.
+    assert np.all(state['a'].values == 0.)
+    assert np.all(state['b'].values == 0.)
+
+
+def test_packed_state_float32_buffer():
+    state = PackedState(get_packable_state(), packed_names=['b'],
+                        dtype=np.float32)
+    assert state.packed_names == frozenset(['b'])
+    assert state.buffer.dtype == np.float32
+    assert state['b'].dtype == np.float32
+
+
+def test_packed_state_keeps_in_place_modifications_packed():
+    state = PackedState(get_packable_state())
+    state['a'] += 1.
+    assert state.packed_names == frozenset(['a', 'b'])
+    assert state.buffer[0] == 1.
+
+
+def test_packed_state_assignment_unpacks_without_modifying_copies():
+    state = PackedState(get_packable_state())
+    copied_state = state.copy()
+    assert copied_state.buffer is state.buffer
+    copied_state['a'] = get_array((2, 3), ['x', 'y'])
+    assert copied_state.packed_names == frozenset(['b'])
+    assert not copied_state.is_fully_packed()
+    assert state.is_fully_packed()
+    assert state.buffer[1] == 1.
+
+
+def test_packed_state_pack_transposes():
+    state = PackedState(get_packable_state())
+    tendencies = {
+        'a': DataArray(
+            np.ones((3, 2)), dims=['y', 'x'], attrs={'units': 'm/s'}),
+        'b': DataArray(np.zeros(3), dims=['y'], attrs={'units': 'K/s'}),
+    }
+    packed = state.pack(tendencies)
+    assert np.all(packed == [1., 1., 1., 1., 1., 1., 0., 0., 0.])
+
+
+def test_packed_state_with_buffer():
+    state = PackedState(get_packable_state())
+    new_state = state.with_buffer(np.zeros(9))
+    assert isinstance(new_state, PackedState)
+    assert new_state.is_fully_packed()
+    assert new_state['time'] is state['time']
+    assert np.all(new_state['a'].values == 0.)
+    assert state.buffer[1] == 1.
+    with pytest.raises(ValueError):
+        state.with_buffer(np.zeros(8))
+
+
+@pytest.mark.parametrize('timestepper_class', [AdamsBashforth, Leapfrog])
+def test_packed_timestepping_matches_unpacked(timestepper_class):
+    state = get_packable_state()
+    packed_state = PackedState(get_packable_state())
+    time_stepper = timestepper_class([MockDecayPrognostic()])
+    packed_time_stepper = timestepper_class([MockDecayPrognostic()])
+    for i in range(5):
+        diagnostics, state = time_stepper(state, timedelta(seconds=1))
+        diagnostics, packed_state = packed_time_stepper(
+            packed_state, timedelta(seconds=1))
+        assert isinstance(packed_state, PackedState)
+        assert packed_state.is_fully_packed()
+    for name in ('a', 'b'):
+        assert np.all(packed_state[name].values == state[name].values)
+        assert packed_state[name].dims == state[name].dims
+        assert packed_state[name].attrs == state[name].attrs
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -1,7 +1,12 @@
 import pytest
 import mock
 from sympl import (
-    Prognostic, Leapfrog, AdamsBashforth, DataArray)
+    Prognostic, Leapfrog, AdamsBashforth, SSPRungeKutta, RK4,
+    AdaptiveRungeKutta, MultiRateTimeStepper, IMEXTimeStepper, Implicit,
+    ImplicitPrognostic, DataArray, PackedState, stack_ensemble,
+    unstack_ensemble, get_numpy_arrays_with_properties,
+    restore_data_arrays_with_properties)
+from sympl._core.timestepping import get_adams_bashforth_coefficients
 from datetime import timedelta
 import numpy as np
 
@@ -345,6 +350,11 @@ class TestLeapfrog(TimesteppingBase):
     timestepper_class = Leapfrog
 
 
+class TestLeapfrogReusingBuffers(TimesteppingBase):
+    def timestepper_class(self, *args):
+        return Leapfrog(*args, reuse_buffers=True)
+
+
 class TestAdamsBashforthSecondOrder(TimesteppingBase):
     def timestepper_class(self, *args):
         return AdamsBashforth(*args, order=2)
@@ -391,13 +401,479 @@ class TestAdamsBashforthFourthOrder(TimesteppingBase):
         assert (new_state['air_temperature'] == np.ones((3, 3))*277.).all()
 
 
+class TestAdamsBashforthSecondOrderReusingBuffers(TimesteppingBase):
+    def timestepper_class(self, *args):
+        return AdamsBashforth(*args, order=2, reuse_buffers=True)
+
+
+class TestAdamsBashforthFourthOrderReusingBuffers(
+        TestAdamsBashforthFourthOrder):
+    def timestepper_class(self, *args):
+        return AdamsBashforth(*args, order=4, reuse_buffers=True)
+
+
+class TestSSPRungeKuttaTwoStage(TimesteppingBase):
+    def timestepper_class(self, *args):
+        return SSPRungeKutta(*args, stages=2)
+
+
+class TestSSPRungeKuttaThreeStage(TimesteppingBase):
+    def timestepper_class(self, *args):
+        return SSPRungeKutta(*args, stages=3)
+
+    @mock.patch.object(MockPrognostic, '__call__')
+    def test_float_one_step_with_units(self, mock_prognostic_call):
+        # the stage weights are not exact in floating point
+        mock_prognostic_call.return_value = ({'eastward_wind': DataArray(0.02, attrs={'units': 'km/s^2'})}, {})
+        state = {'eastward_wind': DataArray(1., attrs={'units': 'm/s'})}
+        timestep = timedelta(seconds=1.)
+        time_stepper = self.timestepper_class([MockPrognostic()])
+        diagnostics, new_state = time_stepper.__call__(state, timestep)
+        assert state == {'eastward_wind': DataArray(1., attrs={'units': 'm/s'})}
+        assert np.isclose(new_state['eastward_wind'].values, 21.)
+        assert new_state['eastward_wind'].attrs['units'] == 'm/s'
+
+
+class TestRK4(TimesteppingBase):
+    timestepper_class = RK4
+
+
+class TestAdaptiveRungeKutta(TimesteppingBase):
+    timestepper_class = AdaptiveRungeKutta
+
+
+class MockDecayPrognostic(Prognostic):
+
+    def __call__(self, state):
+        # tendencies have reversed dimensions, to check they are transposed
+        tendencies = {}
+        for name, value in state.items():
+            if isinstance(value, DataArray):
+                tendencies[name] = DataArray(
+                    -0.1*value.values.T, dims=value.dims[::-1],
+                    attrs={'units': '{} s^-1'.format(value.attrs['units'])})
+        return tendencies, {}
+
+
+def get_state(packed=False):
+    state = {
+        'air_temperature': DataArray(
+            np.random.RandomState(0).randn(3, 4), dims=['x', 'y'],
+            attrs={'units': 'K'}),
+        'time': timedelta(0),
+    }
+    if packed:
+        state = PackedState(state)
+    return state
+
+
+@pytest.mark.parametrize('order', [1, 2, 3, 4])
+def test_adams_bashforth_reusing_buffers_matches_default(order):
+    state = get_state()
+    buffered_state = state
+    time_stepper = AdamsBashforth([MockDecayPrognostic()], order=order)
+    buffered_time_stepper = AdamsBashforth(
+        [MockDecayPrognostic()], order=order, reuse_buffers=True)
+    output_arrays = set()
+    for i in range(6):
+        diagnostics, state = time_stepper(state, timedelta(seconds=1))
+        diagnostics, buffered_state = buffered_time_stepper(
+            buffered_state, timedelta(seconds=1))
+        assert buffered_state['air_temperature'].dims == ('x', 'y')
+        assert buffered_state['air_temperature'].attrs['units'] == 'K'
+        assert np.allclose(
+            buffered_state['air_temperature'].values,
+            state['air_temperature'].values, rtol=1e-14, atol=0.)
+        output_arrays.add(id(buffered_state['air_temperature'].values.base))
+    assert len(output_arrays) <= 2
+
+
+def test_adams_bashforth_reusing_buffers_keeps_input_state():
+    state = {
+        'air_temperature': DataArray(
+            np.ones((3, 3))*273., dims=['x', 'y'], attrs={'units': 'K'}),
+    }
+    time_stepper = AdamsBashforth(
+        [MockDecayPrognostic()], order=2, reuse_buffers=True)
+    diagnostics, new_state = time_stepper(state, timedelta(seconds=1))
+    diagnostics, newer_state = time_stepper(new_state, timedelta(seconds=1))
+    assert np.all(state['air_temperature'] == 273.)
+    assert not np.may_share_memory(
+        new_state['air_temperature'], newer_state['air_temperature'])
+
+
+class MockPersistentTendencyPrognostic(Prognostic):
+
+    def __init__(self):
+        self._tendency = np.ones((3, 3))
+
+    def __call__(self, state):
+        tendencies = {
+            'air_temperature': DataArray(
+                self._tendency, dims=['x', 'y'], attrs={'units': 'K/hour'}),
+        }
+        return tendencies, {}
+
+
+def test_unit_conversion_keeps_component_tendency_buffer():
+    state = {
+        'air_temperature': DataArray(
+            np.zeros((3, 3)), dims=['x', 'y'], attrs={'units': 'K'}),
+    }
+    prognostic = MockPersistentTendencyPrognostic()
+    time_stepper = AdamsBashforth([prognostic], order=1)
+    for i in range(2):
+        diagnostics, state = time_stepper(state, timedelta(hours=1))
+    assert np.all(prognostic._tendency == 1.)
+    assert np.allclose(state['air_temperature'].values, 2.)
+
+
+def test_ssp_runge_kutta_requires_two_or_three_stages():
+    with pytest.raises(ValueError):
+        SSPRungeKutta([MockPrognostic()], stages=4)
+
+
+class MockExponentialPrognostic(Prognostic):
+
+    def __init__(self):
+        self.times = []
+
+    def __call__(self, state):
+        self.times.append(state['time'])
+        tendencies = {
+            'air_temperature': DataArray(
+                -state['air_temperature'].values.T, dims=['y', 'x'],
+                attrs={'units': 'K/s'}),
+        }
+        return tendencies, {}
+
+
+def get_exponential_error(timestepper, packed, n_steps):
+    state = {
+        'air_temperature': DataArray(
+            np.ones((3, 4)), dims=['x', 'y'], attrs={'units': 'K'}),
+        'time': timedelta(0),
+    }
+    if packed:
+        state = PackedState(state)
+    timestep = timedelta(seconds=1./n_steps)
+    for i in range(n_steps):
+        diagnostics, state = timestepper(state, timestep)
+        state['time'] = state['time'] + timestep
+    return np.abs(state['air_temperature'].values - np.exp(-1.)).max()
+
+
+@pytest.mark.parametrize('packed', [False, True])
+@pytest.mark.parametrize(
+    'timestepper_factory, order', [
+        (lambda prognostic: SSPRungeKutta([prognostic], stages=2), 2),
+        (lambda prognostic: SSPRungeKutta([prognostic], stages=3), 3),
+        (lambda prognostic: RK4([prognostic]), 4),
+    ])
+def test_runge_kutta_order_of_accuracy(timestepper_factory, order, packed):
+    coarse_error = get_exponential_error(
+        timestepper_factory(MockExponentialPrognostic()), packed, 10)
+    fine_error = get_exponential_error(
+        timestepper_factory(MockExponentialPrognostic()), packed, 20)
+    assert 0.8*order < np.log2(coarse_error/fine_error) < 1.2*order
+
+
+@pytest.mark.parametrize('timestepper_class, stage_times', [
+    (lambda prognostics: SSPRungeKutta(prognostics, stages=3),
+     [0., 1., 0.5]),
+    (RK4, [0., 0.5, 0.5, 1.]),
+])
+def test_runge_kutta_stage_times(timestepper_class, stage_times):
+    prognostic = MockExponentialPrognostic()
+    timestepper = timestepper_class([prognostic])
+    state = {
+        'air_temperature': DataArray(
+            np.ones((3, 4)), dims=['x', 'y'], attrs={'units': 'K'}),
+        'time': timedelta(0),
+    }
+    diagnostics, new_state = timestepper(state, timedelta(seconds=2))
+    assert prognostic.times == [
+        timedelta(seconds=2*t) for t in stage_times]
+    assert new_state['time'] == timedelta(0)
+    assert np.all(state['air_temperature'].values == 1.)
+
+
+def test_runge_kutta_reuses_stage_buffers():
+    timestepper = RK4([MockExponentialPrognostic()])
+    state = {
+        'air_temperature': DataArray(
+            np.ones((3, 4)), dims=['x', 'y'], attrs={'units': 'K'}),
+        'time': timedelta(0),
+    }
+    diagnostics, state = timestepper(state, timedelta(seconds=1))
+    buffers = timestepper._buffers
+    diagnostics, new_state = timestepper(state, timedelta(seconds=1))
+    assert timestepper._buffers is buffers
+    assert not np.may_share_memory(
+        state['air_temperature'].values, new_state['air_temperature'].values)
+
+
+class MockScaledDecayPrognostic(MockExponentialPrognostic):
+
+    def __init__(self, rate):
+        self.rate = rate
+        super(MockScaledDecayPrognostic, self).__init__()
+
+    def __call__(self, state):
+        tendencies, diagnostics = super(
+            MockScaledDecayPrognostic, self).__call__(state)
+        tendencies['air_temperature'] *= self.rate
+        return tendencies, diagnostics
+
+
+@pytest.mark.parametrize('packed', [False, True])
+def test_adaptive_runge_kutta_meets_tolerance(packed):
+    timestepper = AdaptiveRungeKutta(
+        [MockScaledDecayPrognostic(rate=1.)], atol=1e-8, rtol=1e-6,
+        initial_substep=timedelta(seconds=2.))
+    diagnostics, new_state = timestepper(
+        get_state(packed), timedelta(seconds=2))
+    assert timestepper.accepted_steps > 1
+    assert timestepper.rejected_steps >= 1
+    assert np.allclose(
+        new_state['air_temperature'].values,
+        get_state()['air_temperature'].values*np.exp(-2.),
+        rtol=1e-5, atol=1e-7)
+    assert new_state['air_temperature'].dims == ('x', 'y')
+    assert isinstance(new_state, PackedState) == packed
+
+
+def test_adaptive_runge_kutta_lengthens_substeps_when_calm():
+    prognostic = MockScaledDecayPrognostic(rate=0.)
+    timestepper = AdaptiveRungeKutta(
+        [prognostic], initial_substep=timedelta(seconds=0.01))
+    state = get_state()
+    for i in range(3):
+        diagnostics, state = timestepper(state, timedelta(seconds=1))
+    assert timestepper.rejected_steps == 0
+    assert timestepper.substep >= timedelta(seconds=1)
+    # one evaluation per timestep plus three per substep
+    assert len(prognostic.times) == 3 + 3*timestepper.accepted_steps
+    assert timestepper.accepted_steps < 10
+
+
+def test_adaptive_runge_kutta_per_quantity_tolerance():
+    strict_timestepper = AdaptiveRungeKutta(
+        [MockScaledDecayPrognostic(rate=1.)], rtol={'air_temperature': 1e-8})
+    loose_timestepper = AdaptiveRungeKutta(
+        [MockScaledDecayPrognostic(rate=1.)], rtol={'other_quantity': 1e-8})
+    for timestepper in (strict_timestepper, loose_timestepper):
+        timestepper(get_state(), timedelta(seconds=2))
+    assert (
+        strict_timestepper.accepted_steps > loose_timestepper.accepted_steps)
+
+
+def test_adaptive_runge_kutta_raises_below_min_substep():
+    timestepper = AdaptiveRungeKutta(
+        [MockScaledDecayPrognostic(rate=1e6)], rtol=1e-12, atol=0.,
+        min_substep=timedelta(seconds=0.1))
+    with pytest.raises(RuntimeError):
+        timestepper(get_state(), timedelta(seconds=1))
+
+
+class MockTimeTendencyPrognostic(Prognostic):
+
+    def __init__(self):
+        self.times = []
+
+    def __call__(self, state):
+        self.times.append(state['time'])
+        tendencies = {
+            'air_temperature': DataArray(
+                np.ones((3, 4))*state['time'].total_seconds(),
+                dims=['x', 'y'], attrs={'units': 'K/s'}),
+        }
+        return tendencies, {'slow_diagnostic': 1.}
+
+
+def get_time_state():
+    return {
+        'air_temperature': DataArray(
+            np.zeros((3, 4)), dims=['x', 'y'], attrs={'units': 'K'}),
+        'time': timedelta(0),
+    }
+
+
+def test_multi_rate_calls_groups_at_their_rates():
+    slow = MockTimeTendencyPrognostic()
+    fast = MockScaledDecayPrognostic(rate=0.)
+    timestepper = MultiRateTimeStepper(
+        [([slow], 1), ([fast], 4)], time_stepper_class=RK4)
+    state = get_time_state()
+    diagnostics, new_state = timestepper(state, timedelta(seconds=4))
+    assert slow.times == [timedelta(0)]
+    # four RK4 evaluations per substep, starting at each substep time
+    assert len(fast.times) == 16
+    assert fast.times[::4] == [timedelta(seconds=i) for i in range(4)]
+    assert new_state['time'] == timedelta(0)
+    assert diagnostics['slow_diagnostic'] == 1.
+    assert np.all(new_state['air_temperature'].values == 0.)
+
+
+def test_multi_rate_intermediate_group_rate():
+    slow = MockTimeTendencyPrognostic()
+    fast = MockScaledDecayPrognostic(rate=0.)
+    timestepper = MultiRateTimeStepper(
+        [([slow], 2), ([fast], 4)], time_stepper_class=AdamsBashforth)
+    timestepper(get_time_state(), timedelta(seconds=4))
+    assert slow.times == [timedelta(0), timedelta(seconds=2)]
+    assert len(fast.times) == 4
+
+
+@pytest.mark.parametrize('extrapolate', [False, True])
+def test_multi_rate_slow_forcing(extrapolate):
+    timestepper = MultiRateTimeStepper(
+        [([MockTimeTendencyPrognostic()], 1),
+         ([MockScaledDecayPrognostic(rate=0.)], 4)],
+        extrapolate=extrapolate)
+    state = get_time_state()
+    for i in range(3):
+        diagnostics, state = timestepper(state, timedelta(seconds=1))
+        state['time'] += timedelta(seconds=1)
+    # dT/dt = t, held fixed over each step gives 0 + 1 + 2
+    # extrapolating gives 0 + 1.5 + 2.5 after the first step
+    if extrapolate:
+        assert np.allclose(state['air_temperature'].values, 4.)
+    else:
+        assert np.allclose(state['air_temperature'].values, 3.)
+
+
+def test_multi_rate_requires_divisible_substeps():
+    with pytest.raises(ValueError):
+        MultiRateTimeStepper([([MockPrognostic()], 3), ([MockPrognostic()], 4)])
+    with pytest.raises(ValueError):
+        MultiRateTimeStepper([([MockPrognostic()], 0)])
+
+
+class MockBackwardEulerDecay(Implicit):
+
+    output_properties = {'air_temperature': {'dims': ['*'], 'units': 'K'}}
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.times = []
+
+    def __call__(self, state, timestep):
+        self.times.append(state['time'])
+        new_value = state['air_temperature']/(
+            1. + self.rate*timestep.total_seconds())
+        new_value.attrs = {'units': 'K'}
+        return {'implicit_diagnostic': 2.}, {'air_temperature': new_value}
+
+
+class MockBackwardEulerDecayTendency(ImplicitPrognostic):
+
+    tendency_properties = {'air_temperature': {'dims': ['*'], 'units': 'K/s'}}
+
+    def __init__(self, rate):
+        self.rate = rate
+
+    def __call__(self, state, timestep):
+        dt = timestep.total_seconds()
+        value = state['air_temperature']
+        tendency = (value/(1. + self.rate*dt) - value)/dt
+        tendency.attrs = {'units': 'K/s'}
+        return {'air_temperature': tendency}, {}
+
+
+def get_imex_error(scheme, timestep, n_steps, implicit_class):
+    timestepper = IMEXTimeStepper(
+        [implicit_class(rate=1.)], [MockScaledDecayPrognostic(rate=0.5)],
+        scheme=scheme)
+    state = get_state()
+    for i in range(n_steps):
+        diagnostics, state = timestepper(state, timestep)
+        state['time'] += timestep
+    exact = get_state()['air_temperature'].values*np.exp(
+        -1.5*timestep.total_seconds()*n_steps)
+    return np.abs(state['air_temperature'].values - exact).max()
+
+
+@pytest.mark.parametrize('implicit_class', [
+    MockBackwardEulerDecay, MockBackwardEulerDecayTendency])
+@pytest.mark.parametrize(
+    'scheme, min_order', [('strang', 0.9), ('ars222', 1.8)])
+def test_imex_order_of_accuracy(scheme, min_order, implicit_class):
+    coarse_error = get_imex_error(
+        scheme, timedelta(seconds=0.1), 10, implicit_class)
+    fine_error = get_imex_error(
+        scheme, timedelta(seconds=0.05), 20, implicit_class)
+    assert np.log2(coarse_error/fine_error) > min_order
+
+
+@pytest.mark.parametrize('scheme', ['strang', 'ars222'])
+def test_imex_stable_for_stiff_implicit_term(scheme):
+    timestepper = IMEXTimeStepper(
+        [MockBackwardEulerDecay(rate=1e4)], [MockScaledDecayPrognostic(rate=1.)],
+        scheme=scheme)
+    state = get_state()
+    for i in range(20):
+        diagnostics, state = timestepper(state, timedelta(seconds=0.5))
+    assert np.all(np.abs(state['air_temperature'].values) < 1e-3)
+
+
+def test_imex_stage_times_and_diagnostics():
+    implicit = MockBackwardEulerDecay(rate=1.)
+    timestepper = IMEXTimeStepper(
+        [implicit], [MockScaledDecayPrognostic(rate=1.)], scheme='ars222')
+    diagnostics, new_state = timestepper(
+        get_state(), timedelta(seconds=1))
+    gamma = 1. - 1./np.sqrt(2.)
+    assert [t.total_seconds() for t in implicit.times] == pytest.approx(
+        [gamma, 1.])
+    assert new_state['time'] == timedelta(0)
+    assert diagnostics['implicit_diagnostic'] == 2.
+    assert set(timestepper.outputs) == {'air_temperature'}
+
+
+def test_imex_requires_valid_scheme():
+    with pytest.raises(ValueError):
+        IMEXTimeStepper([], [], scheme='euler')
+
+
+@pytest.mark.parametrize('alpha', [0., 0.5, 1.])
+def test_leapfrog_reusing_buffers_matches_default(alpha):
+    state = {
+        'air_temperature': DataArray(
+            np.random.randn(3, 4), dims=['x', 'y'], attrs={'units': 'K'}),
+    }
+    buffered_state = state.copy()
+    time_stepper = Leapfrog([MockDecayPrognostic()], alpha=alpha)
+    buffered_time_stepper = Leapfrog(
+        [MockDecayPrognostic()], alpha=alpha, reuse_buffers=True)
+    output_arrays = set()
+    for i in range(6):
+        old_state = state
+        diagnostics, state = time_stepper(state, timedelta(seconds=1))
+        old_buffered_state = buffered_state
+        diagnostics, buffered_state = buffered_time_stepper(
+            buffered_state, timedelta(seconds=1))
+        assert np.allclose(
+            old_buffered_state['air_temperature'].values,
+            old_state['air_temperature'].values, rtol=1e-14, atol=0.)
+        assert np.allclose(
+            buffered_state['air_temperature'].values,
+            state['air_temperature'].values, rtol=1e-14, atol=0.)
+        assert buffered_state['air_temperature'].attrs['units'] == 'K'
+        output_arrays.add(id(buffered_state['air_temperature'].values))
+    assert len(output_arrays) == 3
+
+
+@pytest.mark.parametrize('reuse_buffers', [False, True])
 @mock.patch.object(MockPrognostic, '__call__')
-def test_leapfrog_float_two_steps_filtered(mock_prognostic_call):
+def test_leapfrog_float_two_steps_filtered(mock_prognostic_call, reuse_buffers):
     """Test that the Asselin filter is being correctly applied"""
     mock_prognostic_call.return_value = ({'air_temperature': 0.}, {})
     state = {'air_temperature': 273.}
     timestep = timedelta(seconds=1.)
-    time_stepper = Leapfrog([MockPrognostic()], asselin_strength=0.5, alpha=1.)
+    time_stepper = Leapfrog(
+        [MockPrognostic()], asselin_strength=0.5, alpha=1.,
+        reuse_buffers=reuse_buffers)
     diagnostics, new_state = time_stepper.__call__(state, timestep)
     assert state == {'air_temperature': 273.}
     assert new_state == {'air_temperature': 273.}
@@ -426,32 +902,77 @@ def test_leapfrog_requires_same_timestep(mock_prognostic_call):
         raise AssertionError('Leapfrog must require timestep to be constant')
 
 
-@mock.patch.object(MockPrognostic, '__call__')
-def test_adams_bashforth_requires_same_timestep(mock_prognostic_call):
-    """Test that the Asselin filter is being correctly applied"""
-    mock_prognostic_call.return_value = ({'air_temperature': 0.}, {})
-    state = {'air_temperature': 273.}
-    time_stepper = AdamsBashforth([MockPrognostic()])
-    state = time_stepper.__call__(state, timedelta(seconds=1.))
-    try:
-        time_stepper.__call__(state, timedelta(seconds=2.))
-    except ValueError:
-        pass
-    except Exception as err:
-        raise err
-    else:
-        raise AssertionError(
-            'AdamsBashforth must require timestep to be constant')
+@pytest.mark.parametrize('order', [2, 3, 4])
+def test_variable_adams_bashforth_coefficients_integrate_polynomials(order):
+    previous_timesteps = [0.7, 1.3, 0.4][:order - 1]
+    timestep = 1.1
+    coefficients = get_adams_bashforth_coefficients(
+        timestep, previous_timesteps)
+    times = [0.]
+    for step in reversed(previous_timesteps):
+        times.append(times[-1] - step)
+    # polynomials of degree order - 1 are integrated exactly
+    for degree in range(order):
+        approximate_integral = timestep*sum(
+            coefficient*time**degree
+            for coefficient, time in zip(coefficients, times))
+        exact_integral = timestep**(degree + 1)/(degree + 1)
+        assert approximate_integral == pytest.approx(exact_integral)
+
+
+def test_constant_adams_bashforth_coefficients_are_exact():
+    assert get_adams_bashforth_coefficients(2., [2., 2.]) == (
+        23./12, -4./3, 5./12)
+
 
+class MockPolynomialTimePrognostic(Prognostic):
 
+    def __init__(self, degree):
+        self.degree = degree
+
+    def __call__(self, state):
+        tendencies = {
+            'air_temperature': DataArray(
+                np.ones((3, 4))*state['time'].total_seconds()**self.degree,
+                dims=['x', 'y'], attrs={'units': 'K/s'}),
+        }
+        return tendencies, {}
+
+
+@pytest.mark.parametrize('reuse_buffers', [False, True])
+@pytest.mark.parametrize('order', [2, 3, 4])
+def test_adams_bashforth_variable_timestep_exact_for_polynomials(
+        order, reuse_buffers):
+    timestepper = AdamsBashforth(
+        [MockPolynomialTimePrognostic(degree=order - 1)], order=order,
+        reuse_buffers=reuse_buffers)
+    state = get_time_state()
+    state['time'] = timedelta(seconds=1)
+    for i, seconds in enumerate([0.5, 0.25, 1., 0.5, 2., 0.25]):
+        timestep = timedelta(seconds=seconds)
+        start = state['time'].total_seconds()
+        old_value = state['air_temperature'].values.copy()
+        diagnostics, state = timestepper(state, timestep)
+        state['time'] += timestep
+        end = state['time'].total_seconds()
+        if i >= order - 1:  # once enough tendencies are stored
+            increment = (end**order - start**order)/order
+            assert np.allclose(
+                state['air_temperature'].values - old_value, increment,
+                rtol=1e-12, atol=0.)
+
+
+@pytest.mark.parametrize('reuse_buffers', [False, True])
 @mock.patch.object(MockPrognostic, '__call__')
-def test_leapfrog_array_two_steps_filtered(mock_prognostic_call):
+def test_leapfrog_array_two_steps_filtered(mock_prognostic_call, reuse_buffers):
     """Test that the Asselin filter is being correctly applied"""
     mock_prognostic_call.return_value = (
         {'air_temperature': np.ones((3, 3))*0.}, {})
     state = {'air_temperature': np.ones((3, 3))*273.}
     timestep = timedelta(seconds=1.)
-    time_stepper = Leapfrog([MockPrognostic()], asselin_strength=0.5, alpha=1.)
+    time_stepper = Leapfrog(
+        [MockPrognostic()], asselin_strength=0.5, alpha=1.,
+        reuse_buffers=reuse_buffers)
     diagnostics, new_state = time_stepper.__call__(state, timestep)
     assert list(state.keys()) == ['air_temperature']
     assert (state['air_temperature'] == np.ones((3, 3))*273.).all()
@@ -468,15 +989,18 @@ def test_leapfrog_array_two_steps_filtered(mock_prognostic_call):
     assert (new_state['air_temperature'] == np.ones((3, 3))*277.).all()
 
 
+@pytest.mark.parametrize('reuse_buffers', [False, True])
 @mock.patch.object(MockPrognostic, '__call__')
-def test_leapfrog_array_two_steps_filtered_williams(mock_prognostic_call):
+def test_leapfrog_array_two_steps_filtered_williams(mock_prognostic_call, reuse_buffers):
     """Test that the Asselin filter is being correctly applied with a
     Williams factor of alpha=0.5"""
     mock_prognostic_call.return_value = (
         {'air_temperature': np.ones((3, 3))*0.}, {})
     state = {'air_temperature': np.ones((3, 3))*273.}
     timestep = timedelta(seconds=1.)
-    time_stepper = Leapfrog([MockPrognostic()], asselin_strength=0.5, alpha=0.5)
+    time_stepper = Leapfrog(
+        [MockPrognostic()], asselin_strength=0.5, alpha=0.5,
+        reuse_buffers=reuse_buffers)
     diagnostics, new_state = time_stepper.__call__(state, timestep)
     assert list(state.keys()) == ['air_temperature']
     assert (state['air_temperature'] == np.ones((3, 3))*273.).all()
@@ -493,5 +1017,84 @@ def test_leapfrog_array_two_steps_filtered_williams(mock_prognostic_call):
     assert (new_state['air_temperature'] == np.ones((3, 3))*276.5).all()
 
 
+class MockColumnDecayPrognostic(Prognostic):
+
+    input_properties = {
+        'air_temperature': {
+            'dims': ['x', 'z'], 'units': 'K', 'batch_ensemble': True},
+        'decay_rate': {'dims': [], 'units': 's^-1', 'batch_ensemble': True},
+    }
+    tendency_properties = {
+        'air_temperature': {'dims_like': 'air_temperature', 'units': 'K/s'},
+    }
+    diagnostic_properties = {}
+
+    def __call__(self, state):
+        arrays = get_numpy_arrays_with_properties(
+            state, self.input_properties)
+        # the ensemble dimension is the first axis of each array
+        tendency = -arrays['air_temperature']*arrays['decay_rate'][
+            (Ellipsis,) + (None,)*2]
+        tendencies = restore_data_arrays_with_properties(
+            {'air_temperature': tendency}, self.tendency_properties,
+            state, self.input_properties)
+        return tendencies, {}
+
+
+def get_member_state(rate):
+    return {
+        'air_temperature': DataArray(
+            np.ones((2, 3))*(273. + rate), dims=['x', 'z'],
+            attrs={'units': 'K'}),
+        'decay_rate': DataArray(rate, attrs={'units': 's^-1'}),
+        'time': timedelta(0),
+    }
+
+
+@pytest.mark.parametrize('timestepper_class', [AdamsBashforth, Leapfrog, RK4])
+def test_stacked_ensemble_matches_separate_members(timestepper_class):
+    rates = [0.1, 0.2, 0.5]
+    states = [get_member_state(rate) for rate in rates]
+    time_steppers = [
+        timestepper_class([MockColumnDecayPrognostic()]) for rate in rates]
+    ensemble_state = stack_ensemble(states)
+    ensemble_time_stepper = timestepper_class([MockColumnDecayPrognostic()])
+    for i in range(4):
+        for j in range(len(rates)):
+            _, states[j] = time_steppers[j](states[j], timedelta(seconds=1))
+        _, ensemble_state = ensemble_time_stepper(
+            ensemble_state, timedelta(seconds=1))
+    assert ensemble_state['air_temperature'].dims == (
+        'ensemble', 'x', 'z')
+    for state, member_state in zip(
+            states, unstack_ensemble(ensemble_state)):
+        assert np.all(
+            member_state['air_temperature'].values ==
+            state['air_temperature'].values)
+
+
+@pytest.mark.parametrize('packed', [False, True])
+def test_adaptive_runge_kutta_meets_tolerance_for_each_member(packed):
+    rates = [0.01, 0.01, 0.01, 2.]
+    ensemble_state = stack_ensemble([get_member_state(rate) for rate in rates])
+    if packed:
+        ensemble_state = PackedState(
+            ensemble_state, packed_names=['air_temperature'])
+    timestepper = AdaptiveRungeKutta(
+        [MockColumnDecayPrognostic()], atol=0., rtol=1e-6)
+    _, ensemble_state = timestepper(ensemble_state, timedelta(seconds=1))
+    fast_timestepper = AdaptiveRungeKutta(
+        [MockColumnDecayPrognostic()], atol=0., rtol=1e-6)
+    _, fast_state = fast_timestepper(
+        get_member_state(2.), timedelta(seconds=1))
+    # the fast-decaying member needs as many substeps as when alone, even
+    # though it is a small part of the ensemble
+    assert timestepper.accepted_steps == fast_timestepper.accepted_steps
+    values = ensemble_state['air_temperature'].values
+    for i, rate in enumerate(rates):
+        assert np.allclose(
+            values[i], (273. + rate)*np.exp(-rate), rtol=1e-5, atol=0.)
+
+
 if __name__ == '__main__':
     pytest.main([__file__])
@@ -0,0 +1,166 @@
+import pytest
+import numpy as np
+from sympl import DataArray
+from sympl._core.cache import PlanCache
+from sympl._core.units import (
+    conversion_plan_cache, get_conversion_plan, create_conversion_plan,
+    from_unit_to_another, get_unit_registry)
+
+
+def test_conversion_plan_scale():
+    plan = create_conversion_plan('km', 'm')
+    assert plan.scale == 1000.
+    assert plan.offset == 0.
+    assert not plan.is_identity
+
+
+def test_conversion_plan_same_units_is_identity():
+    assert create_conversion_plan('m', 'meter').is_identity
+
+
+def test_conversion_plan_offset_units():
+    plan = create_conversion_plan('degC', 'K')
+    assert plan.scale == 1.
+    assert np.isclose(plan.offset, 273.15)
+    result = plan.apply(np.array([0., 10.]))
+    assert np.allclose(result, [273.15, 283.15])
+
+
+def test_conversion_plan_offset_units_with_scale():
+    plan = create_conversion_plan('degC', 'degF')
+    assert np.allclose(plan.apply(np.array([0., 100.])), [32., 212.])
+
+
+@pytest.mark.parametrize('from_units, to_units', [
+    ('degF', 'K'), ('K', 'degF'), ('degC', 'degF'), ('degF', 'degC'),
+    ('degC', 'K')])
+def test_conversion_plan_offset_units_match_pint(from_units, to_units):
+    plan = create_conversion_plan(from_units, to_units)
+    values = np.array([-40., 0., 50., 100., 300.])
+    registry = get_unit_registry()
+    expected = registry.Quantity(values, from_units).to(to_units).magnitude
+    assert np.allclose(plan.apply(values), expected, rtol=1e-15, atol=1e-13)
+
+
+def test_conversion_plan_offset_units_exact_scale():
+    plan = create_conversion_plan('degF', 'K')
+    assert plan.scale == 5./9
+    assert plan.apply(np.array([50.]))[0] == get_unit_registry().Quantity(
+        50., 'degF').to('K').magnitude
+
+
+def test_conversion_plan_percent():
+    plan = create_conversion_plan('%', '')
+    assert np.isclose(plan.scale, 0.01)
+
+
+def test_conversion_plan_raises_on_incompatible_units():
+    with pytest.raises(ValueError):
+        create_conversion_plan('m', 'K')
+
+
+def test_from_unit_to_another():
+    assert np.allclose(
+        from_unit_to_another(np.array([1., 2.]), 'hours', 'seconds'),
+        [3600., 7200.])
+
+
+def test_data_array_offset_unit_conversion():
+    a = DataArray(
+        np.array([0., 10.]), dims=['x'], attrs={'units': 'degC', 'foo': 'bar'})
+    result = a.to_units('K')
+    assert np.allclose(result.values, [273.15, 283.15])
+    assert result.attrs == {'units': 'K', 'foo': 'bar'}
+    assert result.dims == ('x',)
+    assert a.attrs['units'] == 'degC'
+
+
+def test_get_conversion_plan_is_cached():
+    conversion_plan_cache.clear()
+    plan = get_conversion_plan('km', 'm')
+    assert conversion_plan_cache.info()['misses'] == 1
+    assert conversion_plan_cache.info()['hits'] == 0
+    assert get_conversion_plan('km', 'm') is plan
+    assert conversion_plan_cache.info()['misses'] == 1
+    assert conversion_plan_cache.info()['hits'] == 1
+
+
+def test_failed_conversion_plan_is_not_cached():
+    conversion_plan_cache.clear()
+    with pytest.raises(ValueError):
+        get_conversion_plan('m', 'K')
+    assert ('m', 'K') not in conversion_plan_cache
+
+
+class TestPlanCache(object):
+
+    def test_get_creates_plan_once(self):
+        cache = PlanCache()
+        calls = []
+
+        def create(x):
+            calls.append(x)
+            return x*2
+        assert cache.get('a', create, 1) == 2
+        assert cache.get('a', create, 1) == 2
+        assert calls == [1]
+        assert cache.info() == {
+            'hits': 1, 'misses': 1, 'maxsize': 256, 'currsize': 1}
+
+    def test_evicts_least_recently_used(self):
+        cache = PlanCache(maxsize=2)
+        cache.get('a', lambda: 1)
+        cache.get('b', lambda: 2)
+        cache.get('a', lambda: 1)
+        cache.get('c', lambda: 3)
+        assert 'a' in cache
+        assert 'b' not in cache
+        assert 'c' in cache
+        assert len(cache) == 2
+
+    def test_zero_maxsize_stores_nothing(self):
+        cache = PlanCache(maxsize=0)
+        cache.get('a', lambda: 1)
+        assert len(cache) == 0
+
+    def test_reducing_maxsize_trims(self):
+        cache = PlanCache(maxsize=3)
+        for key in 'abc':
+            cache.get(key, lambda: 0)
+        cache.maxsize = 1
+        assert len(cache) == 1
+        assert 'c' in cache
+
+    def test_negative_maxsize_raises(self):
+        with pytest.raises(ValueError):
+            PlanCache(maxsize=-1)
+
+    def test_clear_resets_counters(self):
+        cache = PlanCache()
+        cache.get('a', lambda: 1)
+        cache.get('a', lambda: 1)
+        cache.clear()
+        assert cache.info() == {
+            'hits': 0, 'misses': 0, 'maxsize': 256, 'currsize': 0}
+
+    def test_max_memory_evicts_least_recently_used(self):
+        cache = PlanCache(maxsize=10, max_memory=10, get_size=len)
+        cache.get('a', lambda: 'aaaa')
+        cache.get('b', lambda: 'bbbb')
+        assert cache.memory == 8
+        cache.get('c', lambda: 'cccc')
+        assert 'a' not in cache
+        assert cache.memory == 8
+        cache.get('d', lambda: 'd'*11)
+        assert 'd' not in cache
+        assert len(cache) == 2
+        cache.clear()
+        assert cache.memory == 0
+
+    def test_max_memory_requires_get_size(self):
+        with pytest.raises(ValueError):
+            PlanCache(max_memory=10)
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
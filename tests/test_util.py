@@ -5,7 +5,8 @@ import pytest
 from sympl import (
     Prognostic, ensure_no_shared_keys, SharedKeyError, DataArray,
     combine_dimensions, set_direction_names, Implicit, Diagnostic,
-    TendencyInDiagnosticsWrapper)
+    TendencyInDiagnosticsWrapper, State, InvalidStateError, stack_ensemble,
+    unstack_ensemble, get_fingerprint)
 from sympl._core.util import (
     update_dict_by_adding_another, get_component_aliases)
 
@@ -71,6 +72,16 @@ def test_update_dict_by_adding_another_adds_shared_arrays_reversed():
     assert len(dict2.keys()) == 2
 
 
+def test_update_dict_by_adding_another_converts_without_modifying_dict2():
+    component_buffer = np.array([1., 2.])
+    dict1 = {'a': DataArray(np.zeros(2), dims=['x'], attrs={'units': 'm'})}
+    dict2 = {'a': DataArray(component_buffer, dims=['x'], attrs={'units': 'km'})}
+    update_dict_by_adding_another(dict1, dict2)
+    assert np.all(dict1['a'].values == np.array([1000., 2000.]))
+    assert np.all(component_buffer == np.array([1., 2.]))
+    assert dict2['a'].attrs['units'] == 'km'
+
+
 class DummyPrognostic(Prognostic):
     input_properties = {'temperature': {'alias': 'T'}}
     diagnostic_properties = {'pressure': {'alias': 'P'}}
@@ -244,5 +255,121 @@ class CombineDimensionsTests(unittest.TestCase):
             raise AssertionError('No exception raised but expected ValueError.')
 
 
+def get_member_state(value):
+    return {
+        'air_temperature': DataArray(
+            np.ones((2, 3))*value, dims=['x', 'z'],
+            coords={'x': [10., 20.]}, attrs={'units': 'K'}),
+        'time': 1.,
+    }
+
+
+def test_stack_ensemble():
+    state = stack_ensemble(
+        [get_member_state(0.), get_member_state(1.), get_member_state(2.)])
+    assert state['air_temperature'].dims == ('ensemble', 'x', 'z')
+    assert state['air_temperature'].shape == (3, 2, 3)
+    assert state['air_temperature'].attrs == {'units': 'K'}
+    assert np.all(state['air_temperature'].coords['x'].values == [10., 20.])
+    assert np.all(state['air_temperature'].values[1] == 1.)
+    assert state['time'] == 1.
+    assert not isinstance(state, State)
+    assert isinstance(stack_ensemble([State(get_member_state(0.))]), State)
+
+
+def test_stack_ensemble_requires_equal_time():
+    other_state = get_member_state(1.)
+    other_state['time'] = 2.
+    with pytest.raises(ValueError):
+        stack_ensemble([get_member_state(0.), other_state])
+
+
+def test_stack_ensemble_requires_same_dims():
+    other_state = get_member_state(1.)
+    other_state['air_temperature'] = other_state['air_temperature'].transpose()
+    with pytest.raises(InvalidStateError):
+        stack_ensemble([get_member_state(0.), other_state])
+
+
+def test_unstack_ensemble_reverses_stack_ensemble():
+    states = unstack_ensemble(stack_ensemble(
+        [get_member_state(0.), get_member_state(1.)]))
+    assert len(states) == 2
+    for i, state in enumerate(states):
+        assert state['air_temperature'].dims == ('x', 'z')
+        assert state['air_temperature'].attrs == {'units': 'K'}
+        assert np.all(state['air_temperature'].values == float(i))
+        assert state['time'] == 1.
+    with pytest.raises(InvalidStateError):
+        unstack_ensemble(get_member_state(0.))
+
+
+def get_fingerprint_state():
+    return {
+        'air_temperature': DataArray(
+            np.zeros((100, 100)), dims=['x', 'y'], attrs={'units': 'K'}),
+        'time': 1.,
+    }
+
+
+@pytest.mark.parametrize('method', ['auto', 'version', 'sampled', 'full'])
+def test_fingerprint_changes_when_value_is_assigned(method):
+    for state in (get_fingerprint_state(), State(get_fingerprint_state())):
+        fingerprints = [
+            get_fingerprint(state, name, method)
+            for name in ('air_temperature', 'time')]
+        assert fingerprints == [
+            get_fingerprint(state, name, method)
+            for name in ('air_temperature', 'time')]
+        state['air_temperature'] = DataArray(
+            np.ones((100, 100)), dims=['x', 'y'], attrs={'units': 'K'})
+        state['time'] = 2.
+        assert get_fingerprint(state, 'air_temperature', method) != (
+            fingerprints[0])
+        assert get_fingerprint(state, 'time', method) != fingerprints[1]
+
+
+def test_fingerprint_of_in_place_modification():
+    state = State(get_fingerprint_state())
+    fingerprints = dict(
+        (method, get_fingerprint(state, 'air_temperature', method))
+        for method in ('version', 'sampled', 'full'))
+    state['air_temperature'].values[1, 1] = 1.
+    # only the full checksum sees values which are not sampled
+    assert get_fingerprint(state, 'air_temperature', 'version') == (
+        fingerprints['version'])
+    assert get_fingerprint(state, 'air_temperature', 'sampled') == (
+        fingerprints['sampled'])
+    assert get_fingerprint(state, 'air_temperature', 'full') != (
+        fingerprints['full'])
+    state['air_temperature'].values[0, 0] = 1.
+    assert get_fingerprint(state, 'air_temperature', 'sampled') != (
+        fingerprints['sampled'])
+
+
+def test_version_fingerprint_of_dict_detects_reused_address():
+    buffer = np.zeros((100, 100))
+    state = {
+        'air_temperature': DataArray(
+            buffer, dims=['x', 'y'], attrs={'units': 'K'}),
+    }
+    fingerprint = get_fingerprint(state, 'air_temperature', 'version')
+    # new data at the address of the old data, as when a freed buffer is
+    # reused by the allocator
+    buffer[:] = 1.
+    state = {
+        'air_temperature': DataArray(
+            buffer, dims=['x', 'y'], attrs={'units': 'K'}),
+    }
+    assert get_fingerprint(state, 'air_temperature', 'version') != (
+        fingerprint)
+
+
+def test_fingerprint_of_missing_quantity_is_none():
+    assert get_fingerprint({}, 'air_temperature') is None
+    with pytest.raises(ValueError):
+        get_fingerprint(get_fingerprint_state(), 'time', method='hash')
+
+
 if __name__ == '__main__':
     pytest.main([__file__])
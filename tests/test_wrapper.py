@@ -1,9 +1,13 @@
 from datetime import timedelta, datetime
+import threading
 import unittest
 from sympl import (
-    Prognostic, Implicit, Diagnostic, UpdateFrequencyWrapper, ScalingWrapper,
-    TendencyInDiagnosticsWrapper, TimeDifferencingWrapper, DataArray
+    Prognostic, Implicit, Diagnostic, Monitor, UpdateFrequencyWrapper,
+    ScalingWrapper, TendencyInDiagnosticsWrapper, TimeDifferencingWrapper,
+    AsyncMonitorWrapper, ColumnChunkWrapper, MemoizationWrapper, DataArray,
+    State
 )
+import numpy as np
 import pytest
 from numpy.testing import assert_allclose
 from copy import deepcopy
@@ -380,5 +384,391 @@ def test_scaled_component_type_wrongly_modified():
 
     assert 'bug in ScalingWrapper' in str(excinfo.value)
 
+
+class MockRecordingMonitor(Monitor):
+
+    def __init__(self, wait=False):
+        self.values = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        if not wait:
+            self.release.set()
+
+    def store(self, state):
+        self.started.set()
+        self.release.wait()
+        self.values.append(float(state['value'].values))
+
+
+class MockFailingMonitor(Monitor):
+
+    def store(self, state):
+        raise ValueError('failed to store state')
+
+
+def get_value_state(value):
+    return {'value': DataArray(np.array(value), attrs={'units': 'm'})}
+
+
+def test_async_monitor_stores_snapshots_in_order():
+    monitor = MockRecordingMonitor()
+    async_monitor = AsyncMonitorWrapper(monitor)
+    state = get_value_state(0.)
+    for i in range(5):
+        state['value'].values[()] = float(i)
+        async_monitor.store(state)
+    async_monitor.flush()
+    assert monitor.values == [0., 1., 2., 3., 4.]
+    async_monitor.close()
+
+
+def fill_queue(async_monitor, monitor):
+    async_monitor.store(get_value_state(0.))
+    monitor.started.wait()  # the first state is being stored
+    for i in range(1, 4):
+        async_monitor.store(get_value_state(float(i)))
+    monitor.release.set()
+    async_monitor.close()
+
+
+def test_async_monitor_drop_newest():
+    monitor = MockRecordingMonitor(wait=True)
+    async_monitor = AsyncMonitorWrapper(
+        monitor, maxsize=1, policy='drop_newest')
+    fill_queue(async_monitor, monitor)
+    assert monitor.values == [0., 1.]
+    assert async_monitor.dropped_count == 2
+
+
+def test_async_monitor_drop_oldest():
+    monitor = MockRecordingMonitor(wait=True)
+    async_monitor = AsyncMonitorWrapper(
+        monitor, maxsize=1, policy='drop_oldest')
+    fill_queue(async_monitor, monitor)
+    assert monitor.values == [0., 3.]
+    assert async_monitor.dropped_count == 2
+
+
+def test_async_monitor_raises_monitor_error():
+    async_monitor = AsyncMonitorWrapper(MockFailingMonitor())
+    async_monitor.store(get_value_state(0.))
+    with pytest.raises(ValueError):
+        async_monitor.flush()
+    async_monitor.close()
+
+
+def test_async_monitor_cannot_store_after_close():
+    monitor = MockRecordingMonitor()
+    with AsyncMonitorWrapper(monitor) as async_monitor:
+        async_monitor.store(get_value_state(1.))
+    assert monitor.values == [1.]
+    with pytest.raises(RuntimeError):
+        async_monitor.store(get_value_state(2.))
+
+
+def test_async_monitor_rejects_invalid_policy():
+    with pytest.raises(ValueError):
+        AsyncMonitorWrapper(MockRecordingMonitor(), policy='drop_all')
+
+
+class MockColumnPrognostic(Prognostic):
+
+    tendency_properties = {}
+    diagnostic_properties = {}
+
+    def __init__(self):
+        self.chunk_lengths = []
+
+    def __call__(self, state):
+        temperature = state['air_temperature']
+        self.chunk_lengths.append(temperature.sizes['x'])
+        weights = state['layer_weight'].values
+        z_axis = temperature.dims.index('z')
+        column_dims = [dim for dim in temperature.dims if dim != 'z']
+        tendencies = {
+            'air_temperature': DataArray(
+                np.cumsum(temperature.values, axis=z_axis)*1e-3,
+                dims=temperature.dims, coords=temperature.coords,
+                attrs={'units': 'K/s'}),
+        }
+        diagnostics = {
+            'column_mean_temperature': DataArray(
+                np.sum(
+                    np.moveaxis(temperature.values, z_axis, -1)*weights,
+                    axis=-1),
+                dims=column_dims, attrs={'units': 'K'}),
+        }
+        return tendencies, diagnostics
+
+
+class MockColumnDiagnostic(Diagnostic):
+
+    diagnostic_properties = {}
+
+    def __call__(self, state):
+        temperature = state['air_temperature']
+        return {
+            'column_max_temperature': DataArray(
+                temperature.values.max(axis=temperature.dims.index('z')),
+                dims=[dim for dim in temperature.dims if dim != 'z'],
+                attrs={'units': 'K'}),
+        }
+
+
+class MockGlobalDiagnostic(Diagnostic):
+
+    diagnostic_properties = {}
+
+    def __call__(self, state):
+        return {
+            'global_mean_temperature': DataArray(
+                state['air_temperature'].values.mean(), attrs={'units': 'K'}),
+        }
+
+
+def get_column_state():
+    return {
+        'air_temperature': DataArray(
+            np.random.RandomState(0).randn(5, 10, 4) + 280.,
+            dims=['z', 'x', 'y'], coords={'x': np.arange(10.)*100.},
+            attrs={'units': 'K'}),
+        'layer_weight': DataArray(
+            np.linspace(0.1, 0.3, 5), dims=['z'], attrs={'units': ''}),
+        'time': timedelta(0),
+    }
+
+
+@pytest.mark.parametrize('pool', ['thread', 'process'])
+@pytest.mark.parametrize('schedule', ['static', 'dynamic'])
+def test_column_chunk_wrapper_matches_unwrapped(schedule, pool):
+    state = get_column_state()
+    tendencies, diagnostics = MockColumnPrognostic()(state)
+    with ColumnChunkWrapper(
+            MockColumnPrognostic(), n_workers=3, schedule=schedule,
+            pool=pool) as wrapper:
+        chunk_tendencies, chunk_diagnostics = wrapper(state)
+    for outputs, chunk_outputs in [
+            (tendencies, chunk_tendencies),
+            (diagnostics, chunk_diagnostics)]:
+        assert set(outputs.keys()) == set(chunk_outputs.keys())
+        for name, value in outputs.items():
+            assert chunk_outputs[name].dims == value.dims
+            assert chunk_outputs[name].attrs == value.attrs
+            assert np.all(chunk_outputs[name].values == value.values)
+    assert np.all(
+        chunk_tendencies['air_temperature'].coords['x'].values ==
+        np.arange(10.)*100.)
+    assert 'x' not in chunk_diagnostics['column_mean_temperature'].coords
+
+
+@pytest.mark.parametrize(
+    'schedule, chunk_size, chunk_lengths', [
+        ('static', None, [4, 4, 2]),
+        ('static', 3, [3, 3, 3, 1]),
+        ('dynamic', None, [1]*10),
+        ('dynamic', 4, [4, 4, 2]),
+    ])
+def test_column_chunk_wrapper_chunk_sizes(schedule, chunk_size, chunk_lengths):
+    prognostic = MockColumnPrognostic()
+    wrapper = ColumnChunkWrapper(
+        prognostic, n_workers=3, schedule=schedule, chunk_size=chunk_size)
+    wrapper(get_column_state())
+    assert sorted(prognostic.chunk_lengths) == sorted(chunk_lengths)
+    wrapper.close()
+
+
+def test_column_chunk_wrapper_chunks_longest_horizontal_dimension():
+    state = get_column_state()
+    state['air_temperature'] = DataArray(
+        np.random.RandomState(1).randn(3, 5, 8), dims=['x', 'z', 'y'],
+        attrs={'units': 'K'})
+    diagnostics = MockColumnDiagnostic()(state)
+    with ColumnChunkWrapper(
+            MockColumnDiagnostic(), n_workers=2,
+            schedule='dynamic') as wrapper:
+        chunk_diagnostics = wrapper(state)
+    assert chunk_diagnostics['column_max_temperature'].dims == ('x', 'y')
+    assert np.all(
+        chunk_diagnostics['column_max_temperature'].values ==
+        diagnostics['column_max_temperature'].values)
+
+
+def test_column_chunk_wrapper_requires_chunked_outputs():
+    with ColumnChunkWrapper(MockGlobalDiagnostic(), n_workers=2) as wrapper:
+        with pytest.raises(ValueError):
+            wrapper(get_column_state())
+
+
+def test_column_chunk_wrapper_rejects_invalid_arguments():
+    with pytest.raises(TypeError):
+        ColumnChunkWrapper(MockImplicit())
+    with pytest.raises(ValueError):
+        ColumnChunkWrapper(MockColumnDiagnostic(), n_workers=0)
+    with pytest.raises(ValueError):
+        ColumnChunkWrapper(MockColumnDiagnostic(), schedule='guided')
+    with pytest.raises(ValueError):
+        ColumnChunkWrapper(MockColumnDiagnostic(), pool='cluster')
+
+
+class MockCountingDiagnostic(Diagnostic):
+
+    input_properties = {
+        'surface_height': {'dims': ['x'], 'units': 'm'},
+    }
+    diagnostic_properties = {
+        'surface_slope': {'dims': ['x'], 'units': ''},
+    }
+
+    def __init__(self):
+        self.call_count = 0
+
+    def __call__(self, state):
+        self.call_count += 1
+        return {
+            'surface_slope': DataArray(
+                np.gradient(state['surface_height'].values), dims=['x'],
+                attrs={'units': ''}),
+        }
+
+
+class MockCountingPrognostic(Prognostic):
+
+    input_properties = {
+        'surface_height': {'dims': ['x'], 'units': 'm'},
+    }
+    tendency_properties = {
+        'air_temperature': {'dims': ['x'], 'units': 'K/s'},
+    }
+
+    def __init__(self):
+        self.call_count = 0
+
+    def __call__(self, state):
+        self.call_count += 1
+        return {
+            'air_temperature': DataArray(
+                state['surface_height'].values*1e-3, dims=['x'],
+                attrs={'units': 'K/s'}),
+        }, {}
+
+    def get_checkpoint_state(self):
+        return {'call_count': self.call_count}
+
+    def set_checkpoint_state(self, checkpoint):
+        self.call_count = checkpoint['call_count']
+
+
+def get_height_state(value=1.):
+    return {
+        'surface_height': DataArray(
+            np.arange(100.)*value, dims=['x'], attrs={'units': 'm'}),
+        'air_temperature': DataArray(
+            np.zeros(100), dims=['x'], attrs={'units': 'K'}),
+        'time': timedelta(0),
+    }
+
+
+def test_memoization_wrapper_returns_cached_copy():
+    diagnostic = MockCountingDiagnostic()
+    wrapper = MemoizationWrapper(diagnostic)
+    state = get_height_state()
+    first_diagnostics = wrapper(state)
+    # quantities which are not inputs do not affect the cache
+    state['air_temperature'].values[:] = 1.
+    state['time'] = timedelta(hours=1)
+    second_diagnostics = wrapper(state)
+    assert diagnostic.call_count == 1
+    assert second_diagnostics['surface_slope'] is not (
+        first_diagnostics['surface_slope'])
+    assert np.all(
+        second_diagnostics['surface_slope'].values ==
+        first_diagnostics['surface_slope'].values)
+    assert wrapper.cache_info() == {
+        'hits': 1, 'misses': 1, 'hit_rate': 0.5, 'maxsize': 8,
+        'currsize': 1, 'memory': 800}
+
+
+def test_memoization_wrapper_output_is_not_modified_by_caller():
+    prognostic = MockCountingPrognostic()
+    wrapper = MemoizationWrapper(prognostic)
+    tendencies, diagnostics = wrapper(get_height_state())
+    tendencies['air_temperature'].values[:] = 0.
+    tendencies, diagnostics = wrapper(get_height_state())
+    assert prognostic.call_count == 1
+    assert tendencies['air_temperature'].values[1] == 1e-3
+
+
+def test_memoization_wrapper_detects_in_place_changes():
+    diagnostic = MockCountingDiagnostic()
+    wrapper = MemoizationWrapper(diagnostic, fingerprint='full')
+    state = get_height_state()
+    wrapper(state)
+    state['surface_height'].values[5] = 0.
+    wrapper(state)
+    assert diagnostic.call_count == 2
+
+
+def test_memoization_wrapper_uses_state_versions():
+    diagnostic = MockCountingDiagnostic()
+    wrapper = MemoizationWrapper(diagnostic, fingerprint='version')
+    state = State(get_height_state())
+    wrapper(state)
+    wrapper(state)
+    assert diagnostic.call_count == 1
+    state['surface_height'] = state['surface_height'].copy()
+    wrapper(state)
+    assert diagnostic.call_count == 2
+
+
+def test_memoization_wrapper_versions_of_dict_detect_reused_address():
+    diagnostic = MockCountingDiagnostic()
+    wrapper = MemoizationWrapper(diagnostic, fingerprint='version')
+    state = get_height_state()
+    buffer = state['surface_height'].values
+    wrapper(state)
+    buffer[:] = np.arange(100.)**2
+    state = get_height_state()
+    state['surface_height'] = DataArray(
+        buffer, dims=['x'], attrs={'units': 'm'})
+    diagnostics = wrapper(state)
+    assert diagnostic.call_count == 2
+    assert np.all(
+        diagnostics['surface_slope'].values == np.gradient(buffer))
+
+
+def test_memoization_wrapper_evicts_least_recently_used():
+    diagnostic = MockCountingDiagnostic()
+    wrapper = MemoizationWrapper(diagnostic, maxsize=2)
+    for value in [1., 2., 1., 3., 2.]:
+        wrapper(get_height_state(value))
+    # 2. is evicted by 3., since 1. was used more recently
+    assert diagnostic.call_count == 4
+    assert wrapper.hits == 1
+    assert wrapper.misses == 4
+
+
+def test_memoization_wrapper_max_memory():
+    diagnostic = MockCountingDiagnostic()
+    wrapper = MemoizationWrapper(diagnostic, max_memory=1000)
+    for value in [1., 2., 2., 1.]:
+        wrapper(get_height_state(value))
+    assert diagnostic.call_count == 3
+    assert wrapper.cache_info()['memory'] == 800
+    wrapper.clear_cache()
+    assert wrapper.cache_info()['currsize'] == 0
+    small_wrapper = MemoizationWrapper(MockCountingDiagnostic(), max_memory=10)
+    small_wrapper(get_height_state())
+    assert small_wrapper.cache_info()['currsize'] == 0
+
+
+def test_memoization_wrapper_rejects_invalid_arguments():
+    with pytest.raises(TypeError):
+        MemoizationWrapper(MockImplicit())
+    with pytest.raises(ValueError):
+        MemoizationWrapper(MockCountingDiagnostic(), fingerprint='hash')
+    with pytest.raises(ValueError):
+        MemoizationWrapper(MockCountingDiagnostic(), maxsize=-1)
+
+
 if __name__ == '__main__':
     pytest.main([__file__])